@@ -1,6 +1,8 @@
 # app.py (Polished UI, Python 3.9 compatible)
 import os
+import uuid
 import streamlit as st
+from markdown_it import MarkdownIt
 
 # ------------------------------
 # Page config (MUST be first Streamlit command)
@@ -13,84 +15,57 @@ st.set_page_config(
 )
 
 # Import backend after page config to avoid Streamlit command conflicts
-from backend import generate_response, MODEL_NAME, log_feedback
+from backend import (
+    agenerate_response,
+    agenerate_response_from_messages,
+    run_async,
+    stream_response_from_messages,
+    load_system_prompt,
+    trim_context,
+    summarize_messages,
+    MODEL_NAME,
+    CONTEXT_MAX_TURNS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_SUMMARY_MIN_MESSAGES,
+    ENABLE_CONTEXT_SUMMARY,
+    ENABLE_DYNAMIC_BATCHING,
+    log_feedback,
+)
+from ui.styles import get_css, get_header_badge
 
 # ------------------------------
 # Custom CSS (scoped)
 # ------------------------------
-CUSTOM_CSS = """
-<style>
-/* Layout & typography */
-.main .block-container { padding-top: 1.6rem; padding-bottom: 2rem; max-width: 820px; }
-h1, h2, h3 { letter-spacing: .2px; }
-
-/* Header badge */
-.header-wrap { display:flex; justify-content:space-between; align-items:center; }
-.header-badge {
-  display:inline-block; padding:4px 10px; border-radius:999px; font-size:.78rem;
-  background:linear-gradient(135deg, rgba(59,130,246,.12), rgba(16,185,129,.12));
-  color: var(--text-color, #444); border:1px solid rgba(0,0,0,0.06);
-}
-
-/* Chat bubbles */
-.chat-bubble {
-  padding:.9rem 1rem; border-radius:14px; margin-bottom:.6rem; line-height:1.55;
-  border:1px solid rgba(0,0,0,0.06); white-space:pre-wrap; word-wrap:break-word;
-}
-.chat-user {
-  background: rgba(59,130,246,0.08);
-  border-color: rgba(59,130,246,0.14);
-}
-.chat-assistant {
-  background: rgba(16,185,129,0.08);
-  border-color: rgba(16,185,129,0.14);
-}
-
-/* Avatars */
-.avatar {
-  width:28px; height:28px; border-radius:50%; display:inline-block; margin-right:8px;
-  vertical-align:middle; background-size:cover; background-position:center;
-  box-shadow: 0 0 0 1px rgba(0,0,0,.06) inset;
-}
-.user-avatar { background-image:url('https://avatars.githubusercontent.com/u/9919?s=40&v=4'); }
-.bot-avatar { background-image:url('https://raw.githubusercontent.com/simple-icons/simple-icons/develop/icons/googlecloud.svg'); background-color:#ffffff; }
-
-/* Message row */
-.msg-row { display:flex; gap:10px; align-items:flex-start; margin: 8px 0 14px 0; }
-.msg-content { flex:1; }
-
-/* Footer */
-.footer {
-  margin-top: 28px; padding-top: 12px; font-size: .85rem; opacity: .75;
-  border-top: 1px dashed rgba(0,0,0,0.1); text-align: center;
-}
-
-/* Code blocks within bubbles */
-.chat-bubble pre { border-radius:10px !important; border:1px solid rgba(0,0,0,0.08) !important; }
-
-/* Divider subtle */
-hr { opacity: .5; }
-</style>
-"""
-st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+# Elements not re-emitted are dropped on rerun, so the cached block is emitted every run
+st.markdown(get_css(), unsafe_allow_html=True)
 
 # ------------------------------
 # Session state defaults
 # ------------------------------
 if "history" not in st.session_state:
     st.session_state.history = []
+if "llm_messages" not in st.session_state:
+    # LiteLLM message list kept in sync with history; each turn only appends to it
+    st.session_state.llm_messages = [
+        {"role": "system", "content": load_system_prompt()}
+    ]
 if "temperature" not in st.session_state:
     st.session_state.temperature = 0.4
 if "api_base" not in st.session_state:
     st.session_state.api_base = (
         os.getenv("GOOGLE_GEMINI_BASE_URL") or "https://llm.lingarogroup.com"
     )
+if "context_turns" not in st.session_state:
+    st.session_state.context_turns = CONTEXT_MAX_TURNS
+if "context_tokens" not in st.session_state:
+    st.session_state.context_tokens = CONTEXT_MAX_TOKENS
+if "summary" not in st.session_state:
+    st.session_state.summary = None  # Summary of turns trimmed from the context window
+    st.session_state.summarized_count = 0
 if "feedback" not in st.session_state:
     st.session_state.feedback = {}  # Store feedback ratings by message index
 if "session_id" not in st.session_state:
-    import uuid
-
-    st.session_state.session_id = str(uuid.uuid4())  # Persistent session ID for tracing
+    st.session_state.session_id = uuid.uuid4().hex  # Persistent session ID for tracing
 if "user_id" not in st.session_state:
     # In production, this would come from authentication
     st.session_state.user_id = os.getenv("USER_ID", "anonymous")
@@ -101,14 +76,9 @@ if "user_id" not in st.session_state:
 col_left, col_right = st.columns([0.8, 0.2])
 with col_left:
     st.title("🤖 Gemini Chatbot V2")
-    st.caption(
-        "Model: **{}** • Endpoint: `{}`".format(MODEL_NAME, st.session_state.api_base)
-    )
+    st.caption(f"Model: **{MODEL_NAME}** • Endpoint: `{st.session_state.api_base}`")
 with col_right:
-    st.markdown(
-        '<div class="header-badge">Streamlit UI • LiteLLM • Gemini</div>',
-        unsafe_allow_html=True,
-    )
+    st.markdown(get_header_badge(), unsafe_allow_html=True)
 
 st.write("")  # small spacer
 
@@ -117,18 +87,24 @@ st.write("")  # small spacer
 # Sidebar (Settings, About, Connectivity)
 # ------------------------------
 def _connectivity_test():
+    # Always a live call (no completion cache), so a retry after fixing secrets
+    # never shows a stale result
     try:
-        ans = generate_response(
-            "Reply exactly: PONG",
-            [],
-            0.0,
-            user_id="system",
-            session_id="connectivity_test",
-            prompt_template="connectivity_test",
+        # Runs on the backend's shared loop, which owns the pooled async HTTP client
+        ans = run_async(
+            agenerate_response(
+                "Reply exactly: PONG",
+                [],
+                0.0,
+                user_id="system",
+                session_id="connectivity_test",
+                prompt_template="connectivity_test",
+                use_cache=False,
+            )
         )
         return ans.strip() if isinstance(ans, str) else str(ans)
     except Exception as e:
-        return "ERR: {}".format(e)
+        return f"ERR: {e}"
 
 
 with st.sidebar:
@@ -141,11 +117,29 @@ with st.sidebar:
         step=0.05,
         help="Lower = more deterministic. Higher = more creative.",
     )
+    st.session_state.context_turns = st.slider(
+        "Context window (turns)",
+        min_value=1,
+        max_value=30,
+        value=st.session_state.context_turns,
+        help="Only the most recent turns are sent to the model; older ones are summarized.",
+    )
+    st.session_state.context_tokens = st.slider(
+        "Context token cap",
+        min_value=1000,
+        max_value=32000,
+        value=st.session_state.context_tokens,
+        step=500,
+        help="Upper bound on conversation tokens sent per request.",
+    )
 
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🧹 Clear chat", use_container_width=True):
             st.session_state.history = []
+            st.session_state.llm_messages = st.session_state.llm_messages[:1]
+            st.session_state.summary = None
+            st.session_state.summarized_count = 0
             st.toast("Chat cleared", icon="🧽")
     with col2:
         if st.button("📡 Connectivity test", use_container_width=True):
@@ -169,72 +163,82 @@ with st.sidebar:
 # ------------------------------
 # Chat history renderer (avatars + bubbles, markdown)
 # ------------------------------
+# Raw HTML in messages is escaped, matching st.markdown's default (unsafe_allow_html=False)
+_MD = MarkdownIt("commonmark", {"html": False}).enable("table")
+
+
+# Bubble HTML per role, built once at import instead of formatted per message
+_BUBBLE_OPEN = {
+    "user": '<div class="msg-row"><span class="avatar user-avatar"></span>'
+    '<div class="msg-content"><div class="chat-bubble chat-user">',
+    "assistant": '<div class="msg-row"><span class="avatar bot-avatar"></span>'
+    '<div class="msg-content"><div class="chat-bubble chat-assistant">',
+}
+_BUBBLE_CLOSE = "</div></div></div>"
+
+
+_RATINGS = {"👍": "positive", "👎": "negative"}
+
+
+def _submit_feedback(msg_index):
+    # Runs before the rerun, so the updated rating renders in the same pass
+    rating = _RATINGS.get(st.session_state.get(f"fb_choice_{msg_index}"))
+    if rating is None or st.session_state.feedback.get(msg_index) == rating:
+        return
+    st.session_state.feedback[msg_index] = rating
+    # Get request_id from history if available
+    request_id = st.session_state.history[msg_index].get("request_id", "unknown")
+    log_feedback(request_id, msg_index, rating)
+    if rating == "positive":
+        st.toast("Thanks for your feedback! 👍", icon="✅")
+    else:
+        st.toast("Thanks for your feedback! We'll improve.", icon="📝")
+
+
 def render_message(role, content, msg_index=None):
-    if role not in ("user", "assistant"):
+    bubble_open = _BUBBLE_OPEN.get(role)
+    if bubble_open is None:
         return
-    avatar_class = "user-avatar" if role == "user" else "bot-avatar"
-    bubble_class = "chat-user" if role == "user" else "chat-assistant"
-
-    # Wrap markdown inside our styled bubble
-    st.markdown(
-        """
-        <div class="msg-row">
-            <span class="avatar {avatar}"></span>
-            <div class="msg-content">
-                <div class="chat-bubble {bubble}">
-        """.format(avatar=avatar_class, bubble=bubble_class),
-        unsafe_allow_html=True,
-    )
-    # Render markdown safely inside
-    st.markdown(content if isinstance(content, str) else str(content))
-    st.markdown(
-        """
-                </div>
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
 
-    # Add feedback buttons for assistant messages
-    if role == "assistant" and msg_index is not None:
-        col1, col2, col3 = st.columns([0.05, 0.05, 0.9])
+    # One component per message: markdown rendered to HTML inside the styled bubble
+    body_html = _MD.render(content if isinstance(content, str) else str(content))
+    # Keep the HTML on one line: a blank line would end the HTML block in st.markdown's
+    # parser, and the character reference still renders as a newline inside <pre>
+    body_html = body_html.replace("\n", "&#10;")
+    st.markdown(bubble_open + body_html + _BUBBLE_CLOSE, unsafe_allow_html=True)
 
-        feedback_key = f"feedback_{msg_index}"
+    # Feedback form: changing the choice doesn't rerun; only the submit does
+    if role == "assistant" and msg_index is not None:
         current_feedback = st.session_state.feedback.get(msg_index, None)
-
-        with col1:
-            if st.button(
-                "👍",
-                key=f"thumbs_up_{msg_index}",
-                disabled=(current_feedback == "positive"),
-                help="Helpful response",
-            ):
-                st.session_state.feedback[msg_index] = "positive"
-                # Get request_id from history if available
-                request_id = st.session_state.history[msg_index].get(
-                    "request_id", "unknown"
+        with st.form(f"fb_{msg_index}", border=False):
+            col1, col2 = st.columns([0.25, 0.75])
+            with col1:
+                st.radio(
+                    "Rate this response",
+                    list(_RATINGS),
+                    index=(
+                        list(_RATINGS.values()).index(current_feedback)
+                        if current_feedback
+                        else None
+                    ),
+                    key=f"fb_choice_{msg_index}",
+                    horizontal=True,
+                    label_visibility="collapsed",
                 )
-                log_feedback(request_id, msg_index, "positive")
-                st.toast("Thanks for your feedback! 👍", icon="✅")
-
-        with col2:
-            if st.button(
-                "👎",
-                key=f"thumbs_down_{msg_index}",
-                disabled=(current_feedback == "negative"),
-                help="Unhelpful response",
-            ):
-                st.session_state.feedback[msg_index] = "negative"
-                request_id = st.session_state.history[msg_index].get(
-                    "request_id", "unknown"
+            with col2:
+                st.form_submit_button(
+                    "Send feedback",
+                    on_click=_submit_feedback,
+                    args=(msg_index,),
                 )
-                log_feedback(request_id, msg_index, "negative")
-                st.toast("Thanks for your feedback! We'll improve.", icon="📝")
 
 
-# Render past messages
-for idx, msg in enumerate(st.session_state.history):
+# Render past messages: recent ones eagerly, older ones collapsed so they
+# aren't re-rendered on every rerun of a long chat
+RECENT_MESSAGES = int(os.getenv("RECENT_MESSAGES", "30"))
+
+
+def _render_history_item(idx, msg):
     try:
         render_message(
             msg.get("role"),
@@ -245,36 +249,88 @@ for idx, msg in enumerate(st.session_state.history):
         # Fallback (should rarely happen)
         st.write(msg)
 
+
+history = st.session_state.history
+split = max(0, len(history) - RECENT_MESSAGES)
+# A toggle (unlike st.expander) skips emitting the older bubbles entirely while off
+if split and st.toggle(f"Show {split} earlier messages", key="show_earlier"):
+    for idx in range(split):
+        _render_history_item(idx, history[idx])
+for idx in range(split, len(history)):
+    _render_history_item(idx, history[idx])
+
 # ------------------------------
 # Chat input & response
 # ------------------------------
 user_input = st.chat_input("Type your message…")
 
 if user_input:
-    # Append & render user turn
+    # Append & render user turn (only role/str-content turns enter history; the backend
+    # splices it into the prompt without re-validating)
     st.session_state.history.append({"role": "user", "content": user_input})
+    st.session_state.llm_messages.append({"role": "user", "content": user_input})
     render_message("user", user_input)
 
-    # Assistant response
-    with st.spinner("Thinking…"):
-        import uuid
+    # Bound the context: sliding window plus a cached summary of older turns
+    context, dropped = trim_context(
+        st.session_state.llm_messages,
+        st.session_state.context_turns,
+        st.session_state.context_tokens,
+        st.session_state.summary,
+    )
+    pending = dropped[st.session_state.summarized_count :]
+    if ENABLE_CONTEXT_SUMMARY and len(pending) >= CONTEXT_SUMMARY_MIN_MESSAGES:
+        summary = summarize_messages(
+            pending, st.session_state.summary, st.session_state.session_id
+        )
+        if summary:
+            st.session_state.summary = summary
+            st.session_state.summarized_count = len(dropped)
+            context, _ = trim_context(
+                st.session_state.llm_messages,
+                st.session_state.context_turns,
+                st.session_state.context_tokens,
+                summary,
+            )
 
-        request_id = str(uuid.uuid4())
-        try:
-            response_text = generate_response(
-                user_input,
-                st.session_state.history,  # contains the new user message
+    # Assistant response (streamed into a placeholder as tokens arrive)
+    request_id = uuid.uuid4().hex
+    placeholder = st.empty()
+    placeholder.markdown("_Thinking…_")
+    parts = []
+    try:
+        if ENABLE_DYNAMIC_BATCHING:
+            # Whole responses, so concurrent sessions can share a batch on the backend loop
+            parts.append(
+                run_async(
+                    agenerate_response_from_messages(
+                        context,
+                        st.session_state.temperature,
+                        user_id=st.session_state.user_id,
+                        session_id=st.session_state.session_id,
+                        prompt_template="default",
+                    )
+                )
+                or ""
+            )
+        else:
+            for delta in stream_response_from_messages(
+                context,  # ends with the new user message
                 st.session_state.temperature,
                 user_id=st.session_state.user_id,
                 session_id=st.session_state.session_id,
                 prompt_template="default",
+            ):
+                parts.append(delta)
+                placeholder.markdown("".join(parts) + "▌")
+        response_text = "".join(parts)
+        if not response_text:
+            response_text = (
+                "⚠️ Sorry, I couldn't generate a response. Please try again."
             )
-            if not response_text or not isinstance(response_text, str):
-                response_text = (
-                    "⚠️ Sorry, I couldn't generate a response. Please try again."
-                )
-        except Exception as e:
-            response_text = "⚠️ Error: {}".format(e)
+    except Exception as e:
+        response_text = f"⚠️ Error: {e}"
+    placeholder.empty()
 
     # Render & store assistant message with request_id for feedback correlation
     msg_index = len(st.session_state.history)
@@ -282,6 +338,9 @@ if user_input:
     st.session_state.history.append(
         {"role": "assistant", "content": response_text, "request_id": request_id}
     )
+    st.session_state.llm_messages.append(
+        {"role": "assistant", "content": response_text}
+    )
 
 # ------------------------------
 # Footer
@@ -1,14 +1,24 @@
 import os
 import json
+import asyncio
+import atexit
+import hashlib
 import logging
+import queue
+import shutil
+import threading
+import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
+import httpx
 import litellm
-from litellm import completion
-from typing import Optional, Dict, Any
+from litellm import completion, acompletion, batch_completion
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, List, Tuple
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -16,8 +26,39 @@ from tenacity import (
     retry_if_exception_type,
     before_sleep_log,
 )
-from pybreaker import CircuitBreaker
-from ratelimit import limits, sleep_and_retry
+from pybreaker import (
+    STATE_CLOSED,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitBreakerError,
+    CircuitMemoryStorage,
+)
+
+try:
+    from litellm.exceptions import (
+        RateLimitError,
+        AuthenticationError,
+        ServiceUnavailableError,
+        Timeout as LiteLLMTimeout,
+        BadRequestError,
+    )
+except ImportError:  # older LiteLLM releases without the exceptions module
+
+    class RateLimitError(Exception):
+        pass
+
+    class AuthenticationError(Exception):
+        pass
+
+    class ServiceUnavailableError(Exception):
+        pass
+
+    class LiteLLMTimeout(Exception):
+        pass
+
+    class BadRequestError(Exception):
+        pass
+
 
 # Check if running in Streamlit context
 try:
@@ -30,13 +71,34 @@ except ImportError:
 # Langfuse (using LiteLLM's native callback for Langfuse 3.x)
 try:
     from langfuse import Langfuse
+    from langfuse.model import ModelUsage
 
     LANGFUSE_AVAILABLE = True
 except ImportError:
     LANGFUSE_AVAILABLE = False
     Langfuse = None
+    ModelUsage = None
+
+# Faster JSON serialization for metrics and log lines (optional)
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
 
-load_dotenv()
+# HTTP/2 for the shared LLM clients needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# .env is for local development; deployments (st.secrets / real env) can skip the lookup
+if os.getenv("SKIP_DOTENV") != "1" and Path(".env").exists():
+    load_dotenv(dotenv_path=".env", override=False)
 
 # ====== Logging Setup with Rotation ======
 # Create logs directory
@@ -64,28 +126,96 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson when installed."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
 # ====== PII Redaction Utility ======
 import re
 
+# Compiled once at import; redact_pii runs on every logged response.
+# One alternation so the text is scanned in a single pass; the group that
+# matched selects the replacement. Tokens are handled by _redact_tokens below.
+_PII_RE = re.compile(
+    r"(?P<email>\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)"  # Email addresses
+    r"|(?P<phone1>\b\d{3}[-.]?\d{3}[-.]?\d{4}\b)"  # Phone numbers (various formats)
+    r"|(?P<phone2>\b\(\d{3}\)\s*\d{3}[-.]?\d{4}\b)"
+    r"|(?P<ssn>\b\d{3}-\d{2}-\d{4}\b)"  # SSN (US format)
+    r"|(?P<cc>\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b)"  # Credit card numbers (basic pattern)
+)
+_PII_SUB = {
+    "email": "[EMAIL_REDACTED]",
+    "phone1": "[PHONE_REDACTED]",
+    "phone2": "[PHONE_REDACTED]",
+    "ssn": "[SSN_REDACTED]",
+    "cc": "[CC_REDACTED]",
+}
+_DIGIT_RE = re.compile(r"\d")
+
+# API keys and tokens: fixed prefixes, located with str.find rather than a regex
+_TOKEN_PREFIXES = ("sk-", "pk-", "token-")
+_TOKEN_CHARS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+)
+_TOKEN_MIN_LEN = 20
+
+# Provider keys in error messages (proxy keys may contain '-' and '_')
+_SK_MASK_RE = re.compile(r"\bsk-[A-Za-z0-9_-]{17,}")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def _redact_tokens(text: str) -> str:
+    """Replace prefix + 20 or more alphanumerics (word-bounded) with [TOKEN_REDACTED]."""
+    spans = []
+    n = len(text)
+    for prefix in _TOKEN_PREFIXES:
+        start = text.find(prefix)
+        while start != -1:
+            if start == 0 or not _is_word_char(text[start - 1]):
+                body = end = start + len(prefix)
+                while end < n and text[end] in _TOKEN_CHARS:
+                    end += 1
+                if end - body >= _TOKEN_MIN_LEN and (
+                    end == n or not _is_word_char(text[end])
+                ):
+                    spans.append((start, end))
+            start = text.find(prefix, start + 1)
+
+    if not spans:
+        return text
+    parts = []
+    pos = 0
+    for start, end in sorted(spans):
+        if start < pos:
+            continue
+        parts.append(text[pos:start])
+        parts.append("[TOKEN_REDACTED]")
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _pii_replacement(match: "re.Match") -> str:
+    return _PII_SUB[match.lastgroup]
+
 
 def redact_pii(text: str, redact_enabled: bool = True) -> str:
     """Redact personally identifiable information from text for privacy."""
     if not redact_enabled or not text:
         return text
 
-    # Email addresses
-    text = re.sub(
-        r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b", "[EMAIL_REDACTED]", text
-    )
-    # Phone numbers (various formats)
-    text = re.sub(r"\b\d{3}[-.]?\d{3}[-.]?\d{4}\b", "[PHONE_REDACTED]", text)
-    text = re.sub(r"\b\(\d{3}\)\s*\d{3}[-.]?\d{4}\b", "[PHONE_REDACTED]", text)
-    # SSN (US format)
-    text = re.sub(r"\b\d{3}-\d{2}-\d{4}\b", "[SSN_REDACTED]", text)
-    # Credit card numbers (basic pattern)
-    text = re.sub(r"\b\d{4}[- ]?\d{4}[- ]?\d{4}[- ]?\d{4}\b", "[CC_REDACTED]", text)
-    # API keys and tokens
-    text = re.sub(r"\b(sk-|pk-|token-)[A-Za-z0-9]{20,}\b", "[TOKEN_REDACTED]", text)
+    # Cheap presence checks first: most responses contain no PII at all
+    if "@" in text or _DIGIT_RE.search(text) is not None:
+        text = _PII_RE.sub(_pii_replacement, text)
+    if "-" in text:
+        text = _redact_tokens(text)
 
     return text
 
@@ -105,20 +235,30 @@ litellm.drop_params = True  # Drop sensitive params from logs
 
 # PII redaction configuration
 ENABLE_PII_REDACTION = os.getenv("ENABLE_PII_REDACTION", "true").lower() == "true"
+# Bound once: with redaction off, logged previews pass through without a call into redact_pii
+_redact = redact_pii if ENABLE_PII_REDACTION else (lambda s: s)
 
 
 # Add custom callbacks for structured logging
+def _elapsed_seconds(start_time, end_time) -> float:
+    """Seconds between two LiteLLM callback timestamps (datetimes or epoch floats)."""
+    delta = end_time - start_time
+    return delta.total_seconds() if hasattr(delta, "total_seconds") else float(delta)
+
+
 def litellm_success_logger(kwargs, response_obj, start_time, end_time):
     """Log successful LiteLLM requests without sensitive data"""
-    duration = end_time - start_time
+    # Skip building, redacting and serializing the record when INFO is filtered out
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    duration = _elapsed_seconds(start_time, end_time)
     model = kwargs.get("model", "unknown")
     usage = getattr(response_obj, "usage", None)
 
     # Extract and redact response content for logging
     response_content = ""
     if hasattr(response_obj, "choices") and len(response_obj.choices) > 0:
-        response_content = response_obj.choices[0].message.content[:100]
-        response_content = redact_pii(response_content, ENABLE_PII_REDACTION)
+        response_content = _redact(response_obj.choices[0].message.content[:100])
 
     log_data = {
         "event": "litellm_success",
@@ -132,22 +272,20 @@ def litellm_success_logger(kwargs, response_obj, start_time, end_time):
         log_data["completion_tokens"] = getattr(usage, "completion_tokens", 0)
         log_data["total_tokens"] = getattr(usage, "total_tokens", 0)
 
-    logger.info(f"LiteLLM request successful: {json.dumps(log_data)}")
+    logger.info(f"LiteLLM request successful: {_dumps(log_data).decode()}")
 
 
 def litellm_failure_logger(kwargs, response_obj, start_time, end_time):
     """Log failed LiteLLM requests without sensitive data"""
-    duration = end_time - start_time
+    if not logger.isEnabledFor(logging.ERROR):
+        return
+    duration = _elapsed_seconds(start_time, end_time)
     model = kwargs.get("model", "unknown")
     error_type = type(response_obj).__name__ if response_obj else "UnknownError"
     error_message = str(response_obj) if response_obj else "Unknown error"
 
-    # Mask any API keys in error messages
-    if "sk-" in error_message:
-        error_message = error_message.replace(
-            error_message[error_message.find("sk-") : error_message.find("sk-") + 20],
-            "sk-***REDACTED***",
-        )
+    # Mask any API keys in error messages (every occurrence, one pass)
+    error_message = _SK_MASK_RE.sub("sk-***REDACTED***", error_message)
 
     log_data = {
         "event": "litellm_failure",
@@ -157,7 +295,7 @@ def litellm_failure_logger(kwargs, response_obj, start_time, end_time):
         "error_message": error_message[:200],  # Truncate long errors
     }
 
-    logger.error(f"LiteLLM request failed: {json.dumps(log_data)}")
+    logger.error(f"LiteLLM request failed: {_dumps(log_data).decode()}")
 
 
 # ====== Metrics Storage ======
@@ -172,6 +310,10 @@ tracer = None
 
 
 # ====== Circuit Breaker ======
+class RateLimitExceededError(Exception):
+    """Raised when the shared request rate limit has no slot available."""
+
+
 # Circuit breaker listener class
 class CircuitBreakerListener:
     def before_call(self, cb, func, *args, **kwargs):
@@ -190,15 +332,52 @@ class CircuitBreakerListener:
             logger.info("Circuit breaker closed - service recovered")
 
 
+# Held here so the async path can read when the breaker opened
+_breaker_storage = CircuitMemoryStorage(STATE_CLOSED)
+
 # Circuit breaker configuration: 5 failures in 60s = open for 30s
 circuit_breaker = CircuitBreaker(
     fail_max=int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5")),
     reset_timeout=int(os.getenv("CIRCUIT_BREAKER_TIMEOUT", "30")),
+    # The local rate limit is not an upstream failure
+    exclude=[RateLimitExceededError],
     name="LLM_API_Breaker",
     listeners=[CircuitBreakerListener()],
+    state_storage=_breaker_storage,
 )
 
 
+def _breaker_admit() -> None:
+    """Fail fast while the breaker is open; once reset_timeout passes, admit a trial."""
+    if circuit_breaker.current_state != STATE_OPEN:
+        return
+    opened_at = _breaker_storage.opened_at
+    reset = timedelta(seconds=circuit_breaker.reset_timeout)
+    if opened_at and datetime.utcnow() < opened_at + reset:
+        raise CircuitBreakerError("Timeout not elapsed yet, circuit breaker still open")
+    circuit_breaker.half_open()
+
+
+def _breaker_record(exc: Optional[BaseException] = None) -> None:
+    """
+    Report an awaited call's outcome to the breaker.
+
+    Re-raises exc, or CircuitBreakerError once the failure trips the breaker.
+    A success that lands after another caller opened the breaker is returned
+    to the caller as usual.
+    """
+
+    def outcome() -> None:
+        if exc is not None:
+            raise exc
+
+    try:
+        circuit_breaker.call(outcome)
+    except CircuitBreakerError:
+        if exc is not None:
+            raise
+
+
 # def _get_secret(key: str, default: str | None = None) -> str | None:
 def _get_secret(key: str, default: Optional[str] = None) -> Optional[str]:
     """
@@ -238,8 +417,26 @@ MODEL_NAME = _get_secret("LLM_MODEL_NAME")
 if not MODEL_NAME:
     MODEL_NAME = f"{LLM_PROVIDER}/{BASE_MODEL_ID}"
 
+# Per-process constants read once instead of on every request
+REQUEST_TIMEOUT = int(_get_secret("REQUEST_TIMEOUT") or "30")
+ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+
+# Context window sent to the model: last N user/assistant turns, capped by tokens
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "8"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))
+# Summarize trimmed turns once at least this many messages have fallen out of the window
+CONTEXT_SUMMARY_MIN_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_MIN_MESSAGES", "4"))
+ENABLE_CONTEXT_SUMMARY = os.getenv("ENABLE_CONTEXT_SUMMARY", "true").lower() == "true"
 
+# Temperature-0 completions are deterministic; reuse them for this many seconds (0 disables)
+COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", "60"))
+# Most cached completions kept at once; least recently used entries are evicted first
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "256"))
+
+
+@lru_cache(maxsize=1)
 def load_system_prompt():
+    """Read the system prompt once; the file is static for the process lifetime."""
     try:
         with open("prompts/system_prompt.txt", "r", encoding="utf-8") as f:
             return f.read()
@@ -277,19 +474,21 @@ def _validate_env():
     return problems
 
 
+# Gemini Flash pricing per token (as of Feb 2026)
+_INPUT_RATE = 0.075 / 1_000_000
+_OUTPUT_RATE = 0.30 / 1_000_000
+
+
 def _calculate_cost(usage: Dict[str, int]) -> float:
     """
     Calculate cost based on Gemini Flash pricing (as of Feb 2026).
     Input: $0.075 per 1M tokens
     Output: $0.30 per 1M tokens
     """
-    prompt_tokens = usage.get("prompt_tokens", 0)
-    completion_tokens = usage.get("completion_tokens", 0)
-
-    input_cost = (prompt_tokens / 1_000_000) * 0.075
-    output_cost = (completion_tokens / 1_000_000) * 0.30
-
-    return input_cost + output_cost
+    return (
+        usage.get("prompt_tokens", 0) * _INPUT_RATE
+        + usage.get("completion_tokens", 0) * _OUTPUT_RATE
+    )
 
 
 def _get_trace_metadata(
@@ -303,7 +502,7 @@ def _get_trace_metadata(
         "request_id": request_id,
         "prompt_template": prompt_template,
         "service": "streamlit-chatbot",
-        "environment": os.getenv("ENVIRONMENT", "development"),
+        "environment": ENVIRONMENT,
     }
 
     # Add user/session IDs if provided
@@ -318,34 +517,151 @@ def _get_trace_metadata(
     return metadata
 
 
-def _log_metrics(metrics: Dict[str, Any]) -> None:
-    """Log metrics to JSONL file for analysis."""
+# ====== Background JSONL Writer ======
+# Request threads only enqueue; a daemon thread appends records in batches so
+# metrics/feedback disk I/O stays off the request path.
+METRICS_QUEUE_SIZE = int(os.getenv("METRICS_QUEUE_SIZE", "10000"))
+METRICS_BATCH_SIZE = 128
+
+# Items are (path, record, kind) where kind names the record for error messages
+_metrics_queue: "queue.Queue[Tuple[Path, Dict[str, Any], str]]" = queue.Queue(
+    maxsize=METRICS_QUEUE_SIZE
+)
+
+
+# Rotate a JSONL file into its dated shard (<stem>-YYYY-MM-DD.jsonl, which the
+# dashboard reads alongside the live file) past this size (0 disables rotation)
+METRICS_MAX_BYTES = int(os.getenv("METRICS_MAX_BYTES", "0"))
+
+# Append handles kept open across batches, keyed by path; guarded by _handles_lock
+_handles: Dict[Path, Any] = {}
+_handles_lock = threading.Lock()
+
+
+def _get_handle(path: Path):
+    """Return the resident append handle for path, rotating it if oversized."""
+    fh = _handles.get(path)
+    if (
+        fh is not None
+        and METRICS_MAX_BYTES
+        and os.fstat(fh.fileno()).st_size >= METRICS_MAX_BYTES
+    ):
+        fh.close()
+        del _handles[path]
+        _rotate(Path(path))
+        fh = None
+    if fh is None:
+        fh = open(path, "ab", buffering=64 * 1024)
+        _handles[path] = fh
+    return fh
+
+
+def _rotate(path: Path) -> None:
+    """Move path's rows onto today's (UTC) shard, appending if it already exists."""
+    shard = path.with_name(f"{path.stem}-{datetime.utcnow():%Y-%m-%d}{path.suffix}")
+    if shard.exists():
+        with open(path, "rb") as src, open(shard, "ab") as dst:
+            shutil.copyfileobj(src, dst)
+        path.unlink()
+    else:
+        path.replace(shard)
+
+
+def _close_handles() -> None:
+    """Close all resident handles (they reopen lazily on the next write)."""
+    with _handles_lock:
+        for fh in _handles.values():
+            try:
+                fh.close()
+            except Exception as e:
+                logger.warning(f"Failed to close metrics file: {e}")
+        _handles.clear()
+
+
+def _write_batch(batch: list) -> None:
+    """Append a batch of records, one write + flush per target file."""
+    lines_by_path: Dict[Tuple[Path, str], List[bytes]] = {}
+    for path, record, kind in batch:
+        lines_by_path.setdefault((path, kind), []).append(_dumps(record) + b"\n")
+    with _handles_lock:
+        for (path, kind), lines in lines_by_path.items():
+            try:
+                fh = _get_handle(path)
+                fh.write(b"".join(lines))
+                # Flush per batch so readers (dashboard, alerts) see records promptly
+                fh.flush()
+            except Exception as e:
+                logger.error(f"Failed to log {kind}: {e}")
+                stale = _handles.pop(path, None)
+                if stale is not None:
+                    try:
+                        stale.close()
+                    except Exception:
+                        pass
+
+
+def _metrics_writer() -> None:
+    """Drain the queue forever, batching whatever has accumulated."""
+    while True:
+        batch = [_metrics_queue.get()]
+        while len(batch) < METRICS_BATCH_SIZE:
+            try:
+                batch.append(_metrics_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        finally:
+            for _ in batch:
+                _metrics_queue.task_done()
+
+
+threading.Thread(target=_metrics_writer, name="metrics-writer", daemon=True).start()
+
+
+def flush_metrics() -> None:
+    """Block until every queued metrics/feedback record has been written."""
+    _metrics_queue.join()
+
+
+def close_metrics_files() -> None:
+    """Write out queued records, then close the resident file handles."""
+    flush_metrics()
+    _close_handles()
+
+
+# Write out anything still queued and close the files before the interpreter exits
+atexit.register(close_metrics_files)
+
+
+def _enqueue_record(path: Path, record: Dict[str, Any], kind: str) -> bool:
+    """Queue a record for the writer thread; drops it if the queue is full."""
     try:
-        with open(METRICS_FILE, "a", encoding="utf-8") as f:
-            json.dump(metrics, f)
-            f.write("\n")
-    except Exception as e:
-        logger.error(f"Failed to log metrics: {e}")
+        _metrics_queue.put_nowait((path, record, kind))
+        return True
+    except queue.Full:
+        logger.warning(f"Metrics queue full; dropping {kind} record")
+        return False
+
+
+def _log_metrics(metrics: Dict[str, Any]) -> None:
+    """Log metrics to JSONL file for analysis (written by the background writer)."""
+    _enqueue_record(METRICS_FILE, metrics, "metrics")
 
 
 def log_feedback(
     request_id: str, message_index: int, rating: str, comment: str = ""
 ) -> None:
-    """Log user feedback for a specific message."""
-    try:
-        feedback = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "request_id": request_id,
-            "message_index": message_index,
-            "rating": rating,
-            "comment": comment,
-        }
-        with open(FEEDBACK_FILE, "a", encoding="utf-8") as f:
-            json.dump(feedback, f)
-            f.write("\n")
+    """Log user feedback for a specific message (non-blocking)."""
+    feedback = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "request_id": request_id,
+        "message_index": message_index,
+        "rating": rating,
+        "comment": comment,
+    }
+    if _enqueue_record(FEEDBACK_FILE, feedback, "feedback"):
         logger.info(f"Feedback logged: {rating} for request {request_id}")
-    except Exception as e:
-        logger.error(f"Failed to log feedback: {e}")
 
 
 # Configure Langfuse - Direct SDK integration (LiteLLM callback incompatible)
@@ -367,6 +683,8 @@ try:
                     secret_key=langfuse_secret_key,
                     host=langfuse_host,
                 )
+                # Traces are sent by the SDK's background batcher; drain it on exit
+                atexit.register(langfuse_client.flush)
                 logger.info(
                     f"Langfuse tracing enabled via direct SDK (host: {langfuse_host})"
                 )
@@ -383,19 +701,108 @@ except Exception as e:
     logger.warning(f"Langfuse setup failed: {e}")
 
 
-@retry(
+# ====== Shared HTTP Clients ======
+# One keep-alive pool for all LiteLLM calls, so turns reuse TCP/TLS connections
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "32")),
+    keepalive_expiry=30,
+)
+_HTTP_CLIENT = httpx.Client(
+    http2=HTTP2_AVAILABLE, timeout=httpx.Timeout(60.0), limits=_HTTP_LIMITS
+)
+_ASYNC_CLIENT = httpx.AsyncClient(
+    http2=HTTP2_AVAILABLE, timeout=httpx.Timeout(60.0), limits=_HTTP_LIMITS
+)
+litellm.client_session = _HTTP_CLIENT
+litellm.aclient_session = _ASYNC_CLIENT
+
+# The async pool is bound to the event loop that first uses it, so async calls
+# run on one long-lived background loop instead of a fresh asyncio.run() loop
+_ASYNC_LOOP = asyncio.new_event_loop()
+threading.Thread(
+    target=_ASYNC_LOOP.run_forever, name="llm-async-loop", daemon=True
+).start()
+
+
+def run_async(coro):
+    """Run a coroutine on the shared background loop and block until it completes."""
+    return asyncio.run_coroutine_threadsafe(coro, _ASYNC_LOOP).result()
+
+
+async def _shutdown_async_loop() -> None:
+    """Close the async client and cancel background tasks still pending on the loop."""
+    await _ASYNC_CLIENT.aclose()
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _close_http_clients() -> None:
+    """Close the shared HTTP clients and stop the background loop at exit."""
+    _HTTP_CLIENT.close()
+    try:
+        asyncio.run_coroutine_threadsafe(_shutdown_async_loop(), _ASYNC_LOOP).result(
+            timeout=5
+        )
+    except Exception as e:
+        logger.warning(f"Failed to close async HTTP client: {e}")
+    _ASYNC_LOOP.call_soon_threadsafe(_ASYNC_LOOP.stop)
+
+
+atexit.register(_close_http_clients)
+
+
+# Retry policy shared by the sync and async LLM call paths
+_llm_retry = retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=2, max=10),
     retry=retry_if_exception_type((Exception,)),
     before_sleep=before_sleep_log(logger, logging.WARNING),
     reraise=True,
 )
-@circuit_breaker
-@sleep_and_retry
-@limits(
+
+
+class _TokenBucket:
+    """Token bucket refilled from a single monotonic timestamp; O(1) per admission."""
+
+    __slots__ = ("cap", "tok", "ts", "rate", "lock")
+
+    def __init__(self, calls: int, period: float):
+        self.cap = float(calls)
+        self.tok = float(calls)
+        self.ts = time.monotonic()
+        self.rate = calls / period
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tok = min(self.cap, self.tok + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tok >= 1:
+                self.tok -= 1
+                return True
+            return False
+
+
+_BUCKET = _TokenBucket(
     calls=int(os.getenv("RATE_LIMIT_CALLS", "60")),
     period=int(os.getenv("RATE_LIMIT_PERIOD", "60")),
 )
+
+
+def _acquire_rate_limit() -> None:
+    """Take a slot from the shared request rate limit or raise RateLimitExceededError.
+
+    Never sleeps: the retry layer backs off with exponential waits instead.
+    """
+    if not _BUCKET.take():
+        raise RateLimitExceededError("Local request rate limit reached")
+
+
+@_llm_retry
+@circuit_breaker
 def _call_llm_with_retry(
     model: str,
     api_key: str,
@@ -403,6 +810,7 @@ def _call_llm_with_retry(
     messages: list,
     temperature: float,
     timeout: int,
+    stream: bool = False,
 ) -> dict:
     """
     Call LiteLLM with comprehensive resilience patterns:
@@ -410,19 +818,565 @@ def _call_llm_with_retry(
     - Circuit breaker (opens after 5 failures for 30s)
     - Retry logic with exponential backoff (3 attempts)
     - Timeout protection
+
+    With stream=True the stream wrapper is returned as soon as the request is
+    accepted; errors raised while iterating it are not retried.
     """
+    _acquire_rate_limit()
     return completion(
         model=model,
         api_key=api_key,
         api_base=api_base,
         messages=messages,
         temperature=temperature,
-        stream=False,
+        stream=stream,
+        stream_options={"include_usage": True} if stream else None,
         max_tokens=1024,
         timeout=timeout,
     )
 
 
+async def _acompletion_guarded(**kwargs):
+    """Await acompletion once the shared rate limit grants a slot."""
+    _acquire_rate_limit()
+    return await acompletion(**kwargs)
+
+
+@_llm_retry
+async def _acall_llm_with_retry(
+    model: str,
+    api_key: str,
+    api_base: str,
+    messages: list,
+    temperature: float,
+    timeout: int,
+    stream: bool = False,
+):
+    """
+    Async counterpart of _call_llm_with_retry built on litellm.acompletion.
+    Shares the same rate limit, circuit breaker and retry policy, but waits
+    on the network without blocking the calling thread.
+
+    The breaker is consulted before and updated after the await rather than
+    through call_async, which holds the breaker's threading lock for the whole
+    request and would stall sync callers on other threads.
+    """
+    _breaker_admit()
+    try:
+        response = await _acompletion_guarded(
+            model=model,
+            api_key=api_key,
+            api_base=api_base,
+            messages=messages,
+            temperature=temperature,
+            stream=stream,
+            stream_options={"include_usage": True} if stream else None,
+            max_tokens=1024,
+            timeout=timeout,
+        )
+    except Exception as e:
+        _breaker_record(e)
+        raise
+    _breaker_record()
+    return response
+
+
+@_llm_retry
+@circuit_breaker
+def _call_llm_batch_with_retry(
+    model: str,
+    api_key: str,
+    api_base: str,
+    batch_messages: List[list],
+    temperature: float,
+    timeout: int,
+) -> list:
+    """
+    Send several prompts as one guarded request: one rate-limit slot, one
+    circuit-breaker call and one retry scope for the whole batch.
+
+    Identical prompts become a single completion with n=len(batch_messages);
+    distinct prompts fan out through litellm.batch_completion. Returns one
+    entry per prompt holding (response, choice index) or the exception raised
+    for that prompt. The batch only raises when every prompt failed.
+    """
+    _acquire_rate_limit()
+    if all(m == batch_messages[0] for m in batch_messages):
+        resp = completion(
+            model=model,
+            api_key=api_key,
+            api_base=api_base,
+            messages=batch_messages[0],
+            temperature=temperature,
+            n=len(batch_messages),
+            max_tokens=1024,
+            timeout=timeout,
+        )
+        return [(resp, i) for i in range(len(batch_messages))]
+
+    results = batch_completion(
+        model=model,
+        api_key=api_key,
+        api_base=api_base,
+        messages=batch_messages,
+        temperature=temperature,
+        max_tokens=1024,
+        timeout=timeout,
+    )
+    if all(isinstance(r, Exception) for r in results):
+        raise results[0]
+    return [r if isinstance(r, Exception) else (r, 0) for r in results]
+
+
+# ====== Dynamic Batching ======
+# Coalesce completions that arrive close together (e.g. several sessions in one process)
+ENABLE_DYNAMIC_BATCHING = (
+    os.getenv("ENABLE_DYNAMIC_BATCHING", "false").lower() == "true"
+)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_TIMEOUT_MS = int(os.getenv("BATCH_TIMEOUT_MS", "20"))
+
+
+class DynamicBatcher:
+    """
+    Collect concurrently submitted items into batches of up to max_batch_size,
+    waiting at most timeout_ms after the first item, then hand each batch to
+    an async handler returning one result (or exception) per item.
+    """
+
+    def __init__(self, handler, max_batch_size: int = 8, timeout_ms: int = 20):
+        self._handler = handler
+        self._max_batch_size = max_batch_size
+        self._timeout = timeout_ms / 1000
+        self._loop = None
+        self._queue = None
+
+    async def submit(self, item):
+        """Queue one item and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio queues are loop-bound; start a collector for this loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            loop.create_task(self._collect(self._queue))
+        future = loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self._timeout
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except TimeoutError:
+                    break
+            # Dispatch without waiting so the next batch can start collecting
+            loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: list) -> None:
+        try:
+            results = await self._handler([item for item, _ in batch])
+            # A short result list fails every waiter instead of leaving some hanging
+            pairs = list(zip(batch, results, strict=True))
+        except Exception as e:
+            pairs = [(entry, e) for entry in batch]
+        for (_, future), result in pairs:
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def _complete_batch(requests: list) -> list:
+    """Fire a batch of completion requests concurrently."""
+    logger.info(f"Dispatching LLM batch of {len(requests)} request(s)")
+    return await asyncio.gather(
+        *[_acall_llm_with_retry(**request) for request in requests],
+        return_exceptions=True,
+    )
+
+
+_completion_batcher = DynamicBatcher(_complete_batch, BATCH_MAX_SIZE, BATCH_TIMEOUT_MS)
+
+
+def _config_error_message(env_issues: list) -> str:
+    """Format configuration problems as a user-facing error message."""
+    bullet = " • " + "\n • ".join(env_issues)
+    hint_location = (
+        "Streamlit → Settings → Secrets" if _HAS_STREAMLIT else "your environment/.env"
+    )
+    return (
+        "⚠️ Configuration error:\n"
+        f"{bullet}\n\n"
+        f"Fix:\n"
+        f"- Set GEMINI_API_KEY=sk-... (proxy key) in {hint_location}\n"
+        f"- Set GOOGLE_GEMINI_BASE_URL=https://llm.lingarogroup.com\n"
+        f"- Ensure MODEL_NAME includes provider; current resolved MODEL_NAME is '{MODEL_NAME}'."
+    )
+
+
+@lru_cache(maxsize=8)
+def _cached_env_error(
+    api_key: Optional[str], api_base: str, model_name: str, provider: str
+) -> Optional[str]:
+    """Validate config once per distinct value set; arguments only key the cache."""
+    env_issues = _validate_env()
+    return _config_error_message(env_issues) if env_issues else None
+
+
+def _env_error() -> Optional[str]:
+    """Return the configuration error message, or None when config is valid."""
+    return _cached_env_error(API_KEY, API_BASE, MODEL_NAME, LLM_PROVIDER)
+
+
+_SYSTEM_MSG = {"role": "system", "content": load_system_prompt()}
+
+
+def _build_messages(user_message: str, history: list) -> list:
+    """
+    Build the LiteLLM message list (avoids double-adding the current user turn).
+    History is trusted to hold only user/assistant turns with string content;
+    callers enforce that when appending.
+    """
+    messages = [_SYSTEM_MSG, *history]
+    last = history[-1] if history else None
+    if last is None or last["role"] != "user" or last["content"] != user_message:
+        messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def _count_tokens(message: Dict[str, Any]) -> int:
+    """Approximate token count of one chat message."""
+    try:
+        # Default tokenizer: model-specific lookups can hit the network for proxy model names
+        return litellm.token_counter(messages=[message])
+    except Exception:
+        return len(str(message.get("content", ""))) // 4 + 4
+
+
+def trim_context(
+    messages: list,
+    max_turns: int = CONTEXT_MAX_TURNS,
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    summary: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Bound the context sent to the model with a sliding window.
+    Keeps leading system messages, then the last max_turns user/assistant pairs,
+    dropping the oldest further until the turns fit in max_tokens (the latest
+    message is always kept). An optional summary of older turns is inserted
+    as a system message after the system prompt.
+
+    :return: (context messages, dropped messages in chronological order)
+    """
+    head = 0
+    while head < len(messages) and messages[head].get("role") == "system":
+        head += 1
+    system, turns = messages[:head], messages[head:]
+
+    start = max(0, len(turns) - 2 * max_turns)
+    budget = max_tokens
+    kept = 0
+    for m in reversed(turns[start:]):
+        budget -= _count_tokens(m)
+        if budget < 0 and kept:
+            break
+        kept += 1
+    start = len(turns) - kept
+
+    context = list(system)
+    if summary:
+        context.append(
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+        )
+    context.extend(turns[start:])
+    return context, turns[:start]
+
+
+def summarize_messages(
+    messages: list,
+    previous_summary: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> Optional[str]:
+    """
+    One-shot summarization of turns that fell out of the context window.
+    Folds in any previous summary; returns None if the call fails.
+    """
+    transcript = "\n".join(
+        f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages
+    )
+    if previous_summary:
+        transcript = f"Earlier summary:\n{previous_summary}\n\n{transcript}"
+
+    summary = generate_response_from_messages(
+        [
+            {
+                "role": "system",
+                "content": "Summarize the conversation below in a few sentences. "
+                "Keep facts, names, decisions and open questions; omit pleasantries.",
+            },
+            {"role": "user", "content": transcript},
+        ],
+        temperature=0.0,
+        user_id="system",
+        session_id=session_id,
+        prompt_template="context_summary",
+    )
+    if not summary or summary.startswith("⚠️"):
+        logger.warning("Context summarization failed; continuing without summary")
+        return None
+    return summary.strip()
+
+
+def _estimate_usage(messages: list, response_text: str) -> Dict[str, int]:
+    """Estimate token usage for streams whose final chunk carries no usage block."""
+    try:
+        prompt_tokens = litellm.token_counter(model=MODEL_NAME, messages=messages)
+        completion_tokens = litellm.token_counter(model=MODEL_NAME, text=response_text)
+    except Exception as e:
+        logger.warning(f"Token estimation failed: {e}")
+        prompt_tokens = completion_tokens = 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _record_success(
+    request_id: str,
+    start_ns: int,
+    user_message: str,
+    temperature: float,
+    usage: Dict[str, Any],
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> None:
+    """Trace, log and persist metrics for a completed LLM call."""
+    cost = _calculate_cost(usage)
+
+    duration = (time.monotonic_ns() - start_ns) / 1e9
+    # Wall-clock start derived from the monotonic duration; only formatted when logged
+    end_epoch = time.time()
+    start_epoch = end_epoch - duration
+
+    # Log to Langfuse if enabled (Langfuse 2.12.0 - tracks metrics only)
+    if langfuse_client:
+        try:
+            # Create trace with environment tag
+            trace = langfuse_client.trace(
+                name="chat_completion",
+                user_id=user_id or "anonymous",
+                session_id=session_id or request_id,
+                metadata={"request_id": request_id, "environment": ENVIRONMENT},
+                tags=[ENVIRONMENT],
+            )
+
+            # Create usage object with cost details
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            usage_obj = ModelUsage(
+                input=prompt_tokens,
+                output=completion_tokens,
+                total=usage.get("total_tokens", 0),
+                unit="TOKENS",
+                input_cost=prompt_tokens * _INPUT_RATE,
+                output_cost=completion_tokens * _OUTPUT_RATE,
+                total_cost=cost,
+            )
+
+            # Create generation (tracks: timestamp, name, tokens, latency, cost)
+            trace.generation(
+                name="llm_completion",
+                model=MODEL_NAME,
+                model_parameters={"temperature": temperature},
+                start_time=datetime.utcfromtimestamp(start_epoch),
+                end_time=datetime.utcfromtimestamp(end_epoch),
+                usage=usage_obj,
+                metadata={"request_id": request_id},
+            )
+        except Exception as e:
+            logger.warning(f"[{request_id}] Langfuse logging failed: {e}")
+
+    logger.info(
+        f"[{request_id}] Success: "
+        f"tokens={usage.get('total_tokens', 0)}, "
+        f"cost=${cost:.6f}, "
+        f"duration={duration:.2f}s"
+    )
+
+    # Log metrics
+    _log_metrics(
+        {
+            "request_id": request_id,
+            "timestamp": datetime.utcfromtimestamp(start_epoch).isoformat(),
+            "model": MODEL_NAME,
+            "temperature": temperature,
+            "user_message_length": len(user_message),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "cost_usd": cost,
+            "duration_seconds": duration,
+            "success": True,
+            "error_type": None,
+        }
+    )
+
+
+# Exception type -> (log level, log label, user-facing message); matched along the MRO
+_ERR_MAP: Dict[type, Tuple[int, str, str]] = {
+    RateLimitError: (
+        logging.WARNING,
+        "Rate limit hit",
+        "⚠️ Rate limit exceeded. Please wait a moment and try again.",
+    ),
+    RateLimitExceededError: (
+        logging.WARNING,
+        "Rate limit hit",
+        "⚠️ Rate limit exceeded. Please wait a moment and try again.",
+    ),
+    AuthenticationError: (
+        logging.ERROR,
+        "Authentication failed",
+        "⚠️ Authentication error. Please check API credentials.",
+    ),
+    LiteLLMTimeout: (
+        logging.WARNING,
+        "Request timeout",
+        "⚠️ Request timed out. Please try again.",
+    ),
+    TimeoutError: (
+        logging.WARNING,
+        "Request timeout",
+        "⚠️ Request timed out. Please try again.",
+    ),
+    ServiceUnavailableError: (
+        logging.ERROR,
+        "Service unavailable",
+        "⚠️ Service temporarily unavailable. Please try again later.",
+    ),
+    BadRequestError: (
+        logging.ERROR,
+        "Bad request",
+        "⚠️ Invalid request format. Please try rephrasing your message.",
+    ),
+}
+
+
+def _handle_llm_error(
+    e: Exception,
+    request_id: str,
+    start_ns: int,
+    user_message: str,
+    temperature: float,
+) -> str:
+    """Categorize an LLM failure, record error metrics and return the user-facing message."""
+    duration = (time.monotonic_ns() - start_ns) / 1e9
+    error_type = type(e).__name__
+    error_message = str(e)
+
+    logger.error(f"[{request_id}] Error: {error_type} - {error_message}")
+
+    for cls in type(e).__mro__:
+        entry = _ERR_MAP.get(cls)
+        if entry:
+            level, label, response_text = entry
+            logger.log(level, f"[{request_id}] {label}: {e}")
+            break
+    else:
+        logger.error(f"[{request_id}] Unexpected error: {e}", exc_info=True)
+        details = [
+            f"Provider mode: {LLM_PROVIDER}",
+            f"Model: {MODEL_NAME}",
+            f"Base URL: {API_BASE}",
+            f"Key set: {'yes' if bool(API_KEY) else 'no'} "
+            f"(format ok: {'yes' if (API_KEY and str(API_KEY).startswith('sk-')) else 'no'})",
+            f"Using st.secrets: {'yes' if _HAS_STREAMLIT else 'no'}",
+        ]
+        response_text = (
+            f"⚠️ Error: {error_type}: {error_message}\n\nDiagnostics:\n- "
+            + "\n- ".join(details)
+        )
+
+    # Log error metrics
+    _log_metrics(
+        {
+            "request_id": request_id,
+            "timestamp": datetime.utcfromtimestamp(time.time() - duration).isoformat(),
+            "model": MODEL_NAME,
+            "temperature": temperature,
+            "user_message_length": len(user_message),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cost_usd": 0.0,
+            "duration_seconds": duration,
+            "success": False,
+            "error_type": error_type,
+            "error_message": error_message,
+        }
+    )
+
+    return response_text
+
+
+# {cache key: (expiry timestamp, response text)} for temperature-0 completions,
+# least recently used first; bounded by COMPLETION_CACHE_MAX_ENTRIES
+_completion_cache: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+_completion_cache_lock = threading.Lock()
+
+
+def _completion_cache_key(messages: list, temperature: float) -> Optional[str]:
+    """Cache key for deterministic requests; None when the request must not be cached."""
+    if temperature != 0 or COMPLETION_CACHE_TTL <= 0:
+        return None
+    payload = json.dumps([MODEL_NAME, messages], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _completion_cache_get(key: Optional[str]) -> Optional[str]:
+    """Return a cached response that has not expired."""
+    if key is None:
+        return None
+    with _completion_cache_lock:
+        entry = _completion_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del _completion_cache[key]
+            return None
+        _completion_cache.move_to_end(key)
+        return entry[1]
+
+
+def _completion_cache_put(key: Optional[str], response_text: str) -> None:
+    """Store a successful deterministic response, evicting expired and excess entries."""
+    if key is None or not response_text:
+        return
+    now = time.time()
+    with _completion_cache_lock:
+        _completion_cache[key] = (now + COMPLETION_CACHE_TTL, response_text)
+        _completion_cache.move_to_end(key)
+        # Sweep expired entries, then trim to the size limit from the LRU end
+        expired = [k for k, (expiry, _) in _completion_cache.items() if expiry < now]
+        for stale in expired:
+            del _completion_cache[stale]
+        while len(_completion_cache) > COMPLETION_CACHE_MAX_ENTRIES:
+            _completion_cache.popitem(last=False)
+
+
 def generate_response(
     user_message: str,
     history: list,
@@ -443,9 +1397,33 @@ def generate_response(
     :param prompt_template: name of the prompt template used
     :return: response text or error message
     """
-    request_id = str(uuid.uuid4())
-    start_time = datetime.utcnow()
-    timeout = int(_get_secret("REQUEST_TIMEOUT") or "30")
+    return generate_response_from_messages(
+        trim_context(_build_messages(user_message, history))[0],
+        temperature,
+        user_id=user_id,
+        session_id=session_id,
+        prompt_template=prompt_template,
+    )
+
+
+def generate_response_from_messages(
+    messages: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+) -> str:
+    """
+    Generate a chat response from a pre-built LiteLLM message list.
+    Lets callers keep the list across turns and append only the new messages,
+    instead of rebuilding it from the full history on every call.
+
+    :param messages: system prompt followed by chat turns; the last entry is the user turn
+    :return: response text or error message
+    """
+    request_id = uuid.uuid4().hex
+    start_ns = time.monotonic_ns()
+    user_message = messages[-1].get("content", "") if messages else ""
 
     # Build trace metadata
     trace_metadata = _get_trace_metadata(
@@ -456,215 +1434,363 @@ def generate_response(
         f"[{request_id}] New request: temp={temperature}, msg_len={len(user_message)}, tracing=Langfuse"
     )
 
-    env_issues = _validate_env()
-    if env_issues:
-        bullet = " • " + "\n • ".join(env_issues)
-        hint_location = (
-            "Streamlit → Settings → Secrets"
-            if _HAS_STREAMLIT
-            else "your environment/.env"
-        )
-        return (
-            "⚠️ Configuration error:\n"
-            f"{bullet}\n\n"
-            f"Fix:\n"
-            f"- Set GEMINI_API_KEY=sk-... (proxy key) in {hint_location}\n"
-            f"- Set GOOGLE_GEMINI_BASE_URL=https://llm.lingarogroup.com\n"
-            f"- Ensure MODEL_NAME includes provider; current resolved MODEL_NAME is '{MODEL_NAME}'."
-        )
-
-    system_prompt = load_system_prompt()
+    env_error = _env_error()
+    if env_error:
+        return env_error
 
-    # Build messages (avoid double-adding the current user turn)
-    messages = [{"role": "system", "content": system_prompt}]
-    for m in history:
-        if m.get("role") in {"user", "assistant"} and isinstance(m.get("content"), str):
-            messages.append(m)
-    if (
-        not history
-        or history[-1].get("role") != "user"
-        or history[-1].get("content") != user_message
-    ):
-        messages.append({"role": "user", "content": user_message})
+    cache_key = _completion_cache_key(messages, temperature)
+    cached = _completion_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"[{request_id}] Served from completion cache")
+        return cached
 
     # Attempt LLM call with retry logic and monitoring
-    error_type = None
-    error_message = None
-    response_text = None
-    usage = {}
-    cost = 0.0
-
     try:
-        # Prepare LiteLLM call parameters with metadata for Langfuse tracing
-        llm_params = {
-            "model": MODEL_NAME,
-            "api_key": API_KEY,
-            "api_base": API_BASE,
-            "messages": messages,
-            "temperature": temperature,
-            "timeout": timeout,
-            "metadata": {
-                "request_id": request_id,
-                "user_id": user_id or "anonymous",
-                "session_id": session_id or request_id,
-                "prompt_template": prompt_template,
-                "environment": os.getenv("ENVIRONMENT", "development"),
-            },
-        }
-
         resp = _call_llm_with_retry(
-            model=llm_params["model"],
-            api_key=llm_params["api_key"],
-            api_base=llm_params["api_base"],
-            messages=llm_params["messages"],
-            temperature=llm_params["temperature"],
-            timeout=llm_params["timeout"],
+            model=MODEL_NAME,
+            api_key=API_KEY,
+            api_base=API_BASE,
+            messages=messages,
+            temperature=temperature,
+            timeout=REQUEST_TIMEOUT,
         )
 
         response_text = resp["choices"][0]["message"]["content"]
-        usage = resp.get("usage", {})
-        cost = _calculate_cost(usage)
+        _record_success(
+            request_id,
+            start_ns,
+            user_message,
+            temperature,
+            resp.get("usage", {}),
+            user_id,
+            session_id,
+        )
+        _completion_cache_put(cache_key, response_text)
+        return response_text
 
-        end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
+    except Exception as e:
+        return _handle_llm_error(e, request_id, start_ns, user_message, temperature)
 
-        # Log to Langfuse if enabled (Langfuse 2.12.0 - tracks metrics only)
-        if langfuse_client:
-            try:
-                from langfuse.model import ModelUsage
-
-                # Create trace with environment tag
-                environment = os.getenv("ENVIRONMENT", "development")
-                trace = langfuse_client.trace(
-                    name="chat_completion",
-                    user_id=user_id or "anonymous",
-                    session_id=session_id or request_id,
-                    metadata={"request_id": request_id, "environment": environment},
-                    tags=[environment],
-                )
 
-                # Create usage object with cost details
-                usage_obj = ModelUsage(
-                    input=usage.get("prompt_tokens", 0),
-                    output=usage.get("completion_tokens", 0),
-                    total=usage.get("total_tokens", 0),
-                    unit="TOKENS",
-                    input_cost=(usage.get("prompt_tokens", 0) / 1_000_000) * 0.075,
-                    output_cost=(usage.get("completion_tokens", 0) / 1_000_000) * 0.30,
-                    total_cost=cost,
-                )
+def generate_responses(
+    requests: List[Tuple[str, list]],
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+) -> List[str]:
+    """
+    Generate responses for a batch of (user_message, history) pairs in one
+    rate-limited call. Meant for evaluation and bulk workloads (prompt sweeps,
+    A/B tests) that would otherwise queue behind the per-request limit.
 
-                # Create generation (tracks: timestamp, name, tokens, latency, cost)
-                trace.generation(
-                    name="llm_completion",
-                    model=MODEL_NAME,
-                    model_parameters={"temperature": temperature},
-                    start_time=start_time,
-                    end_time=end_time,
-                    usage=usage_obj,
-                    metadata={"request_id": request_id},
-                )
+    :param requests: list of (user_message, history) tuples
+    :return: response text or error message for each request, in order
+    """
+    if not requests:
+        return []
 
-                langfuse_client.flush()
-            except Exception as e:
-                logger.warning(f"[{request_id}] Langfuse logging failed: {e}")
+    request_id = uuid.uuid4().hex
+    start_ns = time.monotonic_ns()
+    batch_messages = [trim_context(_build_messages(u, h))[0] for u, h in requests]
 
-        logger.info(
-            f"[{request_id}] Success: "
-            f"tokens={usage.get('total_tokens', 0)}, "
-            f"cost=${cost:.6f}, "
-            f"duration={duration:.2f}s"
+    logger.info(
+        f"[{request_id}] New batch request: size={len(requests)}, temp={temperature}"
+    )
+
+    env_error = _env_error()
+    if env_error:
+        return [env_error] * len(requests)
+
+    try:
+        results = _call_llm_batch_with_retry(
+            model=MODEL_NAME,
+            api_key=API_KEY,
+            api_base=API_BASE,
+            batch_messages=batch_messages,
+            temperature=temperature,
+            timeout=REQUEST_TIMEOUT,
         )
+    except Exception as e:
+        error_text = _handle_llm_error(
+            e, request_id, start_ns, requests[0][0], temperature
+        )
+        return [error_text] * len(requests)
 
-        # Log metrics
-        _log_metrics(
-            {
-                "request_id": request_id,
-                "timestamp": start_time.isoformat(),
-                "model": MODEL_NAME,
-                "temperature": temperature,
-                "user_message_length": len(user_message),
-                "prompt_tokens": usage.get("prompt_tokens", 0),
-                "completion_tokens": usage.get("completion_tokens", 0),
-                "total_tokens": usage.get("total_tokens", 0),
-                "cost_usd": cost,
-                "duration_seconds": duration,
-                "success": True,
-                "error_type": None,
-            }
+    responses = []
+    recorded = set()
+    for i, ((user_message, _), result) in enumerate(
+        zip(requests, results, strict=True)
+    ):
+        item_id = f"{request_id}-{i}"
+        if isinstance(result, Exception):
+            responses.append(
+                _handle_llm_error(result, item_id, start_ns, user_message, temperature)
+            )
+            continue
+        resp, choice = result
+        responses.append(resp["choices"][choice]["message"]["content"])
+        # An n= completion reports usage once for all its choices
+        if id(resp) not in recorded:
+            recorded.add(id(resp))
+            _record_success(
+                item_id,
+                start_ns,
+                user_message,
+                temperature,
+                resp.get("usage", {}),
+                user_id,
+                session_id,
+            )
+    return responses
+
+
+def stream_response(
+    user_message: str,
+    history: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+) -> Iterator[str]:
+    """
+    Stream a chat response as text deltas so the UI can render tokens as they arrive.
+    Same parameters and monitoring as generate_response; metrics are recorded once
+    the stream is exhausted. Errors are yielded as a final user-facing message.
+    """
+    return stream_response_from_messages(
+        trim_context(_build_messages(user_message, history))[0],
+        temperature,
+        user_id=user_id,
+        session_id=session_id,
+        prompt_template=prompt_template,
+    )
+
+
+def stream_response_from_messages(
+    messages: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+) -> Iterator[str]:
+    """Streaming counterpart of generate_response_from_messages."""
+    request_id = uuid.uuid4().hex
+    start_ns = time.monotonic_ns()
+    user_message = messages[-1].get("content", "") if messages else ""
+
+    logger.info(
+        f"[{request_id}] New streaming request: temp={temperature}, msg_len={len(user_message)}, tracing=Langfuse"
+    )
+
+    env_error = _env_error()
+    if env_error:
+        yield env_error
+        return
+
+    cache_key = _completion_cache_key(messages, temperature)
+    cached = _completion_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"[{request_id}] Served from completion cache")
+        yield cached
+        return
+
+    parts = []
+    usage = None
+
+    try:
+        stream = _call_llm_with_retry(
+            model=MODEL_NAME,
+            api_key=API_KEY,
+            api_base=API_BASE,
+            messages=messages,
+            temperature=temperature,
+            timeout=REQUEST_TIMEOUT,
+            stream=True,
         )
 
-        return response_text
+        for chunk in stream:
+            # The final chunk carries usage when the provider honours include_usage
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta") if choices else None
+            content = delta.get("content") if delta else None
+            if content:
+                parts.append(content)
+                yield content
+
+        response_text = "".join(parts)
+        _record_success(
+            request_id,
+            start_ns,
+            user_message,
+            temperature,
+            usage or _estimate_usage(messages, response_text),
+            user_id,
+            session_id,
+        )
+        _completion_cache_put(cache_key, response_text)
 
     except Exception as e:
-        # Categorize errors
-        from litellm.exceptions import (
-            RateLimitError,
-            AuthenticationError,
-            ServiceUnavailableError,
-            Timeout as LiteLLMTimeout,
-            BadRequestError,
+        error_text = _handle_llm_error(
+            e, request_id, start_ns, user_message, temperature
         )
+        yield f"\n\n{error_text}" if parts else error_text
+
+
+async def agenerate_response(
+    user_message: str,
+    history: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+    use_cache: bool = True,
+) -> str:
+    """
+    Async version of generate_response using litellm.acompletion.
+    Lets several turns (or a connectivity check) run concurrently on one event loop.
+    use_cache=False always calls the model, even for a cached temperature-0 request.
+    """
+    return await agenerate_response_from_messages(
+        trim_context(_build_messages(user_message, history))[0],
+        temperature,
+        user_id=user_id,
+        session_id=session_id,
+        prompt_template=prompt_template,
+        use_cache=use_cache,
+    )
 
-        duration = (datetime.utcnow() - start_time).total_seconds()
-        error_type = type(e).__name__
-        error_message = str(e)
 
-        logger.error(f"[{request_id}] Error: {error_type} - {error_message}")
+async def agenerate_response_from_messages(
+    messages: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+    use_cache: bool = True,
+) -> str:
+    """
+    Async counterpart of generate_response_from_messages.
+    With ENABLE_DYNAMIC_BATCHING, concurrent calls are coalesced by the shared batcher.
+    """
+    request_id = uuid.uuid4().hex
+    start_ns = time.monotonic_ns()
+    user_message = messages[-1].get("content", "") if messages else ""
 
-        if isinstance(e, RateLimitError):
-            logger.warning(f"[{request_id}] Rate limit hit: {e}")
-            response_text = (
-                "⚠️ Rate limit exceeded. Please wait a moment and try again."
-            )
-        elif isinstance(e, AuthenticationError):
-            logger.error(f"[{request_id}] Authentication failed: {e}")
-            response_text = "⚠️ Authentication error. Please check API credentials."
-        elif isinstance(e, (LiteLLMTimeout, TimeoutError)):
-            logger.warning(f"[{request_id}] Request timeout: {e}")
-            response_text = "⚠️ Request timed out. Please try again."
-        elif isinstance(e, ServiceUnavailableError):
-            logger.error(f"[{request_id}] Service unavailable: {e}")
-            response_text = (
-                "⚠️ Service temporarily unavailable. Please try again later."
-            )
-        elif isinstance(e, BadRequestError):
-            logger.error(f"[{request_id}] Bad request: {e}")
-            response_text = (
-                "⚠️ Invalid request format. Please try rephrasing your message."
-            )
+    logger.info(
+        f"[{request_id}] New async request: temp={temperature}, msg_len={len(user_message)}, tracing=Langfuse"
+    )
+
+    env_error = _env_error()
+    if env_error:
+        return env_error
+
+    cache_key = _completion_cache_key(messages, temperature) if use_cache else None
+    cached = _completion_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"[{request_id}] Served from completion cache")
+        return cached
+
+    request = {
+        "model": MODEL_NAME,
+        "api_key": API_KEY,
+        "api_base": API_BASE,
+        "messages": messages,
+        "temperature": temperature,
+        "timeout": REQUEST_TIMEOUT,
+    }
+
+    try:
+        if ENABLE_DYNAMIC_BATCHING:
+            resp = await _completion_batcher.submit(request)
         else:
-            logger.error(f"[{request_id}] Unexpected error: {e}", exc_info=True)
-            details = [
-                f"Provider mode: {LLM_PROVIDER}",
-                f"Model: {MODEL_NAME}",
-                f"Base URL: {API_BASE}",
-                f"Key set: {'yes' if bool(API_KEY) else 'no'} "
-                f"(format ok: {'yes' if (API_KEY and str(API_KEY).startswith('sk-')) else 'no'})",
-                f"Using st.secrets: {'yes' if _HAS_STREAMLIT else 'no'}",
-            ]
-            response_text = (
-                f"⚠️ Error: {error_type}: {error_message}\n\nDiagnostics:\n- "
-                + "\n- ".join(details)
-            )
+            resp = await _acall_llm_with_retry(**request)
 
-        # Log error metrics
-        _log_metrics(
-            {
-                "request_id": request_id,
-                "timestamp": start_time.isoformat(),
-                "model": MODEL_NAME,
-                "temperature": temperature,
-                "user_message_length": len(user_message),
-                "prompt_tokens": 0,
-                "completion_tokens": 0,
-                "total_tokens": 0,
-                "cost_usd": 0.0,
-                "duration_seconds": duration,
-                "success": False,
-                "error_type": error_type,
-                "error_message": error_message,
-            }
+        response_text = resp["choices"][0]["message"]["content"]
+        _record_success(
+            request_id,
+            start_ns,
+            user_message,
+            temperature,
+            resp.get("usage", {}),
+            user_id,
+            session_id,
         )
-
+        _completion_cache_put(cache_key, response_text)
         return response_text
+
+    except Exception as e:
+        return _handle_llm_error(e, request_id, start_ns, user_message, temperature)
+
+
+async def astream_response(
+    user_message: str,
+    history: list,
+    temperature: float = 0.4,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    prompt_template: str = "default",
+) -> AsyncIterator[str]:
+    """Async version of stream_response; yields text deltas from acompletion."""
+    request_id = uuid.uuid4().hex
+    start_ns = time.monotonic_ns()
+
+    logger.info(
+        f"[{request_id}] New async streaming request: temp={temperature}, msg_len={len(user_message)}, tracing=Langfuse"
+    )
+
+    env_error = _env_error()
+    if env_error:
+        yield env_error
+        return
+
+    messages, _ = trim_context(_build_messages(user_message, history))
+    cache_key = _completion_cache_key(messages, temperature)
+    cached = _completion_cache_get(cache_key)
+    if cached is not None:
+        logger.info(f"[{request_id}] Served from completion cache")
+        yield cached
+        return
+    parts = []
+    usage = None
+
+    try:
+        stream = await _acall_llm_with_retry(
+            model=MODEL_NAME,
+            api_key=API_KEY,
+            api_base=API_BASE,
+            messages=messages,
+            temperature=temperature,
+            timeout=REQUEST_TIMEOUT,
+            stream=True,
+        )
+
+        async for chunk in stream:
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta") if choices else None
+            content = delta.get("content") if delta else None
+            if content:
+                parts.append(content)
+                yield content
+
+        response_text = "".join(parts)
+        _record_success(
+            request_id,
+            start_ns,
+            user_message,
+            temperature,
+            usage or _estimate_usage(messages, response_text),
+            user_id,
+            session_id,
+        )
+        _completion_cache_put(cache_key, response_text)
+
+    except Exception as e:
+        error_text = _handle_llm_error(
+            e, request_id, start_ns, user_message, temperature
+        )
+        yield f"\n\n{error_text}" if parts else error_text
@@ -3,16 +3,43 @@ Integration Status Checker
 Verifies all external service connections and configurations
 """
 
+import importlib.util
+import io
 import os
+import re
 import sys
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from dotenv import load_dotenv
 import socket
+import errno
+import select
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent HTTP probes share one pooled session when aiohttp is installed
+try:
+    import aiohttp
+
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
 
 # Load environment
 load_dotenv()
 
+# Environment snapshot: checks read a plain dict instead of os.environ
+ENV = dict(os.environ)
+
+
+# Variable names whose values are masked in output
+_SENSITIVE_RE = re.compile(r"KEY|PASSWORD|TOKEN|SECRET")
+
+# Upper bound for a single TCP port probe, in seconds
+PROBE_TIMEOUT = float(ENV.get("INTEGRATION_PROBE_TIMEOUT", "1.0"))
+
 
 class Colors:
     """ANSI color codes for terminal output"""
@@ -25,11 +52,20 @@ class Colors:
     BOLD = "\033[1m"
 
 
+# Report lines collect here and reach stdout in one write at the end of main()
+_BUF = io.StringIO()
+
+
+def _out(*args):
+    """Append a line to the report buffer"""
+    print(*args, file=_BUF)
+
+
 def print_header(text):
     """Print section header"""
-    print(f"\n{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.RESET}")
-    print(f"{Colors.BLUE}{Colors.BOLD}{text}{Colors.RESET}")
-    print(f"{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+    _out(f"\n{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    _out(f"{Colors.BLUE}{Colors.BOLD}{text}{Colors.RESET}")
+    _out(f"{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
 
 
 def print_status(service, status, message=""):
@@ -47,205 +83,309 @@ def print_status(service, status, message=""):
         icon = "ℹ️ "
         status_text = status
 
-    print(f"{icon} {Colors.BOLD}{service:<30}{Colors.RESET} {status_text}")
+    _out(f"{icon} {Colors.BOLD}{service:<30}{Colors.RESET} {status_text}")
     if message:
-        print(f"   └─ {message}")
+        _out(f"   └─ {message}")
 
 
 def check_env_var(var_name, required=False):
     """Check if environment variable is set"""
-    value = os.getenv(var_name)
+    value = ENV.get(var_name)
     if value:
         # Mask sensitive values
-        if any(key in var_name for key in ["KEY", "PASSWORD", "TOKEN", "SECRET"]):
+        if _SENSITIVE_RE.search(var_name):
             masked = value[:8] + "..." if len(value) > 8 else "***"
             return True, masked
         return True, value
     return False, None
 
 
-def check_port_open(host, port, timeout=2):
-    """Check if a port is open"""
+def check_port_open(host, port, timeout=None):
+    """Check if a port is open (non-blocking connect bounded by select)"""
+    if timeout is None:
+        timeout = PROBE_TIMEOUT
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(timeout)
-        result = sock.connect_ex((host, port))
-        sock.close()
-        return result == 0
-    except:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 0)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
+            result = sock.connect_ex((host, port))
+            if result not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                return False
+            _, writable, _ = select.select([], [sock], [], timeout)
+            if not writable:
+                return False  # SYN dropped: give up after the probe budget
+            return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+    except OSError:
         return False
 
 
-def check_http_endpoint(url, timeout=5):
-    """Check if HTTP endpoint is accessible"""
+async def _probe(session, url, timeout=5):
+    """Probe one URL on a shared aiohttp session"""
     try:
-        response = requests.get(url, timeout=timeout)
-        return response.status_code < 500, response.status_code
-    except requests.exceptions.Timeout:
+        async with session.get(
+            url, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            return response.status < 500, response.status
+    except asyncio.TimeoutError:
         return False, "Timeout"
-    except requests.exceptions.ConnectionError:
+    except aiohttp.ClientConnectionError:
         return False, "Connection refused"
     except Exception as e:
         return False, str(e)
 
 
-def main():
-    """Run all service checks"""
-    print(f"\n{Colors.BOLD}🔌 External Services Integration Check{Colors.RESET}")
-    print(f"Date: {Colors.BLUE}{Path.cwd()}{Colors.RESET}\n")
+async def _probe_all(urls, timeout=5):
+    """Probe every URL concurrently over one pooled session"""
+    connector = aiohttp.TCPConnector(limit=32, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*(_probe(session, url, timeout) for url in urls))
 
-    results = {"required": [], "optional": [], "warnings": []}
 
-    # =====================================================
-    # PHASE 1: Required Services
-    # =====================================================
-    print_header("PHASE 1: Required Services (Must Have)")
+def check_http_endpoints(urls, timeout=5):
+    """Check several HTTP endpoints at once; returns [(reachable, status)] in order"""
+    if AIOHTTP_AVAILABLE:
+        return list(asyncio.run(_probe_all(urls, timeout)))
+    return [_check_http_endpoint_sync(url, timeout) for url in urls]
 
-    # Check Python dependencies
-    try:
-        import streamlit
-        import litellm
-        import pandas
-        import plotly
-
-        print_status("Python Dependencies", "OK", "All packages installed")
-        results["required"].append(("Dependencies", True))
-    except ImportError as e:
-        print_status("Python Dependencies", "FAIL", f"Missing: {e}")
-        results["required"].append(("Dependencies", False))
-
-    # Check Gemini API configuration
-    has_key, key_value = check_env_var("GEMINI_API_KEY", required=True)
-    has_url, url_value = check_env_var("GOOGLE_GEMINI_BASE_URL", required=True)
-
-    if has_key and has_url:
-        # Try to verify API connection (optional check)
-        print_status(
-            "Gemini API Configuration", "OK", f"Key: {key_value}, URL: {url_value}"
+
+# Keep-alive session for the blocking fallback, created on first use
+_HTTP = None
+
+
+def _http_session():
+    """Return the shared pooled HTTP session, creating it lazily"""
+    global _HTTP
+    if _HTTP is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3),
         )
-        results["required"].append(("Gemini API", True))
-    else:
-        missing = []
-        if not has_key:
-            missing.append("GEMINI_API_KEY")
-        if not has_url:
-            missing.append("GOOGLE_GEMINI_BASE_URL")
-        print_status(
-            "Gemini API Configuration", "FAIL", f"Missing: {', '.join(missing)}"
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _HTTP = session
+    return _HTTP
+
+
+def _check_http_endpoint_sync(url, timeout=5):
+    """Blocking fallback used when aiohttp is not installed"""
+    try:
+        response = _http_session().get(url, timeout=timeout)
+        return response.status_code < 500, response.status_code
+    except requests.exceptions.Timeout:
+        return False, "Timeout"
+    except requests.exceptions.ConnectionError:
+        return False, "Connection refused"
+    except Exception as e:
+        return False, str(e)
+
+
+def check_http_endpoint(url, timeout=5):
+    """Check if HTTP endpoint is accessible"""
+    return check_http_endpoints([url], timeout)[0]
+
+
+# Environment manifests: (variable, required)
+REQUIRED = (("GEMINI_API_KEY", True), ("GOOGLE_GEMINI_BASE_URL", True))
+OBSERVABILITY = (
+    ("LANGFUSE_PUBLIC_KEY", False),
+    ("LANGFUSE_SECRET_KEY", False),
+    ("LANGFUSE_HOST", False),
+)
+ALERTING = (
+    ("SMTP_HOST", False),
+    ("SMTP_USER", False),
+    ("SMTP_PASSWORD", False),
+    ("ALERT_EMAIL_TO", False),
+)
+
+
+def probe(manifest):
+    """Check every variable in a manifest; returns ({name: display value}, [missing names])"""
+    found = {}
+    missing = []
+    for name, required in manifest:
+        present, value = check_env_var(name, required=required)
+        if present:
+            found[name] = value
+        else:
+            missing.append(name)
+    return found, missing
+
+
+# Each check returns (bucket, name, ok, lines, warnings):
+#   bucket   - "required" or "optional" results list to record into
+#   lines    - [(service, status, message)] passed to print_status in order
+#   warnings - messages for the summary's warning list
+
+
+def check_dependencies():
+    """Phase 1: required Python packages (located, not imported)"""
+    missing = [
+        m
+        for m in ("streamlit", "litellm", "pandas", "plotly")
+        if importlib.util.find_spec(m) is None
+    ]
+    if not missing:
+        line = ("Python Dependencies", "OK", "All packages installed")
+        return "required", "Dependencies", True, [line], []
+    line = ("Python Dependencies", "FAIL", f"Missing: {', '.join(missing)}")
+    return "required", "Dependencies", False, [line], []
+
+
+def check_gemini_api():
+    """Phase 1: Gemini API configuration"""
+    found, missing = probe(REQUIRED)
+
+    if not missing:
+        line = (
+            "Gemini API Configuration",
+            "OK",
+            f"Key: {found['GEMINI_API_KEY']}, URL: {found['GOOGLE_GEMINI_BASE_URL']}",
         )
-        results["required"].append(("Gemini API", False))
+        return "required", "Gemini API", True, [line], []
+
+    line = ("Gemini API Configuration", "FAIL", f"Missing: {', '.join(missing)}")
+    return "required", "Gemini API", False, [line], []
+
 
-    # Check local storage directories
+def check_local_storage():
+    """Phase 1: local storage directories"""
     dirs_ok = True
+    lines = []
     for dir_name in ["logs", "metrics", "demo_data"]:
         dir_path = Path(dir_name)
         if dir_path.exists():
-            print_status(
-                f"Directory: {dir_name}/",
-                "OK",
-                f"{len(list(dir_path.iterdir()))} files",
+            lines.append(
+                (
+                    f"Directory: {dir_name}/",
+                    "OK",
+                    f"{len(list(dir_path.iterdir()))} files",
+                )
             )
         else:
-            print_status(
-                f"Directory: {dir_name}/", "WARN", "Will be created on first run"
+            lines.append(
+                (f"Directory: {dir_name}/", "WARN", "Will be created on first run")
             )
             dirs_ok = False
-    results["required"].append(("Local Storage", dirs_ok))
+    return "required", "Local Storage", dirs_ok, lines, []
+
+
+def check_langfuse():
+    """Phase 2: Langfuse configuration and reachability"""
+    enable_langfuse = ENV.get("ENABLE_LANGFUSE", "true").lower() == "true"
+    if not enable_langfuse:
+        line = ("Langfuse Tracing", "WARN", "Disabled (ENABLE_LANGFUSE=false)")
+        return "optional", "Langfuse", False, [line], []
+
+    found, missing = probe(OBSERVABILITY)
+
+    if not missing:
+        lf_host = found["LANGFUSE_HOST"]
+        # Try to ping Langfuse
+        is_reachable, status = check_http_endpoint(lf_host)
+        if is_reachable:
+            line = ("Langfuse Tracing", "OK", f"Host: {lf_host}, Keys configured")
+            return "optional", "Langfuse", True, [line], []
+        line = ("Langfuse Tracing", "WARN", f"Configured but unreachable: {status}")
+        return "optional", "Langfuse", False, [line], []
+
+    line = ("Langfuse Tracing", "WARN", f"Disabled or missing: {', '.join(missing)}")
+    return (
+        "optional",
+        "Langfuse",
+        False,
+        [line],
+        ["Langfuse not configured - tracing disabled"],
+    )
 
-    # =====================================================
-    # PHASE 2: Observability Stack
-    # =====================================================
-    print_header("PHASE 2: Observability Stack (Recommended)")
-
-    # Check Langfuse configuration
-    enable_langfuse = os.getenv("ENABLE_LANGFUSE", "true").lower() == "true"
-    has_lf_pub, lf_pub = check_env_var("LANGFUSE_PUBLIC_KEY")
-    has_lf_sec, lf_sec = check_env_var("LANGFUSE_SECRET_KEY")
-    has_lf_host, lf_host = check_env_var("LANGFUSE_HOST")
-
-    if enable_langfuse:
-        if has_lf_pub and has_lf_sec and has_lf_host:
-            # Try to ping Langfuse
-            is_reachable, status = check_http_endpoint(lf_host)
-            if is_reachable:
-                print_status(
-                    "Langfuse Tracing", "OK", f"Host: {lf_host}, Keys configured"
-                )
-                results["optional"].append(("Langfuse", True))
-            else:
-                print_status(
-                    "Langfuse Tracing", "WARN", f"Configured but unreachable: {status}"
-                )
-                results["optional"].append(("Langfuse", False))
-        else:
-            missing = []
-            if not has_lf_pub:
-                missing.append("LANGFUSE_PUBLIC_KEY")
-            if not has_lf_sec:
-                missing.append("LANGFUSE_SECRET_KEY")
-            if not has_lf_host:
-                missing.append("LANGFUSE_HOST")
-            print_status(
-                "Langfuse Tracing", "WARN", f"Disabled or missing: {', '.join(missing)}"
-            )
-            results["warnings"].append("Langfuse not configured - tracing disabled")
-            results["optional"].append(("Langfuse", False))
-    else:
-        print_status("Langfuse Tracing", "WARN", "Disabled (ENABLE_LANGFUSE=false)")
-        results["optional"].append(("Langfuse", False))
 
-    # Check OpenTelemetry (fallback)
-    enable_otel = os.getenv("ENABLE_OTEL", "false").lower() == "true"
+def check_opentelemetry():
+    """Phase 2: OpenTelemetry (fallback)"""
+    enable_otel = ENV.get("ENABLE_OTEL", "false").lower() == "true"
     if enable_otel:
-        otel_exporter = os.getenv("OTEL_EXPORTER", "console")
-        print_status("OpenTelemetry", "OK", f"Enabled with {otel_exporter} exporter")
-        results["optional"].append(("OpenTelemetry", True))
-    else:
-        print_status("OpenTelemetry", "WARN", "Disabled (fallback to Langfuse)")
-        results["optional"].append(("OpenTelemetry", False))
+        otel_exporter = ENV.get("OTEL_EXPORTER", "console")
+        line = ("OpenTelemetry", "OK", f"Enabled with {otel_exporter} exporter")
+        return "optional", "OpenTelemetry", True, [line], []
+    line = ("OpenTelemetry", "WARN", "Disabled (fallback to Langfuse)")
+    return "optional", "OpenTelemetry", False, [line], []
+
+
+def check_email_alerts():
+    """Phase 3: SMTP configuration"""
+    found, missing = probe(ALERTING)
+
+    if not missing:
+        line = (
+            "Email Alerts (SMTP)",
+            "OK",
+            f"Server: {found['SMTP_HOST']}, To: {found['ALERT_EMAIL_TO']}",
+        )
+        return "optional", "Email Alerts", True, [line], []
 
-    # =====================================================
-    # PHASE 3: Alerting
-    # =====================================================
-    print_header("PHASE 3: Alerting (Optional)")
+    line = ("Email Alerts (SMTP)", "WARN", f"Not configured: {', '.join(missing)}")
+    return "optional", "Email Alerts", False, [line], []
 
-    # Check SMTP configuration
-    has_smtp_host, smtp_host = check_env_var("SMTP_HOST")
-    has_smtp_user, smtp_user = check_env_var("SMTP_USER")
-    has_smtp_pass, smtp_pass = check_env_var("SMTP_PASSWORD")
-    has_alert_to, alert_to = check_env_var("ALERT_EMAIL_TO")
 
-    if has_smtp_host and has_smtp_user and has_smtp_pass and has_alert_to:
-        print_status(
-            "Email Alerts (SMTP)", "OK", f"Server: {smtp_host}, To: {alert_to}"
-        )
-        results["optional"].append(("Email Alerts", True))
-    else:
-        missing = []
-        if not has_smtp_host:
-            missing.append("SMTP_HOST")
-        if not has_smtp_user:
-            missing.append("SMTP_USER")
-        if not has_smtp_pass:
-            missing.append("SMTP_PASSWORD")
-        if not has_alert_to:
-            missing.append("ALERT_EMAIL_TO")
-        print_status(
-            "Email Alerts (SMTP)", "WARN", f"Not configured: {', '.join(missing)}"
-        )
-        results["optional"].append(("Email Alerts", False))
-
-    # Check Slack webhook
+def check_slack_alerts():
+    """Phase 3: Slack webhook"""
     has_slack, slack_url = check_env_var("SLACK_WEBHOOK_URL")
-
     if has_slack:
-        print_status("Slack Alerts", "OK", f"Webhook configured: {slack_url[:30]}...")
-        results["optional"].append(("Slack Alerts", True))
-    else:
-        print_status(
-            "Slack Alerts", "WARN", "Not configured (SLACK_WEBHOOK_URL missing)"
-        )
-        results["optional"].append(("Slack Alerts", False))
+        line = ("Slack Alerts", "OK", f"Webhook configured: {slack_url[:30]}...")
+        return "optional", "Slack Alerts", True, [line], []
+    line = ("Slack Alerts", "WARN", "Not configured (SLACK_WEBHOOK_URL missing)")
+    return "optional", "Slack Alerts", False, [line], []
+
+
+PHASES = [
+    (
+        "PHASE 1: Required Services (Must Have)",
+        [check_dependencies, check_gemini_api, check_local_storage],
+    ),
+    (
+        "PHASE 2: Observability Stack (Recommended)",
+        [check_langfuse, check_opentelemetry],
+    ),
+    ("PHASE 3: Alerting (Optional)", [check_email_alerts, check_slack_alerts]),
+]
+
+
+def main():
+    """Run all service checks"""
+    try:
+        return _run_checks()
+    finally:
+        sys.stdout.write(_BUF.getvalue())
+        sys.stdout.flush()
+        _BUF.seek(0)
+        _BUF.truncate()
+
+
+def _run_checks():
+    """Run every phase and write the report into the output buffer"""
+    _out(f"\n{Colors.BOLD}🔌 External Services Integration Check{Colors.RESET}")
+    _out(f"Date: {Colors.BLUE}{Path.cwd()}{Colors.RESET}\n")
+
+    results = {"required": [], "optional": [], "warnings": []}
+
+    # Checks are independent I/O (HTTP probes, env lookups): run them all at once so
+    # the total wait is the slowest check rather than the sum of every timeout
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        phase_futures = [
+            (title, [ex.submit(check) for check in checks]) for title, checks in PHASES
+        ]
+
+    # Print on the main thread, per phase, in submission order
+    for title, futures in phase_futures:
+        print_header(title)
+        for future in futures:
+            bucket, name, ok, lines, warnings = future.result()
+            for service, status, message in lines:
+                print_status(service, status, message)
+            results[bucket].append((name, ok))
+            results["warnings"].extend(warnings)
 
     # =====================================================
     # Summary
@@ -257,40 +397,40 @@ def main():
     optional_pass = sum(1 for _, status in results["optional"] if status)
     optional_total = len(results["optional"])
 
-    print(
+    _out(
         f"Required Services:  {required_pass}/{required_total} {Colors.GREEN if required_pass == required_total else Colors.RED}{'✅' if required_pass == required_total else '❌'}{Colors.RESET}"
     )
-    print(
+    _out(
         f"Optional Services:  {optional_pass}/{optional_total} {Colors.YELLOW}⚠️{Colors.RESET}"
     )
 
     if results["warnings"]:
-        print(f"\n{Colors.YELLOW}⚠️  Warnings:{Colors.RESET}")
+        _out(f"\n{Colors.YELLOW}⚠️  Warnings:{Colors.RESET}")
         for warning in results["warnings"]:
-            print(f"   • {warning}")
+            _out(f"   • {warning}")
 
-    print("\n" + "=" * 60)
+    _out("\n" + "=" * 60)
 
     # Recommendations
     if required_pass < required_total:
-        print(
+        _out(
             f"\n{Colors.RED}{Colors.BOLD}❌ CRITICAL: Required services missing!{Colors.RESET}"
         )
-        print("   Action: Fix required services before proceeding")
-        print("   See: INTEGRATION_PLAN.md → STEP 1")
+        _out("   Action: Fix required services before proceeding")
+        _out("   See: INTEGRATION_PLAN.md → STEP 1")
         return 1
     elif optional_pass < optional_total / 2:
-        print(
+        _out(
             f"\n{Colors.YELLOW}{Colors.BOLD}⚠️  Ready for local testing (Phase 1){Colors.RESET}"
         )
-        print("   Recommendation: Add observability for production")
-        print("   Next: INTEGRATION_PLAN.md → STEP 2 (Langfuse)")
+        _out("   Recommendation: Add observability for production")
+        _out("   Next: INTEGRATION_PLAN.md → STEP 2 (Langfuse)")
         return 0
     else:
-        print(f"\n{Colors.GREEN}{Colors.BOLD}✅ Production ready!{Colors.RESET}")
-        print("   All critical services configured")
-        print("   Next: Run load tests, then deploy")
-        print("   See: INTEGRATION_PLAN.md → STEP 5-6")
+        _out(f"\n{Colors.GREEN}{Colors.BOLD}✅ Production ready!{Colors.RESET}")
+        _out("   All critical services configured")
+        _out("   Next: Run load tests, then deploy")
+        _out("   See: INTEGRATION_PLAN.md → STEP 5-6")
         return 0
 
 
@@ -3,11 +3,17 @@ Alerting System for Chatbot Monitoring
 Monitors metrics and sends alerts via email or Slack when thresholds are exceeded
 """
 
+import heapq
 import json
 import os
+import time
 import logging
 import smtplib
 import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from array import array
 from pathlib import Path
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
@@ -15,35 +21,85 @@ from email.mime.multipart import MIMEMultipart
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
+# Faster JSONL parsing (optional)
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
 load_dotenv()
+# Log calls use %-style arguments so filtered records are never formatted
 logger = logging.getLogger(__name__)
 
+# Environment snapshot: config reads hit a plain dict instead of os.environ
+ENV = dict(os.environ)
+
+
 # Configuration
 METRICS_FILE = Path("metrics/requests.jsonl")
 
+# Records are appended on completion but stamped at request start, so the file is only
+# roughly time-ordered; keep reading this far past the cutoff before stopping
+ORDER_SLACK = timedelta(minutes=5)
+
 # Alert thresholds (configurable via environment variables)
-ERROR_RATE_THRESHOLD = float(os.getenv("ALERT_ERROR_RATE_THRESHOLD", "10.0"))  # %
-LATENCY_P95_THRESHOLD = float(
-    os.getenv("ALERT_LATENCY_P95_THRESHOLD", "5.0")
-)  # seconds
-COST_PER_HOUR_THRESHOLD = float(os.getenv("ALERT_COST_THRESHOLD", "1.0"))  # USD
+ERROR_RATE_THRESHOLD = float(ENV.get("ALERT_ERROR_RATE_THRESHOLD", "10.0"))  # %
+LATENCY_P95_THRESHOLD = float(ENV.get("ALERT_LATENCY_P95_THRESHOLD", "5.0"))  # seconds
+COST_PER_HOUR_THRESHOLD = float(ENV.get("ALERT_COST_THRESHOLD", "1.0"))  # USD
 MIN_REQUESTS_FOR_ALERT = int(
-    os.getenv("ALERT_MIN_REQUESTS", "10")
+    ENV.get("ALERT_MIN_REQUESTS", "10")
 )  # Minimum requests before alerting
 
 # Alert delivery configuration
-SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-ALERT_EMAIL_TO = os.getenv("ALERT_EMAIL_TO")
-ALERT_EMAIL_FROM = os.getenv("ALERT_EMAIL_FROM", SMTP_USER)
+SMTP_HOST = ENV.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(ENV.get("SMTP_PORT", "587"))
+SMTP_USER = ENV.get("SMTP_USER")
+SMTP_PASSWORD = ENV.get("SMTP_PASSWORD")
+ALERT_EMAIL_TO = ENV.get("ALERT_EMAIL_TO")
+ALERT_EMAIL_FROM = ENV.get("ALERT_EMAIL_FROM", SMTP_USER)
+
+SLACK_WEBHOOK_URL = ENV.get("SLACK_WEBHOOK_URL")
 
-SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+EMAIL_CONFIGURED = all([SMTP_USER, SMTP_PASSWORD, ALERT_EMAIL_TO])
+SLACK_CONFIGURED = bool(SLACK_WEBHOOK_URL)
+
+# Reconnect check for a cached SMTP session idle longer than this (seconds)
+SMTP_IDLE_SECONDS = 30
 
 # Alert cooldown (prevent alert spam)
-ALERT_COOLDOWN_HOURS = int(os.getenv("ALERT_COOLDOWN_HOURS", "1"))
-last_alert_times: Dict[str, datetime] = {}
+ALERT_COOLDOWN_HOURS = int(ENV.get("ALERT_COOLDOWN_HOURS", "1"))
+# Alert type -> time.monotonic() of the last delivery (immune to wall-clock jumps)
+last_alert_times: Dict[str, float] = {}
+
+
+def _reverse_lines(path: Path, block: int = 65536):
+    """Yield the non-empty lines of a file as bytes, last line first."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + tail).split(b"\n")
+            tail = lines.pop(0)  # may continue in the previous block
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if tail.strip():
+            yield tail
+
+
+def _p95(durations: np.ndarray) -> Optional[float]:
+    """95th percentile of successful-request durations, or None below the alert minimum."""
+    if durations.size < MIN_REQUESTS_FOR_ALERT or durations.size == 0:
+        return None
+
+    # Quickselect the same order statistic a full sort would index: O(n)
+    idx = int(durations.size * 0.95)
+    return float(np.partition(durations, idx)[idx])
 
 
 class MetricsAnalyzer:
@@ -54,24 +110,32 @@ class MetricsAnalyzer:
         self.metrics = self._load_recent_metrics()
 
     def _load_recent_metrics(self) -> List[Dict]:
-        """Load metrics from the last N hours."""
+        """Load metrics from the last N hours, reading the file newest-first."""
         if not METRICS_FILE.exists():
             return []
 
         cutoff_time = datetime.utcnow() - timedelta(hours=self.lookback_hours)
+        # ISO-8601 timestamps compare correctly as strings; no per-line parsing needed
+        cutoff = cutoff_time.isoformat()
+        stop = (cutoff_time - ORDER_SLACK).isoformat()
         metrics = []
 
         try:
-            with open(METRICS_FILE, "r", encoding="utf-8") as f:
-                for line in f:
-                    if line.strip():
-                        record = json.loads(line)
-                        timestamp = datetime.fromisoformat(record["timestamp"])
-                        if timestamp >= cutoff_time:
-                            metrics.append(record)
+            for line in _reverse_lines(METRICS_FILE):
+                # The newest line may still be mid-write; skip it and any bad rows
+                try:
+                    record = _loads(line)
+                    timestamp = record["timestamp"]
+                    if timestamp >= cutoff:
+                        metrics.append(record)
+                    elif timestamp < stop:
+                        break
+                except (ValueError, KeyError, TypeError):
+                    continue
         except Exception as e:
-            logger.error(f"Error loading metrics: {e}")
+            logger.error("Error loading metrics: %s", e)
 
+        metrics.reverse()  # back to chronological order
         return metrics
 
     def calculate_error_rate(self) -> Optional[float]:
@@ -86,18 +150,16 @@ class MetricsAnalyzer:
 
     def calculate_p95_latency(self) -> Optional[float]:
         """Calculate 95th percentile latency for successful requests."""
-        successful = [
-            m["duration_seconds"]
-            for m in self.metrics
-            if m.get("success", True) and "duration_seconds" in m
-        ]
-
-        if len(successful) < MIN_REQUESTS_FOR_ALERT:
-            return None
+        successful = np.fromiter(
+            (
+                m["duration_seconds"]
+                for m in self.metrics
+                if m.get("success", True) and "duration_seconds" in m
+            ),
+            dtype=np.float64,
+        )
 
-        successful.sort()
-        idx = int(len(successful) * 0.95)
-        return successful[idx] if successful else None
+        return _p95(successful)
 
     def calculate_hourly_cost(self) -> Optional[float]:
         """Calculate cost per hour."""
@@ -109,6 +171,44 @@ class MetricsAnalyzer:
 
         return total_cost / hours
 
+    def summary(self, error_limit: int = 5) -> Dict:
+        """
+        Compute error rate, p95 latency, hourly cost and recent errors in one
+        pass over the metrics. Values match the individual calculate_* methods.
+        """
+        total = len(self.metrics)
+        failures = 0
+        total_cost = 0.0
+        durations = array("d")
+        recent = []  # min-heap of (timestamp, seq, record) holding the newest errors
+
+        for seq, m in enumerate(self.metrics):
+            total_cost += m.get("cost_usd", 0)
+            if m.get("success", True):
+                if "duration_seconds" in m:
+                    durations.append(m["duration_seconds"])
+            else:
+                failures += 1
+                entry = (m["timestamp"], seq, m)
+                if len(recent) < error_limit:
+                    heapq.heappush(recent, entry)
+                elif entry > recent[0]:
+                    heapq.heapreplace(recent, entry)
+
+        hours = self.lookback_hours if self.lookback_hours > 0 else 1
+        return {
+            "total_requests": total,
+            "successful_requests": total - failures,
+            "error_rate": (
+                None
+                if total < MIN_REQUESTS_FOR_ALERT
+                else (failures / total) * 100 if total > 0 else 0.0
+            ),
+            "p95_latency": _p95(np.frombuffer(durations, dtype=np.float64)),
+            "hourly_cost": total_cost / hours if total else None,
+            "recent_errors": [m for _, _, m in sorted(recent, reverse=True)],
+        }
+
     def get_recent_errors(self, limit: int = 5) -> List[Dict]:
         """Get recent error details."""
         errors = [m for m in self.metrics if not m.get("success", True)]
@@ -116,22 +216,79 @@ class MetricsAnalyzer:
         return errors[:limit]
 
 
+# Keep-alive session for webhook calls, created on first use
+_HTTP: Optional[requests.Session] = None
+
+
+def _http_session() -> requests.Session:
+    """Return the shared pooled HTTP session, creating it lazily."""
+    global _HTTP
+    if _HTTP is None:
+        session = requests.Session()
+        session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=8,
+                max_retries=Retry(total=2, backoff_factor=0.3),
+            ),
+        )
+        _HTTP = session
+    return _HTTP
+
+
 class AlertSender:
     """Send alerts via email or Slack."""
 
     @staticmethod
     def can_send_alert(alert_type: str) -> bool:
         """Check if enough time has passed since last alert of this type."""
-        if alert_type not in last_alert_times:
-            return True
-
-        time_since_last = datetime.utcnow() - last_alert_times[alert_type]
-        return time_since_last.total_seconds() >= (ALERT_COOLDOWN_HOURS * 3600)
-
-    @staticmethod
-    def send_email(subject: str, body: str) -> bool:
-        """Send email alert."""
-        if not all([SMTP_USER, SMTP_PASSWORD, ALERT_EMAIL_TO]):
+        last = last_alert_times.get(alert_type, float("-inf"))
+        return time.monotonic() - last >= ALERT_COOLDOWN_HOURS * 3600
+
+    def __init__(self):
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_last_used = 0.0
+        self._in_context = False
+
+    def __enter__(self) -> "AlertSender":
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._in_context = False
+        self.close()
+
+    def close(self) -> None:
+        """Close the cached SMTP connection, if any."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _smtp_connection(self) -> smtplib.SMTP:
+        """Return a logged-in SMTP connection, reusing the cached one while alive."""
+        if (
+            self._smtp is not None
+            and time.monotonic() - self._smtp_last_used > SMTP_IDLE_SECONDS
+        ):
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._smtp = None
+
+        if self._smtp is None:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            self._smtp = server
+        return self._smtp
+
+    def send_email(self, subject: str, body: str) -> bool:
+        """Send email alert (one SMTP session per `with AlertSender()` block)."""
+        if not EMAIL_CONFIGURED:
             logger.warning("Email alerting not configured (missing SMTP credentials)")
             return False
 
@@ -143,22 +300,29 @@ class AlertSender:
 
             msg.attach(MIMEText(body, "html"))
 
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                server.starttls()
-                server.login(SMTP_USER, SMTP_PASSWORD)
-                server.send_message(msg)
+            try:
+                self._smtp_connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped the cached session; reconnect once
+                self._smtp = None
+                self._smtp_connection().send_message(msg)
+            self._smtp_last_used = time.monotonic()
 
-            logger.info(f"Email alert sent: {subject}")
+            logger.info("Email alert sent: %s", subject)
             return True
 
         except Exception as e:
-            logger.error(f"Failed to send email alert: {e}")
+            logger.error("Failed to send email alert: %s", e)
+            self.close()
             return False
+        finally:
+            if not self._in_context:
+                self.close()
 
     @staticmethod
     def send_slack(message: str) -> bool:
         """Send Slack alert via webhook."""
-        if not SLACK_WEBHOOK_URL:
+        if not SLACK_CONFIGURED:
             logger.warning("Slack alerting not configured (missing webhook URL)")
             return False
 
@@ -169,74 +333,46 @@ class AlertSender:
                 "icon_emoji": ":robot_face:",
             }
 
-            response = requests.post(SLACK_WEBHOOK_URL, json=payload, timeout=10)
+            response = _http_session().post(SLACK_WEBHOOK_URL, json=payload, timeout=10)
             response.raise_for_status()
 
             logger.info("Slack alert sent")
             return True
 
         except Exception as e:
-            logger.error(f"Failed to send Slack alert: {e}")
+            logger.error("Failed to send Slack alert: %s", e)
             return False
 
 
-def check_and_alert():
-    """Main monitoring loop: check metrics and send alerts if needed."""
-    logger.info("Starting monitoring check...")
-
-    analyzer = MetricsAnalyzer(lookback_hours=1)
-    sender = AlertSender()
-    alerts_sent = []
-
-    # Check error rate
-    error_rate = analyzer.calculate_error_rate()
-    if error_rate is not None and error_rate > ERROR_RATE_THRESHOLD:
-        alert_type = "high_error_rate"
-        if sender.can_send_alert(alert_type):
-            recent_errors = analyzer.get_recent_errors()
-            error_details = "\n".join(
-                [
-                    f"- {e['timestamp']}: {e.get('error_type', 'Unknown')} - {e.get('error_message', '')[:100]}"
-                    for e in recent_errors
-                ]
-            )
+# Alert message templates, filled with str.format_map when an alert fires
+COST_PROJECTION_MULTIPLIERS = (24, 24 * 30)  # hours per day, hours per month
 
-            subject = f"High Error Rate: {error_rate:.1f}%"
-            body = f"""
+_ERROR_SUBJECT_TMPL = "High Error Rate: {error_rate:.1f}%"
+_ERROR_HTML_TMPL = """
             <h2>⚠️ High Error Rate Detected</h2>
-            <p><strong>Current Error Rate:</strong> {error_rate:.1f}% (threshold: {ERROR_RATE_THRESHOLD}%)</p>
+            <p><strong>Current Error Rate:</strong> {error_rate:.1f}% (threshold: {threshold}%)</p>
             <p><strong>Time Window:</strong> Last 1 hour</p>
-            <p><strong>Total Requests:</strong> {len(analyzer.metrics)}</p>
-            
+            <p><strong>Total Requests:</strong> {total_requests}</p>
+
             <h3>Recent Errors:</h3>
             <pre>{error_details}</pre>
-            
+
             <p>Check the dashboard for more details.</p>
             """
-
-            slack_msg = (
-                f"⚠️ *High Error Rate: {error_rate:.1f}%* (threshold: {ERROR_RATE_THRESHOLD}%)\n"
-                f"Time window: Last 1 hour\n"
-                f"Total requests: {len(analyzer.metrics)}\n\n"
-                f"Recent errors:\n{error_details}"
-            )
-
-            if sender.send_email(subject, body) or sender.send_slack(slack_msg):
-                last_alert_times[alert_type] = datetime.utcnow()
-                alerts_sent.append(alert_type)
-
-    # Check latency
-    p95_latency = analyzer.calculate_p95_latency()
-    if p95_latency is not None and p95_latency > LATENCY_P95_THRESHOLD:
-        alert_type = "high_latency"
-        if sender.can_send_alert(alert_type):
-            subject = f"High Latency: p95={p95_latency:.2f}s"
-            body = f"""
+_ERROR_SLACK_TMPL = (
+    "⚠️ *High Error Rate: {error_rate:.1f}%* (threshold: {threshold}%)\n"
+    "Time window: Last 1 hour\n"
+    "Total requests: {total_requests}\n\n"
+    "Recent errors:\n{error_details}"
+)
+
+_LATENCY_SUBJECT_TMPL = "High Latency: p95={p95_latency:.2f}s"
+_LATENCY_HTML_TMPL = """
             <h2>🐌 High Latency Detected</h2>
-            <p><strong>P95 Latency:</strong> {p95_latency:.2f}s (threshold: {LATENCY_P95_THRESHOLD}s)</p>
+            <p><strong>P95 Latency:</strong> {p95_latency:.2f}s (threshold: {threshold}s)</p>
             <p><strong>Time Window:</strong> Last 1 hour</p>
-            <p><strong>Successful Requests:</strong> {len([m for m in analyzer.metrics if m.get('success', True)])}</p>
-            
+            <p><strong>Successful Requests:</strong> {successful_requests}</p>
+
             <p>Response times are slower than expected. Check for:</p>
             <ul>
                 <li>API performance issues</li>
@@ -244,29 +380,19 @@ def check_and_alert():
                 <li>Complex prompts requiring more processing</li>
             </ul>
             """
-
-            slack_msg = (
-                f"🐌 *High Latency: p95={p95_latency:.2f}s* (threshold: {LATENCY_P95_THRESHOLD}s)\n"
-                f"Time window: Last 1 hour\n"
-                f"Check dashboard for details."
-            )
-
-            if sender.send_email(subject, body) or sender.send_slack(slack_msg):
-                last_alert_times[alert_type] = datetime.utcnow()
-                alerts_sent.append(alert_type)
-
-    # Check cost
-    hourly_cost = analyzer.calculate_hourly_cost()
-    if hourly_cost is not None and hourly_cost > COST_PER_HOUR_THRESHOLD:
-        alert_type = "high_cost"
-        if sender.can_send_alert(alert_type):
-            subject = f"High Cost: ${hourly_cost:.4f}/hour"
-            body = f"""
+_LATENCY_SLACK_TMPL = (
+    "🐌 *High Latency: p95={p95_latency:.2f}s* (threshold: {threshold}s)\n"
+    "Time window: Last 1 hour\n"
+    "Check dashboard for details."
+)
+
+_COST_SUBJECT_TMPL = "High Cost: ${hourly_cost:.4f}/hour"
+_COST_HTML_TMPL = """
             <h2>💰 High Cost Detected</h2>
-            <p><strong>Hourly Cost:</strong> ${hourly_cost:.4f} (threshold: ${COST_PER_HOUR_THRESHOLD})</p>
-            <p><strong>Projected Daily:</strong> ${hourly_cost * 24:.2f}</p>
-            <p><strong>Projected Monthly:</strong> ${hourly_cost * 24 * 30:.2f}</p>
-            
+            <p><strong>Hourly Cost:</strong> ${hourly_cost:.4f} (threshold: ${threshold})</p>
+            <p><strong>Projected Daily:</strong> ${daily_cost:.2f}</p>
+            <p><strong>Projected Monthly:</strong> ${monthly_cost:.2f}</p>
+
             <p>Consider:</p>
             <ul>
                 <li>Reviewing usage patterns</li>
@@ -274,20 +400,129 @@ def check_and_alert():
                 <li>Implementing rate limiting</li>
             </ul>
             """
+_COST_SLACK_TMPL = (
+    "💰 *High Cost: ${hourly_cost:.4f}/hour* (threshold: ${threshold})\n"
+    "Projected monthly: ${monthly_cost:.2f}\n"
+    "Review usage patterns in dashboard."
+)
+
+
+def check_and_alert():
+    """Main monitoring loop: check metrics and send alerts if needed."""
+    logger.info("Starting monitoring check...")
+
+    analyzer = MetricsAnalyzer(lookback_hours=1)
+    stats = analyzer.summary()
+    alerts_sent = []
+
+    # Alerts due this tick: (alert_type, subject, html, slack templates, fields);
+    # templates are only rendered for channels that are configured
+    pending = []
+
+    # Check error rate
+    error_rate = stats["error_rate"]
+    alert_type = "high_error_rate"
+    if (
+        error_rate is not None
+        and error_rate > ERROR_RATE_THRESHOLD
+        and AlertSender.can_send_alert(alert_type)
+    ):
+        error_details = "\n".join(
+            [
+                f"- {e['timestamp']}: {e.get('error_type', 'Unknown')} - {e.get('error_message', '')[:100]}"
+                for e in stats["recent_errors"]
+            ]
+        )
+        fields = {
+            "error_rate": error_rate,
+            "threshold": ERROR_RATE_THRESHOLD,
+            "total_requests": stats["total_requests"],
+            "error_details": error_details,
+        }
+        pending.append(
+            (
+                alert_type,
+                _ERROR_SUBJECT_TMPL,
+                _ERROR_HTML_TMPL,
+                _ERROR_SLACK_TMPL,
+                fields,
+            )
+        )
 
-            slack_msg = (
-                f"💰 *High Cost: ${hourly_cost:.4f}/hour* (threshold: ${COST_PER_HOUR_THRESHOLD})\n"
-                f"Projected monthly: ${hourly_cost * 24 * 30:.2f}\n"
-                f"Review usage patterns in dashboard."
+    # Check latency
+    p95_latency = stats["p95_latency"]
+    alert_type = "high_latency"
+    if (
+        p95_latency is not None
+        and p95_latency > LATENCY_P95_THRESHOLD
+        and AlertSender.can_send_alert(alert_type)
+    ):
+        fields = {
+            "p95_latency": p95_latency,
+            "threshold": LATENCY_P95_THRESHOLD,
+            "successful_requests": stats["successful_requests"],
+        }
+        pending.append(
+            (
+                alert_type,
+                _LATENCY_SUBJECT_TMPL,
+                _LATENCY_HTML_TMPL,
+                _LATENCY_SLACK_TMPL,
+                fields,
             )
+        )
 
-            if sender.send_email(subject, body) or sender.send_slack(slack_msg):
-                last_alert_times[alert_type] = datetime.utcnow()
+    # Check cost
+    hourly_cost = stats["hourly_cost"]
+    alert_type = "high_cost"
+    if (
+        hourly_cost is not None
+        and hourly_cost > COST_PER_HOUR_THRESHOLD
+        and AlertSender.can_send_alert(alert_type)
+    ):
+        per_day, per_month = COST_PROJECTION_MULTIPLIERS
+        fields = {
+            "hourly_cost": hourly_cost,
+            "threshold": COST_PER_HOUR_THRESHOLD,
+            "daily_cost": hourly_cost * per_day,
+            "monthly_cost": hourly_cost * per_month,
+        }
+        pending.append(
+            (
+                alert_type,
+                _COST_SUBJECT_TMPL,
+                _COST_HTML_TMPL,
+                _COST_SLACK_TMPL,
+                fields,
+            )
+        )
+
+    # Deliver everything due in one email, falling back to one Slack post
+    if pending and not (EMAIL_CONFIGURED or SLACK_CONFIGURED):
+        logger.warning(
+            "No alert channel configured; %d alert(s) not delivered", len(pending)
+        )
+    elif pending:
+        delivered = False
+        if EMAIL_CONFIGURED:
+            subject = "; ".join(p[1].format_map(p[4]) for p in pending)
+            body = "<hr>".join(p[2].format_map(p[4]) for p in pending)
+            with AlertSender() as sender:
+                delivered = sender.send_email(subject, body)
+        if not delivered and SLACK_CONFIGURED:
+            slack_msg = "\n\n---\n\n".join(p[3].format_map(p[4]) for p in pending)
+            delivered = AlertSender.send_slack(slack_msg)
+
+        if delivered:
+            now = time.monotonic()
+            for alert_type, *_ in pending:
+                last_alert_times[alert_type] = now
                 alerts_sent.append(alert_type)
 
     # Log summary
     if alerts_sent:
-        logger.warning(f"Alerts sent: {', '.join(alerts_sent)}")
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning("Alerts sent: %s", ", ".join(alerts_sent))
     else:
         logger.info("All metrics within normal ranges")
 
@@ -298,7 +533,7 @@ def check_and_alert():
             "error_rate": error_rate,
             "p95_latency": p95_latency,
             "hourly_cost": hourly_cost,
-            "total_requests": len(analyzer.metrics),
+            "total_requests": stats["total_requests"],
         },
     }
 
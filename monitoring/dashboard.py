@@ -3,13 +3,27 @@ Monitoring Dashboard for Streamlit Chatbot
 Visualizes metrics from request logs: cost, latency, errors, token usage
 """
 
+import hashlib
 import json
+import os
+import threading
 import streamlit as st
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Faster JSONL parsing (optional)
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 # Configure page
 st.set_page_config(
@@ -22,46 +36,234 @@ st.set_page_config(
 # Paths
 METRICS_FILE = Path("../metrics/requests.jsonl")
 FEEDBACK_FILE = Path("../metrics/feedback.jsonl")
+# Rotated daily logs (requests-YYYY-MM-DD.jsonl) next to METRICS_FILE
+SHARD_GLOB = f"{METRICS_FILE.stem}-*.jsonl"
+# Parsed copy of METRICS_FILE so new sessions skip JSON parsing
+SNAPSHOT_FILE = METRICS_FILE.with_suffix(".parquet")
 
+# Records parsed into dicts before being packed into a DataFrame
+CHUNK_ROWS = 50_000
 
-def load_metrics():
-    """Load metrics from JSONL file."""
-    if not METRICS_FILE.exists():
-        return pd.DataFrame()
+HOUR_NS = 3_600_000_000_000
 
-    metrics = []
-    try:
-        with open(METRICS_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    metrics.append(json.loads(line))
+# Bytes before the read offset that must be unchanged for the log to be tailed
+TAIL_DIGEST_BYTES = 4096
 
-        if metrics:
-            df = pd.DataFrame(metrics)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            return df
-    except Exception as e:
-        st.error(f"Error loading metrics: {e}")
-        return pd.DataFrame()
+# Read size for newline counting; bytes.count scans each block in C
+COUNT_BLOCK_BYTES = 1 << 20
 
-    return pd.DataFrame()
+# Points drawn in the latency scatter; larger ranges are sampled down
+MAX_SCATTER_POINTS = 5_000
+
+# Low-cardinality string columns stored as categoricals
+CATEGORY_COLUMNS = ("model", "error_type")
+# High-cardinality text kept in contiguous Arrow buffers, not one object per cell
+STRING_COLUMNS = ("request_id", "error_message")
+
+
+def file_version(path):
+    """Return (mtime, size, inode) for path, used as the cache key for its loader.
+
+    The inode changes when the log is rotated or replaced, even if the new
+    file has already grown to the old size.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return (0.0, 0, 0)
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+
+def tail_digest(path, offset):
+    """Digest of the bytes just before offset; detects a log rewritten in place."""
+    start = max(0, offset - TAIL_DIGEST_BYTES)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return hashlib.blake2b(f.read(offset - start), digest_size=16).hexdigest()
+
+
+def _optimize_dtypes(df):
+    """Shrink a freshly parsed metrics frame in place.
+
+    Cost stays float64: float32 loses precision on sums of micro-dollar values.
+    """
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in STRING_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string[pyarrow]")
+    if "success" in df.columns:
+        df["success"] = df["success"].eq(True)
+    if "duration_seconds" in df.columns:
+        df["duration_seconds"] = df["duration_seconds"].astype("float32")
+    return df
+
+
+def _append_rows(df, new_df):
+    """Concatenate two metrics frames without demoting categoricals to object."""
+    df = df.copy(deep=False)
+    new_df = new_df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and col in new_df.columns:
+            categories = df[col].cat.categories.union(new_df[col].cat.categories)
+            df[col] = df[col].cat.set_categories(categories)
+            new_df[col] = new_df[col].cat.set_categories(categories)
+    return pd.concat([df, new_df], ignore_index=True)
+
+
+def _read_snapshot(size, ino):
+    """Return (offset, df) from the parquet snapshot, or (0, None) if unusable."""
+    try:
+        table = pq.read_table(SNAPSHOT_FILE)
+        metadata = table.schema.metadata
+        offset = int(metadata[b"jsonl_offset"])
+        # Written for another file (rotated or replaced since), or rewritten
+        if offset > size or int(metadata[b"jsonl_ino"]) != ino:
+            return 0, None
+        if metadata[b"jsonl_tail"].decode() != tail_digest(METRICS_FILE, offset):
+            return 0, None
+    except Exception:
+        return 0, None
+    if "hour" not in table.column_names:  # written before the hour column
+        return 0, None
+    # string[pyarrow] columns are stored as large_string; keep them Arrow-backed
+    string_dtype = pd.StringDtype("pyarrow")
+    types = {pa.string(): string_dtype, pa.large_string(): string_dtype}
+    return offset, table.to_pandas(types_mapper=types.get)
+
+
+def _write_snapshot(offset, ino, tail, df):
+    """Persist df with the JSONL byte offset and file identity it covers; best effort."""
+    tmp = SNAPSHOT_FILE.with_suffix(".parquet.tmp")
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"jsonl_offset"] = str(offset).encode()
+        metadata[b"jsonl_ino"] = str(ino).encode()
+        metadata[b"jsonl_tail"] = tail.encode()
+        pq.write_table(table.replace_schema_metadata(metadata), tmp, compression="zstd")
+        os.replace(tmp, SNAPSHOT_FILE)
+    except Exception:
+        # Mixed-type columns or a read-only metrics dir: keep serving from JSONL
+        tmp.unlink(missing_ok=True)
+
+
+def _read_new_rows(path, offset):
+    """Parse complete records past offset; return (new_offset, DataFrame or None)."""
+    frames, batch = [], []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # half-written record; picked up on the next run
+            offset += len(line)
+            if line.strip():
+                batch.append(_loads(line))
+            # Convert in bounded batches so raw dicts never cover the whole log
+            if len(batch) >= CHUNK_ROWS:
+                frames.append(pd.DataFrame(batch))
+                batch = []
+    if batch:
+        frames.append(pd.DataFrame(batch))
+    if not frames:
+        return offset, None
+
+    new_df = pd.concat(frames, ignore_index=True)
+    new_df["timestamp"] = pd.to_datetime(new_df["timestamp"])
+    # Floor to the hour with integer division on the raw nanosecond values
+    ns = new_df["timestamp"].to_numpy(dtype="datetime64[ns]").view("i8")
+    new_df["hour"] = (ns // HOUR_NS * HOUR_NS).view("datetime64[ns]")
+    return offset, _optimize_dtypes(new_df)
+
+
+@st.cache_resource
+def _metrics_cache():
+    """Tail-read state shared by every session; held by reference, never hashed."""
+    return {
+        "offset": 0,
+        "tail": None,
+        "version": None,
+        "df": None,
+        "lock": threading.Lock(),
+    }
+
+
+def load_metrics(mtime=0.0, size=0, ino=0):
+    """Load metrics from JSONL file.
+
+    requests.jsonl is append-only, so each rerun parses only the bytes past
+    the last offset read by this process. A log with another inode (rotated
+    or replaced), one shorter than that offset, or one whose bytes before it
+    changed is re-read from the start. The first load starts from the
+    parquet snapshot and rewrites it once caught up with the log.
+
+    The returned frame is shared across sessions and must not be modified.
+    """
+    state = _metrics_cache()
+    version = (mtime, size, ino)
+    # Unchanged log: serve the shared frame without opening the file at all
+    df = state["df"]
+    if df is not None and version == state["version"]:
+        return df
 
+    if not METRICS_FILE.exists():
+        return pd.DataFrame()
 
-def load_feedback():
-    """Load feedback from JSONL file."""
+    with state["lock"]:
+        try:
+            cold = (
+                state["df"] is None
+                or state["version"] is None
+                or ino != state["version"][2]
+                or size < state["offset"]
+                or tail_digest(METRICS_FILE, state["offset"]) != state["tail"]
+            )
+            if cold:
+                state["offset"], state["df"] = _read_snapshot(size, ino)
+
+            offset, new_df = _read_new_rows(METRICS_FILE, state["offset"])
+            if new_df is not None:
+                if state["df"] is None:
+                    df = new_df
+                else:
+                    df = _append_rows(state["df"], new_df)
+                # Keep rows in time order so range filters can binary-search
+                if not df["timestamp"].is_monotonic_increasing:
+                    df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+                state["df"] = df
+            state["offset"] = offset
+            state["tail"] = tail_digest(METRICS_FILE, offset)
+            state["version"] = version
+            if cold and new_df is not None:
+                _write_snapshot(offset, ino, state["tail"], state["df"])
+        except Exception as e:
+            st.error(f"Error loading metrics: {e}")
+            return pd.DataFrame()
+
+        return state["df"] if state["df"] is not None else pd.DataFrame()
+
+
+@st.cache_data(show_spinner=False)
+def load_feedback(mtime=0.0, size=0, ino=0):
+    """Load feedback from JSONL file (cached by file version like load_metrics)."""
     if not FEEDBACK_FILE.exists():
         return pd.DataFrame()
 
     feedback = []
     try:
-        with open(FEEDBACK_FILE, "r", encoding="utf-8") as f:
+        with open(FEEDBACK_FILE, "rb") as f:
             for line in f:
                 if line.strip():
-                    feedback.append(json.loads(line))
+                    feedback.append(_loads(line))
 
         if feedback:
             df = pd.DataFrame(feedback)
             df["timestamp"] = pd.to_datetime(df["timestamp"])
+            df["rating"] = df["rating"].astype("category")
+            # Time-ordered so the range filter can binary-search
+            if not df["timestamp"].is_monotonic_increasing:
+                df = df.sort_values("timestamp", kind="stable", ignore_index=True)
             return df
     except Exception as e:
         st.error(f"Error loading feedback: {e}")
@@ -70,13 +272,156 @@ def load_feedback():
     return pd.DataFrame()
 
 
+def metric_shards(start_time=None):
+    """Dated metrics shards, oldest first, skipping days before start_time."""
+    shards = []
+    for path in sorted(METRICS_FILE.parent.glob(SHARD_GLOB)):
+        try:
+            day = datetime.strptime(
+                path.stem[len(METRICS_FILE.stem) + 1 :], "%Y-%m-%d"
+            ).date()
+        except ValueError:
+            continue
+        if start_time is None or day >= start_time.date():
+            shards.append(path)
+    return shards
+
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def load_shard(path, mtime=0.0, size=0, ino=0):
+    """Parse one rotated shard; keyed by its version like load_metrics."""
+    try:
+        _, df = _read_new_rows(path, 0)
+    except Exception as e:
+        st.error(f"Error loading metrics shard {path.name}: {e}")
+        return None
+    return df
+
+
+def total_request_count():
+    """Count logged requests by counting newlines, without parsing the log."""
+    count = 0
+    for path in [*metric_shards(), METRICS_FILE]:
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(COUNT_BLOCK_BYTES), b""):
+                    count += block.count(b"\n")
+        except OSError:
+            continue
+    return count
+
+
 def calculate_percentile(data, percentile):
-    """Calculate percentile value."""
+    """Calculate percentile value.
+
+    Pass a list of percentiles to get all of them from a single quantile call.
+    """
+    if isinstance(percentile, (list, tuple)):
+        if len(data) == 0:
+            return [0] * len(percentile)
+        return data.quantile([p / 100 for p in percentile]).tolist()
     if len(data) == 0:
         return 0
     return data.quantile(percentile / 100)
 
 
+@st.cache_resource(max_entries=8, show_spinner=False)
+def prepare_view(mtime, size, ino, start_time):
+    """Filter metrics to start_time onwards and precompute every aggregate.
+
+    Keyed by file version and range start, so reruns that change neither are
+    a dict lookup. Like load_metrics, the result is shared and read-only.
+    """
+    df = load_metrics(mtime, size, ino)
+
+    # Only shards dated inside the range are read; rotated days never change,
+    # so the live log's version is enough to key this view
+    frames = [
+        load_shard(path, *file_version(path)) for path in metric_shards(start_time)
+    ]
+    frames = [frame for frame in frames if frame is not None]
+    if frames:
+        if not df.empty:
+            frames.append(df)
+        df = frames[0]
+        for frame in frames[1:]:
+            df = _append_rows(df, frame)
+        if not df["timestamp"].is_monotonic_increasing:
+            df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+
+    # df is sorted by timestamp, so the range start is a binary search away
+    df_filtered = df.iloc[df["timestamp"].searchsorted(start_time) :]
+
+    # Split on success once; every aggregate below reuses these subsets
+    succeeded = (df_filtered["success"] == True).to_numpy()
+    success_df = df_filtered[succeeded]
+    error_df = df_filtered[~succeeded]
+
+    view = {
+        "df": df_filtered,
+        "success_df": success_df,
+        "total_requests": len(df_filtered),
+        "successful_requests": int(succeeded.sum()),
+        "failed_requests": len(df_filtered) - int(succeeded.sum()),
+        "total_cost": df_filtered["cost_usd"].sum(),
+        "avg_duration": df_filtered["duration_seconds"].mean(),
+        "percentiles": calculate_percentile(
+            success_df["duration_seconds"], [50, 95, 99]
+        ),
+        "total_tokens": df_filtered["total_tokens"].sum(),
+        "avg_prompt_tokens": success_df["prompt_tokens"].mean(),
+        "avg_completion_tokens": success_df["completion_tokens"].mean(),
+    }
+
+    # Already time-ordered: a running sum over the raw column, no sort or align
+    view["cumulative_cost"] = np.nancumsum(
+        df_filtered["cost_usd"].to_numpy(dtype=np.float64)
+    )
+
+    error_counts = error_df["error_type"].value_counts()
+    view["error_counts"] = error_counts[error_counts > 0]  # unused categories
+
+    # Rows are time-ordered, so sort=False already yields hours in order
+    hourly_stats = (
+        df_filtered.groupby("hour", sort=False)["success"]
+        .agg(total="size", successful="sum")
+        .reset_index()
+    )
+    hourly_stats["error_rate"] = (
+        1 - hourly_stats["successful"] / hourly_stats["total"]
+    ) * 100
+    view["hourly_stats"] = hourly_stats
+
+    # Only failed requests carry error_message, so skip when there are none
+    view["recent_errors"] = None
+    if not error_df.empty:
+        view["recent_errors"] = error_df.nlargest(10, "timestamp")[
+            ["timestamp", "error_type", "error_message", "model", "temperature"]
+        ]
+
+    view["model_stats"] = None
+    if "model" in df_filtered.columns:
+        # Built-in reducers only (success is bool, so its mean is the rate)
+        model_stats = (
+            df_filtered.groupby("model", observed=True)
+            .agg(
+                **{
+                    "Requests": ("request_id", "count"),
+                    "Avg Duration (s)": ("duration_seconds", "mean"),
+                    "Total Cost ($)": ("cost_usd", "sum"),
+                    "Total Tokens": ("total_tokens", "sum"),
+                    "Success Rate (%)": ("success", "mean"),
+                }
+            )
+            .reset_index()
+            .rename(columns={"model": "Model"})
+        )
+        model_stats["Success Rate (%)"] *= 100
+        view["model_stats"] = model_stats
+
+    return view
+
+
 # Header
 st.title("📊 Chatbot Monitoring Dashboard")
 st.caption("Real-time metrics and analytics for your LiteLLM-powered chatbot")
@@ -99,26 +444,28 @@ with st.sidebar:
     st.caption("Dashboard auto-refreshes on page reload")
 
 # Load data
-df = load_metrics()
-feedback_df = load_feedback()
+metrics_version = file_version(METRICS_FILE)
+df = load_metrics(*metrics_version)
 
-if df.empty:
+if df.empty and not metric_shards():
     st.warning("No metrics data found. Start using the chatbot to generate metrics!")
     st.info(f"Metrics will be stored in: {METRICS_FILE.absolute()}")
     st.stop()
 
-# Apply time filter
-now = datetime.now()
+# Apply time filter (minute resolution so prepare_view is reused across reruns)
+now = datetime.now().replace(second=0, microsecond=0)
 time_filters = {
     "Last Hour": now - timedelta(hours=1),
     "Last 24 Hours": now - timedelta(days=1),
     "Last 7 Days": now - timedelta(days=7),
     "Last 30 Days": now - timedelta(days=30),
-    "All Time": df["timestamp"].min(),
+    "All Time": pd.Timestamp.min,
 }
 
 start_time = time_filters[time_range]
-df_filtered = df[df["timestamp"] >= start_time].copy()
+view = prepare_view(*metrics_version, start_time)
+df_filtered = view["df"]
+success_df = view["success_df"]
 
 if df_filtered.empty:
     st.warning(f"No data in selected time range: {time_range}")
@@ -129,11 +476,11 @@ st.header("📈 Key Metrics")
 
 col1, col2, col3, col4, col5 = st.columns(5)
 
-total_requests = len(df_filtered)
-successful_requests = len(df_filtered[df_filtered["success"] == True])
-failed_requests = len(df_filtered[df_filtered["success"] == False])
+total_requests = view["total_requests"]
+successful_requests = view["successful_requests"]
+failed_requests = view["failed_requests"]
 success_rate = (successful_requests / total_requests * 100) if total_requests > 0 else 0
-total_cost = df_filtered["cost_usd"].sum()
+total_cost = view["total_cost"]
 
 with col1:
     st.metric("Total Requests", f"{total_requests:,}")
@@ -148,7 +495,7 @@ with col4:
     st.metric("Total Cost", f"${total_cost:.4f}")
 
 with col5:
-    avg_duration = df_filtered["duration_seconds"].mean()
+    avg_duration = view["avg_duration"]
     st.metric("Avg Duration", f"{avg_duration:.2f}s")
 
 st.divider()
@@ -160,35 +507,38 @@ col1, col2 = st.columns(2)
 
 with col1:
     # Latency percentiles
-    success_df = df_filtered[df_filtered["success"] == True]
-
     if not success_df.empty:
-        p50 = calculate_percentile(success_df["duration_seconds"], 50)
-        p95 = calculate_percentile(success_df["duration_seconds"], 95)
-        p99 = calculate_percentile(success_df["duration_seconds"], 99)
-
-        percentile_data = pd.DataFrame(
-            {
-                "Percentile": ["p50 (median)", "p95", "p99"],
-                "Duration (seconds)": [p50, p95, p99],
-            }
+        p50, p95, p99 = view["percentiles"]
+
+        # Three bars: build the trace directly rather than via a DataFrame
+        fig = go.Figure(
+            go.Bar(
+                x=["p50 (median)", "p95", "p99"],
+                y=[p50, p95, p99],
+                marker=dict(
+                    color=[p50, p95, p99],
+                    colorscale="Viridis",
+                    showscale=True,
+                    colorbar=dict(title="Duration (seconds)"),
+                ),
+            )
         )
-
-        fig = px.bar(
-            percentile_data,
-            x="Percentile",
-            y="Duration (seconds)",
+        fig.update_layout(
             title="Response Time Percentiles",
-            color="Duration (seconds)",
-            color_continuous_scale="Viridis",
+            xaxis_title="Percentile",
+            yaxis_title="Duration (seconds)",
         )
         st.plotly_chart(fig, use_container_width=True)
 
 with col2:
     # Latency over time
     if not success_df.empty:
+        # Sample large ranges: point count drives payload size and LOWESS cost
+        plot_df = success_df
+        if len(plot_df) > MAX_SCATTER_POINTS:
+            plot_df = plot_df.sample(MAX_SCATTER_POINTS, random_state=0).sort_index()
         fig = px.scatter(
-            success_df,
+            plot_df,
             x="timestamp",
             y="duration_seconds",
             title="Response Time Over Time",
@@ -207,15 +557,17 @@ col1, col2 = st.columns(2)
 
 with col1:
     # Cost over time (cumulative)
-    df_filtered_sorted = df_filtered.sort_values("timestamp")
-    df_filtered_sorted["cumulative_cost"] = df_filtered_sorted["cost_usd"].cumsum()
-
-    fig = px.line(
-        df_filtered_sorted,
-        x="timestamp",
-        y="cumulative_cost",
+    fig = go.Figure(
+        go.Scatter(
+            x=df_filtered["timestamp"].to_numpy(),
+            y=view["cumulative_cost"],
+            mode="lines",
+        )
+    )
+    fig.update_layout(
         title="Cumulative Cost Over Time",
-        labels={"cumulative_cost": "Total Cost (USD)", "timestamp": "Time"},
+        xaxis_title="Time",
+        yaxis_title="Total Cost (USD)",
     )
     st.plotly_chart(fig, use_container_width=True)
 
@@ -234,19 +586,15 @@ with col2:
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    total_tokens = df_filtered["total_tokens"].sum()
+    total_tokens = view["total_tokens"]
     st.metric("Total Tokens", f"{total_tokens:,}")
 
 with col2:
-    avg_prompt_tokens = df_filtered[df_filtered["success"] == True][
-        "prompt_tokens"
-    ].mean()
+    avg_prompt_tokens = view["avg_prompt_tokens"]
     st.metric("Avg Input Tokens", f"{avg_prompt_tokens:.0f}")
 
 with col3:
-    avg_completion_tokens = df_filtered[df_filtered["success"] == True][
-        "completion_tokens"
-    ].mean()
+    avg_completion_tokens = view["avg_completion_tokens"]
     st.metric("Avg Output Tokens", f"{avg_completion_tokens:.0f}")
 
 st.divider()
@@ -259,31 +607,18 @@ if failed_requests > 0:
 
     with col1:
         # Error types distribution
-        error_df = df_filtered[df_filtered["success"] == False]
-        error_counts = error_df["error_type"].value_counts()
+        error_counts = view["error_counts"]
 
-        fig = px.pie(
-            values=error_counts.values,
-            names=error_counts.index,
-            title="Error Types Distribution",
+        fig = go.Figure(
+            go.Pie(labels=error_counts.index.astype(str), values=error_counts.values)
         )
+        fig.update_layout(title="Error Types Distribution")
         st.plotly_chart(fig, use_container_width=True)
 
     with col2:
         # Error rate over time
-        df_filtered_sorted["hour"] = df_filtered_sorted["timestamp"].dt.floor("H")
-        hourly_stats = (
-            df_filtered_sorted.groupby("hour")
-            .agg({"success": ["count", "sum"]})
-            .reset_index()
-        )
-        hourly_stats.columns = ["hour", "total", "successful"]
-        hourly_stats["error_rate"] = (
-            1 - hourly_stats["successful"] / hourly_stats["total"]
-        ) * 100
-
         fig = px.line(
-            hourly_stats,
+            view["hourly_stats"],
             x="hour",
             y="error_rate",
             title="Error Rate Over Time (Hourly)",
@@ -293,10 +628,7 @@ if failed_requests > 0:
 
     # Recent errors table
     st.subheader("Recent Errors")
-    recent_errors = error_df.nlargest(10, "timestamp")[
-        ["timestamp", "error_type", "error_message", "model", "temperature"]
-    ]
-    st.dataframe(recent_errors, use_container_width=True)
+    st.dataframe(view["recent_errors"], use_container_width=True)
 else:
     st.success("✅ No errors in selected time range!")
 
@@ -305,8 +637,13 @@ st.divider()
 # Feedback Analysis
 st.header("💬 User Feedback")
 
+# Loaded here rather than up front so an empty metrics log never touches it
+feedback_df = load_feedback(*file_version(FEEDBACK_FILE))
+
 if not feedback_df.empty:
-    feedback_filtered = feedback_df[feedback_df["timestamp"] >= start_time]
+    feedback_filtered = feedback_df.iloc[
+        feedback_df["timestamp"].searchsorted(start_time) :
+    ]
 
     if not feedback_filtered.empty:
         col1, col2, col3 = st.columns(3)
@@ -345,31 +682,8 @@ st.divider()
 # Model Performance
 st.header("🤖 Model Performance")
 
-# Group by model
-if "model" in df_filtered.columns:
-    model_stats = (
-        df_filtered.groupby("model")
-        .agg(
-            {
-                "request_id": "count",
-                "duration_seconds": "mean",
-                "cost_usd": "sum",
-                "total_tokens": "sum",
-                "success": lambda x: (x == True).sum() / len(x) * 100,
-            }
-        )
-        .reset_index()
-    )
-
-    model_stats.columns = [
-        "Model",
-        "Requests",
-        "Avg Duration (s)",
-        "Total Cost ($)",
-        "Total Tokens",
-        "Success Rate (%)",
-    ]
-
+model_stats = view["model_stats"]
+if model_stats is not None:
     st.dataframe(
         model_stats.style.format(
             {
@@ -387,4 +701,4 @@ st.divider()
 st.caption(
     f"Dashboard generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | Data range: {time_range}"
 )
-st.caption(f"Monitoring {len(df)} total requests across all time")
+st.caption(f"Monitoring {total_request_count()} total requests across all time")
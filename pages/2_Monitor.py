@@ -4,6 +4,8 @@ Shows real-time metrics from Langfuse and local JSONL files
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -11,10 +13,20 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import json
 import hashlib
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, Dict, List, Any
 import os
-import base64
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from itertools import islice
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # ====== Configuration ======
 METRICS_DIR = Path("metrics")
@@ -26,12 +38,60 @@ LANGFUSE_ENABLED = os.getenv("ENABLE_LANGFUSE", "true").lower() == "true"
 LANGFUSE_HOST = os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
 LANGFUSE_PUBLIC_KEY = os.getenv("LANGFUSE_PUBLIC_KEY", "")
 LANGFUSE_SECRET_KEY = os.getenv("LANGFUSE_SECRET_KEY", "")
+# Traces per API page, and the most pages fetched for one stats refresh
+LANGFUSE_PAGE_SIZE = 100
+LANGFUSE_MAX_PAGES = int(os.getenv("MONITOR_LANGFUSE_MAX_PAGES", "5"))
 
 # Performance limits
 MAX_LOG_LINES = int(os.getenv("MONITOR_MAX_LOG_LINES", "1000"))
 MAX_CHART_POINTS = int(os.getenv("MONITOR_MAX_CHART_POINTS", "500"))
 LOG_PAGE_SIZE = 100
 
+# Log line format: "timestamp - module - level - message"
+LOG_LINE_RE = re.compile(r"(.*?) - (.*?) - (.*?) - (.*)")
+
+# Cache lifetimes (seconds): Langfuse API responses and local file loads
+LANGFUSE_CACHE_TTL = int(os.getenv("MONITOR_LANGFUSE_CACHE_TTL", "30"))
+FILE_CACHE_TTL = int(os.getenv("MONITOR_FILE_CACHE_TTL", "10"))
+
+# Minimum seconds between manual refreshes; faster clicks don't rerun the page
+MIN_REFRESH_INTERVAL = float(os.getenv("MONITOR_MIN_REFRESH_INTERVAL", "2"))
+
+# Parquet index of requests.jsonl: one part per appended byte range, named
+# part-<start>-<end>.parquet so the indexed offset is stored with the data
+METRICS_INDEX_DIR = METRICS_DIR / "requests_index"
+METRICS_INDEX_MAX_PARTS = 32
+# Bytes before the indexed end that are hashed to detect an in-place rewrite
+METRICS_INDEX_TAIL_BYTES = 4096
+
+# Columns the page reads from requests.jsonl (everything else is dropped on load)
+METRICS_COLUMNS = [
+    "timestamp",
+    "duration_seconds",
+    "success",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "model",
+    "cost_usd",
+    "error_type",
+    "user_message_length",
+]
+# Compact dtypes for those columns; token counts fall back to float32 when missing
+METRICS_DTYPES = {
+    "duration_seconds": "float32",
+    "prompt_tokens": "int32",
+    "completion_tokens": "int32",
+    "total_tokens": "int32",
+    "user_message_length": "int32",
+    "model": "category",
+    "error_type": "category",
+}
+
+# Query length buckets (characters) for the Top Queries chart
+LENGTH_BUCKET_BINS = [0, 50, 100, 200, 500, 1000, 10000]
+LENGTH_BUCKET_LABELS = ["<50", "50-100", "100-200", "200-500", "500-1000", "1000+"]
+
 # Dark mode friendly color palette
 COLORS = {
     "primary": "#3B82F6",  # Blue
@@ -93,6 +153,10 @@ MODEL_COSTS = {
     "gemini/gemini-3-flash": {"input": 0.075, "output": 0.30},
     "gemini/gemini-2-pro": {"input": 0.50, "output": 1.50},
 }
+DEFAULT_MODEL_COSTS = MODEL_COSTS["openai/gemini-3-flash"]
+# Per-direction rate lookups for Series.map
+MODEL_INPUT_COSTS = {model: costs["input"] for model, costs in MODEL_COSTS.items()}
+MODEL_OUTPUT_COSTS = {model: costs["output"] for model, costs in MODEL_COSTS.items()}
 
 # ====== Page Configuration ======
 st.set_page_config(
@@ -148,44 +212,144 @@ def get_labels(lang: str = "en") -> Dict[str, str]:
     return LABELS.get(lang, LABELS["en"])
 
 
+@lru_cache(maxsize=4096)
 def hash_query(query: str) -> str:
-    """Hash query for anonymization"""
-    return hashlib.sha256(query.encode()).hexdigest()[:12]
+    """Hash query for anonymization (12 hex chars; repeated queries hit the cache)"""
+    return hashlib.blake2b(query.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def read_jsonl(path: Path) -> pd.DataFrame:
+    """Parse a JSONL file in one pandas call, or line by line if any line is bad"""
+    return parse_jsonl(path.read_bytes())
+
+
+def parse_jsonl(data: bytes) -> pd.DataFrame:
+    """Parse JSONL bytes in one pandas call, or line by line if any line is bad"""
+    try:
+        return pd.read_json(BytesIO(data), lines=True, dtype=False, convert_dates=False)
+    except ValueError:
+        records = []
+        for line in data.splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return pd.DataFrame(records)
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Positions kept when downsampling evenly spaced points y to n_out with
+    largest-triangle-three-buckets, which keeps spikes a fixed stride drops
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Missing buckets count as zero when choosing points (they still plot as gaps)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    # First and last points are always kept; the rest is split into n_out - 2
+    # buckets, each contributing the point with the largest triangle formed
+    # with the previously kept point and the next bucket's average
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = (hi + next_hi - 1) / 2
+        next_y = y[hi:next_hi].mean()
+        xs = np.arange(lo, hi)
+        area = np.abs(
+            (prev - next_x) * (y[lo:hi] - y[prev]) - (prev - xs) * (next_y - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        keep[i + 1] = prev
+    return keep
+
+
+def lttb_downsample(df: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
+    """Rows of df chosen by LTTB on y, capped at MAX_CHART_POINTS"""
+    return df.iloc[lttb_indices(y.to_numpy(), MAX_CHART_POINTS)]
+
+
+def tail_lines(path: Path, n: int, block_size: int = 65536) -> List[str]:
+    """Return the last n lines of path, reading backwards in blocks from the end"""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        buf = b""
+        # One extra newline guarantees the first kept line is complete
+        while pos > 0 and buf.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    return buf.decode("utf-8", "replace").splitlines()[-n:]
+
+
+def file_mtime_ns(path: Path) -> int:
+    """Modification time used to key file caches (0 if the file is missing)"""
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return 0
 
 
 def get_langfuse_stats(hours: int = 24) -> Optional[Dict[str, Any]]:
     """
     Fetch statistics from Langfuse API
-    Returns aggregated metrics for the specified time range
+    Returns aggregated metrics for the specified time range, reusing the
+    previous response for up to LANGFUSE_CACHE_TTL seconds
     """
     if not LANGFUSE_ENABLED or not LANGFUSE_PUBLIC_KEY or not LANGFUSE_SECRET_KEY:
         return None
 
-    try:
-        # Create basic auth header
-        auth_string = f"{LANGFUSE_PUBLIC_KEY}:{LANGFUSE_SECRET_KEY}"
-        auth_bytes = auth_string.encode("ascii")
-        auth_b64 = base64.b64encode(auth_bytes).decode("ascii")
-
-        headers = {
-            "Authorization": f"Basic {auth_b64}",
-            "Content-Type": "application/json",
-        }
+    return _fetch_langfuse_stats(hours, LANGFUSE_PUBLIC_KEY, LANGFUSE_HOST)
+
+
+@st.cache_resource(show_spinner=False)
+def _langfuse_session(public_key: str) -> requests.Session:
+    """Keep-alive Langfuse session with basic auth, shared across reruns"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=2,
+        # Room for the parallel page fetches in _fetch_langfuse_stats
+        pool_maxsize=max(2, LANGFUSE_MAX_PAGES - 1),
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # Hand the last response back so its status is reported below
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.auth = (public_key, LANGFUSE_SECRET_KEY)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
 
+
+@st.cache_data(ttl=LANGFUSE_CACHE_TTL, show_spinner=False)
+def _fetch_langfuse_stats(hours: int, public_key: str, host: str) -> Dict[str, Any]:
+    """Query Langfuse; the secret key is read from the module, not the cache key"""
+    try:
         # Calculate time range
         end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(hours=hours)
 
         # Fetch traces with observations
-        traces_url = f"{LANGFUSE_HOST}/api/public/traces"
+        traces_url = f"{host}/api/public/traces"
         params = {
             "fromTimestamp": start_time.isoformat(),
             "toTimestamp": end_time.isoformat(),
             "page": 1,
-            "limit": 50,  # Fetch 50 most recent traces
+            "limit": LANGFUSE_PAGE_SIZE,
         }
 
-        response = requests.get(traces_url, headers=headers, params=params, timeout=10)
+        session = _langfuse_session(public_key)
+        response = session.get(traces_url, params=params, timeout=10)
 
         if response.status_code == 401:
             return {"error": "Authentication failed. Check your Langfuse API keys."}
@@ -197,6 +361,22 @@ def get_langfuse_stats(hours: int = 24) -> Optional[Dict[str, Any]]:
         data = response.json()
         traces = data.get("data", [])
 
+        # The first page reports how many there are; fetch the rest concurrently
+        total_pages = (data.get("meta") or {}).get("totalPages") or 1
+        last_page = min(int(total_pages), LANGFUSE_MAX_PAGES)
+        if traces and last_page > 1:
+
+            def fetch_page(page: int) -> List[Dict[str, Any]]:
+                page_response = session.get(
+                    traces_url, params={**params, "page": page}, timeout=10
+                )
+                page_response.raise_for_status()
+                return page_response.json().get("data", [])
+
+            with ThreadPoolExecutor(max_workers=last_page - 1) as pool:
+                for page_traces in pool.map(fetch_page, range(2, last_page + 1)):
+                    traces.extend(page_traces)
+
         if not traces:
             return {
                 "total_traces": 0,
@@ -205,6 +385,7 @@ def get_langfuse_stats(hours: int = 24) -> Optional[Dict[str, Any]]:
                 "total_cost": 0.0,
                 "avg_latency": 0.0,
                 "traces": [],
+                "traces_table": pd.DataFrame(),
                 "has_data": False,
             }
 
@@ -258,6 +439,7 @@ def get_langfuse_stats(hours: int = 24) -> Optional[Dict[str, Any]]:
                 sorted(latencies)[int(len(latencies) * 0.95)] if latencies else 0.0
             ),
             "traces": traces,
+            "traces_table": build_traces_table(traces),
             "has_data": True,
         }
 
@@ -271,50 +453,328 @@ def get_langfuse_stats(hours: int = 24) -> Optional[Dict[str, Any]]:
         return {"error": f"Unexpected error: {str(e)}"}
 
 
-def load_jsonl_metrics(time_range_hours: int = 24) -> pd.DataFrame:
-    """Load metrics from JSONL files"""
+def metrics_source() -> Optional[Path]:
+    """The metrics JSONL to read: requests.jsonl, else the demo data if present"""
     metrics_file = METRICS_DIR / "requests.jsonl"
     demo_file = DEMO_DATA_DIR / "demo_metrics.jsonl"
 
     # Try demo data first if main file doesn't exist
     if not metrics_file.exists() and demo_file.exists():
-        metrics_file = demo_file
-        st.info("📦 Using demo data (no real requests yet)")
+        return demo_file
+
+    return metrics_file if metrics_file.exists() else None
+
+
+def build_traces_table(traces: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Recent Traces display table, built column-wise from the raw Langfuse traces"""
+    raw = pd.DataFrame(
+        [trace for trace in traces if isinstance(trace, dict)],
+        columns=["id", "name", "timestamp", "latency", "totalCost", "level"],
+    )
+    latency = pd.to_numeric(raw["latency"], errors="coerce")
+    cost = pd.to_numeric(raw["totalCost"], errors="coerce").fillna(0.0)
+
+    # Estimate tokens from cost, with the same Gemini split as _fetch_langfuse_stats
+    billable = cost.clip(lower=0.0)
+    est_output = np.trunc(billable * 0.75 / 0.30 * 1_000_000)
+    est_input = np.trunc(billable * 0.25 / 0.075 * 1_000_000)
+
+    level = raw["level"]
+    return pd.DataFrame(
+        {
+            "Timestamp": raw["timestamp"]
+            .fillna("")
+            .astype(str)
+            .str[:19]
+            .str.replace("T", " ", regex=False),
+            "Name": raw["name"].fillna("N/A"),
+            "Latency": latency.map("{:.2f}s".format).where(
+                latency.fillna(0).ne(0), "N/A"
+            ),
+            "Tokens": (est_input + est_output).astype(int),
+            "Cost": cost.map("${:.5f}".format),
+            "Status": np.where(level.isna() | level.isin(["", "DEFAULT"]), "✅", "⚠️"),
+            "Trace ID": raw["id"].fillna("").astype(str).str[:8] + "e",
+        }
+    )
 
-    if not metrics_file.exists():
+
+def load_jsonl_metrics(time_range_hours: int = 24) -> pd.DataFrame:
+    """Load metrics from JSONL files"""
+    metrics_file = metrics_source()
+    if metrics_file is None:
         return pd.DataFrame()
 
+    if metrics_file.parent == DEMO_DATA_DIR:
+        st.info("📦 Using demo data (no real requests yet)")
+
+    return _load_metrics_file(
+        metrics_file, time_range_hours, file_mtime_ns(metrics_file)
+    )
+
+
+def load_metric_buckets(time_range_hours: int = 24) -> Dict[str, pd.DataFrame]:
+    """Time-bucketed aggregates of load_jsonl_metrics for the charts"""
+    metrics_file = metrics_source()
+    if metrics_file is None:
+        return {}
+
+    return _bucket_metrics_file(
+        metrics_file, time_range_hours, file_mtime_ns(metrics_file)
+    )
+
+
+@st.cache_data(ttl=FILE_CACHE_TTL, show_spinner=False)
+def _bucket_metrics_file(
+    metrics_file: Path, time_range_hours: int, mtime_ns: int
+) -> Dict[str, pd.DataFrame]:
+    """bucket_metrics over _load_metrics_file, cached on the same key"""
+    return bucket_metrics(_load_metrics_file(metrics_file, time_range_hours, mtime_ns))
+
+
+def bucket_metrics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Aggregate metrics for the time-series charts
+    Returns "requests" (count per 5 minutes) and "intervals" (per 10 minutes:
+    p50/p95/p99 latency, error_rate and token sums)
+    """
+    if df.empty:
+        return {}
+
+    indexed = df.set_index("timestamp")
+
+    # One 5-minute pass for every additive aggregate; 10-minute buckets are
+    # rolled up from these small per-bucket sums instead of the raw rows
+    grouped = indexed.groupby(pd.Grouper(freq="5min"))
+    sum_cols = [
+        col
+        for col in ("success", "prompt_tokens", "completion_tokens")
+        if col in indexed.columns
+    ]
+    sums = grouped[sum_cols].sum()
+    sums.insert(0, "count", grouped.size())
+    intervals = sums.resample("10min").sum()
+
+    if "success" in intervals.columns:
+        intervals["error_rate"] = (1 - intervals["success"] / intervals["count"]) * 100
+
+    if "duration_seconds" in indexed.columns:
+        # Quantiles aren't additive, so latency needs its own 10-minute pass
+        latency = (
+            indexed["duration_seconds"]
+            .groupby(pd.Grouper(freq="10min"))
+            .quantile([0.5, 0.95, 0.99])
+            .unstack()
+        )
+        latency.columns = ["p50", "p95", "p99"]
+        intervals = intervals.join(latency)
+
+    return {"requests": sums[["count"]], "intervals": intervals}
+
+
+@st.cache_data(ttl=FILE_CACHE_TTL, show_spinner=False)
+def _load_metrics_file(
+    metrics_file: Path, time_range_hours: int, mtime_ns: int
+) -> pd.DataFrame:
+    """Parse metrics_file; mtime_ns only keys the cache so appends invalidate it"""
     try:
-        data = []
-        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=time_range_hours)
-
-        with open(metrics_file, "r") as f:
-            for line in f:
-                try:
-                    record = json.loads(line.strip())
-                    timestamp = pd.to_datetime(record["timestamp"])
-
-                    # Filter by time range
-                    if timestamp >= cutoff_time:
-                        data.append(record)
-
-                    # Performance limit
-                    if len(data) >= MAX_CHART_POINTS * 2:
-                        break
-                except:
-                    continue
-
-        df = pd.DataFrame(data)
+        # Naive UTC, matching backend stamps and the parquet index
+        cutoff_time = (
+            datetime.now(timezone.utc) - timedelta(hours=time_range_hours)
+        ).replace(tzinfo=None)
+
+        df = None
+        if metrics_file == METRICS_DIR / "requests.jsonl":
+            df = load_indexed_metrics(metrics_file, cutoff_time)
+
+        if df is None:
+            df = read_jsonl(metrics_file)
+            if "timestamp" not in df.columns:
+                return pd.DataFrame()
+            # Parse as the index does: missing or malformed stamps become NaT and
+            # drop out of the range instead of failing the whole load
+            timestamps = pd.to_datetime(
+                df["timestamp"], utc=True, format="ISO8601", errors="coerce"
+            ).dt.tz_localize(None)
+            df = df.assign(timestamp=timestamps)[timestamps >= cutoff_time]
+
+        # Apply the performance limit
+        df = df.head(MAX_CHART_POINTS * 2)
         if not df.empty:
             df["timestamp"] = pd.to_datetime(df["timestamp"])
             df = df.sort_values("timestamp")
 
+        df = downcast_metrics(df)
+        if "user_message_length" in df.columns:
+            # Bucket once per load so reruns only count the cached buckets
+            df["length_bucket"] = pd.cut(
+                df["user_message_length"],
+                bins=LENGTH_BUCKET_BINS,
+                labels=LENGTH_BUCKET_LABELS,
+            )
         return df
     except Exception as e:
         st.error(f"Failed to load metrics: {e}")
         return pd.DataFrame()
 
 
+def downcast_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """Keep only METRICS_COLUMNS and shrink them to METRICS_DTYPES"""
+    df = df[[col for col in METRICS_COLUMNS if col in df.columns]].copy()
+    for col, dtype in METRICS_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == "int32" and df[col].isna().any():
+            dtype = "float32"
+        try:
+            df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError):
+            continue  # Unexpected values: keep the inferred dtype
+    if "success" in df.columns:
+        # Missing flags count as failures rather than becoming truthy NaN
+        df["success"] = df["success"].eq(True)
+    return df
+
+
+@st.cache_resource(show_spinner=False)
+def _metrics_index_lock() -> threading.Lock:
+    """Process-wide lock so concurrent sessions never write overlapping parts"""
+    return threading.Lock()
+
+
+def _metrics_index_parts() -> List[tuple]:
+    """(start, end, path) for each index part, in file order"""
+    parts = []
+    for path in METRICS_INDEX_DIR.glob("part-*.parquet"):
+        try:
+            _, start, end = path.stem.split("-")
+            parts.append((int(start), int(end), path))
+        except ValueError:
+            continue
+    return sorted(parts)
+
+
+def _source_tail_digest(metrics_file: Path, end: int) -> str:
+    """Digest of the bytes just before end, to spot a log rewritten in place"""
+    start = max(0, end - METRICS_INDEX_TAIL_BYTES)
+    with open(metrics_file, "rb") as f:
+        f.seek(start)
+        return hashlib.blake2b(f.read(end - start), digest_size=16).hexdigest()
+
+
+def _source_identity(metrics_file: Path, stat: os.stat_result, end: int) -> bytes:
+    """What each part records about the log it was built from"""
+    identity = {
+        "dev": stat.st_dev,
+        "ino": stat.st_ino,
+        "mtime_ns": stat.st_mtime_ns,
+        "tail": _source_tail_digest(metrics_file, end),
+    }
+    return json.dumps(identity).encode()
+
+
+def _index_matches_source(part: Path, end: int, metrics_file: Path) -> bool:
+    """
+    Whether the index ending with part still describes metrics_file: same file
+    (device and inode), and unchanged up to end unless it was merely appended to
+    """
+    stat = metrics_file.stat()
+    metadata = pq.read_schema(part).metadata or {}
+    source = json.loads(metadata.get(b"source", b"{}"))
+    if (source.get("dev"), source.get("ino")) != (stat.st_dev, stat.st_ino):
+        return False  # Rotated or replaced by a new file
+    if stat.st_size < end:
+        return False  # Truncated
+    if stat.st_mtime_ns == source.get("mtime_ns"):
+        return True  # Untouched since this part was written
+    return _source_tail_digest(metrics_file, end) == source.get("tail")
+
+
+def _write_index_part(table: pa.Table, start: int, end: int, source: bytes) -> None:
+    """Atomically write one part; the dot-prefixed temp file is never read"""
+    METRICS_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+    path = METRICS_INDEX_DIR / f"part-{start:012d}-{end:012d}.parquet"
+    tmp_path = METRICS_INDEX_DIR / f".{path.name}.tmp"
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), b"source": source}
+    )
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_metrics_index(metrics_file: Path) -> List[tuple]:
+    """
+    Append the lines past the indexed offset of metrics_file as a new part
+    Returns the parts covering the file; call with _metrics_index_lock held
+    """
+    parts = _metrics_index_parts()
+    offset = parts[-1][1] if parts else 0
+
+    if parts and not _index_matches_source(parts[-1][2], offset, metrics_file):
+        # The log was rotated, replaced, truncated or rewritten: rebuild it all
+        for _, _, path in parts:
+            path.unlink(missing_ok=True)
+        parts, offset = [], 0
+
+    stat = metrics_file.stat()
+    size = stat.st_size
+    with open(metrics_file, "rb") as f:
+        f.seek(offset)
+        new_bytes = f.read(size - offset)
+    # Only index whole lines; a partially written last line waits for the next run
+    end = offset + new_bytes.rfind(b"\n") + 1
+    if end <= offset:
+        return parts
+
+    df = parse_jsonl(new_bytes[: end - offset])
+    df = df[[col for col in METRICS_COLUMNS if col in df.columns]]
+    if "timestamp" in df.columns:
+        # Backend stamps are naive UTC, demo data is "Z"-suffixed
+        df["timestamp"] = pd.to_datetime(
+            df["timestamp"], utc=True, format="ISO8601", errors="coerce"
+        ).dt.tz_localize(None)
+    source = _source_identity(metrics_file, stat, end)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    _write_index_part(table, offset, end, source)
+    parts = _metrics_index_parts()
+
+    if len(parts) > METRICS_INDEX_MAX_PARTS:
+        # Compact into a single part so reads stay a handful of file opens
+        table = pa.concat_tables(
+            [pq.read_table(path) for _, _, path in parts], promote_options="default"
+        )
+        _write_index_part(table, 0, end, source)
+        for _, _, path in parts:
+            path.unlink(missing_ok=True)
+        parts = _metrics_index_parts()
+
+    return parts
+
+
+def load_indexed_metrics(
+    metrics_file: Path, cutoff: datetime
+) -> Optional[pd.DataFrame]:
+    """
+    Read rows at or after cutoff (naive UTC) from the parquet index, bringing it
+    up to date first; returns None if the index can't be used
+    """
+    try:
+        with _metrics_index_lock():
+            parts = update_metrics_index(metrics_file)
+            frames = [
+                pd.read_parquet(path, filters=[("timestamp", ">=", cutoff)])
+                for _, _, path in parts
+                if "timestamp" in pq.read_schema(path).names
+            ]
+    except Exception:
+        return None
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
 def load_feedback_data() -> pd.DataFrame:
     """Load user feedback from JSONL"""
     feedback_file = METRICS_DIR / "feedback.jsonl"
@@ -326,16 +786,14 @@ def load_feedback_data() -> pd.DataFrame:
     if not feedback_file.exists():
         return pd.DataFrame()
 
+    return _load_feedback_file(feedback_file, file_mtime_ns(feedback_file))
+
+
+@st.cache_data(ttl=FILE_CACHE_TTL, show_spinner=False)
+def _load_feedback_file(feedback_file: Path, mtime_ns: int) -> pd.DataFrame:
+    """Parse feedback_file; mtime_ns only keys the cache"""
     try:
-        data = []
-        with open(feedback_file, "r") as f:
-            for line in f:
-                try:
-                    data.append(json.loads(line.strip()))
-                except:
-                    continue
-
-        df = pd.DataFrame(data)
+        df = read_jsonl(feedback_file)
         if not df.empty:
             df["timestamp"] = pd.to_datetime(df["timestamp"])
         return df
@@ -359,41 +817,46 @@ def load_logs(
     if not log_file.exists():
         return []
 
-    try:
-        logs = []
-        with open(log_file, "r", encoding="utf-8") as f:
-            # Read from end of file for recent logs
-            lines = f.readlines()
+    return _load_log_file(
+        log_file,
+        level_filter,
+        module_filter,
+        session_filter,
+        limit,
+        file_mtime_ns(log_file),
+    )
 
-        # Reverse to get newest first
-        for line in reversed(lines[-limit * 2 :]):  # Read 2x limit for filtering
-            try:
-                # Parse log line format: "timestamp - module - level - message"
-                parts = line.strip().split(" - ", 3)
-                if len(parts) >= 4:
-                    log_entry = {
-                        "timestamp": parts[0],
-                        "module": parts[1],
-                        "level": parts[2],
-                        "message": parts[3],
-                    }
-
-                    # Apply filters
-                    if level_filter and log_entry["level"] != level_filter:
-                        continue
-                    if module_filter and module_filter not in log_entry["module"]:
-                        continue
-                    if session_filter and session_filter not in log_entry["message"]:
-                        continue
-
-                    logs.append(log_entry)
-
-                    if len(logs) >= limit:
-                        break
-            except:
-                continue
 
-        return logs
+@st.cache_data(ttl=FILE_CACHE_TTL, show_spinner=False)
+def _load_log_file(
+    log_file: Path,
+    level_filter: Optional[str],
+    module_filter: Optional[str],
+    session_filter: Optional[str],
+    limit: int,
+    mtime_ns: int,
+) -> List[Dict]:
+    """Parse and filter log_file; mtime_ns only keys the cache"""
+    try:
+        # Read 2x limit from the end of the file to leave room for filtering
+        lines = tail_lines(log_file, limit * 2)
+
+        # Newest first; filters run on the match before any dict is built
+        matches = (LOG_LINE_RE.match(line.strip()) for line in reversed(lines))
+        logs = (
+            {
+                "timestamp": m[1],
+                "module": m[2],
+                "level": m[3],
+                "message": m[4],
+            }
+            for m in matches
+            if m
+            and (not level_filter or m[3] == level_filter)
+            and (not module_filter or module_filter in m[2])
+            and (not session_filter or session_filter in m[4])
+        )
+        return list(islice(logs, limit))
     except Exception as e:
         st.error(f"Failed to load logs: {e}")
         return []
@@ -419,19 +882,45 @@ def calculate_cost(df: pd.DataFrame) -> float:
     if "cost_usd" in df.columns:
         return df["cost_usd"].sum()
 
-    # Calculate from tokens if cost not available
-    total_cost = 0.0
-    for _, row in df.iterrows():
-        model = row.get("model", "openai/gemini-3-flash")
-        costs = MODEL_COSTS.get(model, MODEL_COSTS["openai/gemini-3-flash"])
+    # Calculate from tokens if cost not available (unknown models: default rates)
+    models = df.get("model", pd.Series(index=df.index, dtype=object))
+    default = DEFAULT_MODEL_COSTS
+    input_rate = models.map(MODEL_INPUT_COSTS).astype(float).fillna(default["input"])
+    output_rate = models.map(MODEL_OUTPUT_COSTS).astype(float).fillna(default["output"])
+
+    prompt_tokens = df.get("prompt_tokens", 0)
+    completion_tokens = df.get("completion_tokens", 0)
+    token_cost = prompt_tokens * input_rate + completion_tokens * output_rate
+    return float(token_cost.sum()) / 1_000_000
+
+
+def submit_loader(executor: ThreadPoolExecutor, fn, *args, **kwargs) -> Future:
+    """Run fn on executor with this script run's context so st.cache_data works there"""
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return executor.submit(run)
+
 
-        prompt_tokens = row.get("prompt_tokens", 0)
-        completion_tokens = row.get("completion_tokens", 0)
+def request_refresh() -> None:
+    """Rerun the page, unless the last refresh was under MIN_REFRESH_INTERVAL ago"""
+    now = time.time()
+    if now - st.session_state.get("last_refresh_ts", 0.0) < MIN_REFRESH_INTERVAL:
+        st.toast("⏳ Refreshed just now, showing the latest data")
+        return
+    st.session_state.last_refresh_ts = now
+    st.rerun()
 
-        total_cost += prompt_tokens / 1_000_000 * costs["input"]
-        total_cost += completion_tokens / 1_000_000 * costs["output"]
 
-    return total_cost
+def get_log_filters() -> tuple:
+    """Current log filter values, read from the widgets' session_state keys"""
+    level = st.session_state.get("log_level_filter", "All")
+    module = st.session_state.get("module_filter", "")
+    session = st.session_state.get("session_filter", "")
+    return (level if level != "All" else None, module or None, session or None)
 
 
 # ====== Main Dashboard ======
@@ -464,7 +953,7 @@ def main():
 
         # Refresh button
         if st.button(labels["refresh"], use_container_width=True):
-            st.rerun()
+            request_refresh()
 
         st.divider()
 
@@ -475,9 +964,22 @@ def main():
         if (DEMO_DATA_DIR / "demo_metrics.jsonl").exists():
             st.info("💡 Demo data available for testing")
 
+    # Fan out the independent loads; widgets stay on this thread, so the log
+    # filters come from session_state, which already holds this run's values
+    langfuse_enabled = LANGFUSE_ENABLED and LANGFUSE_PUBLIC_KEY and LANGFUSE_SECRET_KEY
+    loaders = ThreadPoolExecutor(max_workers=3, thread_name_prefix="monitor-loader")
+    if langfuse_enabled:
+        langfuse_future = submit_loader(loaders, get_langfuse_stats, hours)
+    feedback_future = submit_loader(loaders, load_feedback_data)
+    logs_future = submit_loader(
+        loaders, load_logs, *get_log_filters(), limit=LOG_PAGE_SIZE
+    )
+    loaders.shutdown(wait=False)
+
     # Load data from local files
     with st.spinner("Loading local metrics..."):
         df_metrics = load_jsonl_metrics(hours)
+        metric_buckets = load_metric_buckets(hours)
 
     if not df_metrics.empty:
         st.info("📁 Using local JSONL data")
@@ -488,12 +990,12 @@ def main():
         df_metrics = pd.DataFrame()  # Empty dataframe for compatibility
 
     # ====== Langfuse Statistics Section ======
-    if LANGFUSE_ENABLED and LANGFUSE_PUBLIC_KEY and LANGFUSE_SECRET_KEY:
+    if langfuse_enabled:
         st.divider()
         st.header("🔍 Langfuse Tracing Statistics")
 
         with st.spinner("Fetching Langfuse statistics..."):
-            langfuse_stats = get_langfuse_stats(hours)
+            langfuse_stats = langfuse_future.result()
 
         if langfuse_stats and "error" in langfuse_stats:
             st.error(f"⚠️ {langfuse_stats['error']}")
@@ -547,49 +1049,7 @@ def main():
 
                 # Create expandable section for trace details
                 with st.expander("View Trace Details", expanded=True):
-                    traces_data = []
-                    for trace in langfuse_stats["traces"][:20]:  # Show latest 20
-                        # Get latency directly from trace (already calculated by Langfuse)
-                        latency_str = "N/A"
-                        trace_latency = trace.get("latency")
-                        if trace_latency:
-                            latency_str = f"{float(trace_latency):.2f}s"
-
-                        # Get cost directly from trace
-                        trace_cost = trace.get("totalCost", 0)
-
-                        # Estimate tokens from cost if available
-                        total_tokens = 0
-                        if trace_cost and trace_cost > 0:
-                            # Rough estimate based on Gemini pricing
-                            estimated_output = int(
-                                (trace_cost * 0.75) / 0.30 * 1_000_000
-                            )
-                            estimated_input = int(
-                                (trace_cost * 0.25) / 0.075 * 1_000_000
-                            )
-                            total_tokens = estimated_input + estimated_output
-
-                        traces_data.append(
-                            {
-                                "Timestamp": trace.get("timestamp", "")[:19].replace(
-                                    "T", " "
-                                ),
-                                "Name": trace.get("name", "N/A"),
-                                "Latency": latency_str,
-                                "Tokens": total_tokens,
-                                "Cost": f"${float(trace_cost):.5f}",
-                                "Status": (
-                                    "✅"
-                                    if not trace.get("level")
-                                    or trace.get("level") == "DEFAULT"
-                                    else "⚠️"
-                                ),
-                                "Trace ID": trace.get("id", "")[:8] + "e",
-                            }
-                        )
-
-                    df_traces = pd.DataFrame(traces_data)
+                    df_traces = langfuse_stats["traces_table"].head(20)  # Latest 20
                     st.dataframe(
                         df_traces,
                         use_container_width=True,
@@ -673,26 +1133,21 @@ def main():
 
     if not df_metrics.empty:
         # Resample to handle large datasets
-        df_resampled = (
-            df_metrics.set_index("timestamp")
-            .resample("5T")
-            .size()
-            .reset_index(name="count")
-        )
+        df_resampled = metric_buckets["requests"].reset_index()
 
-        # Limit points for performance
-        if len(df_resampled) > MAX_CHART_POINTS:
-            sample_rate = len(df_resampled) // MAX_CHART_POINTS
-            df_resampled = df_resampled.iloc[::sample_rate]
+        # Limit points for performance (WebGL trace, peak-preserving downsample)
+        df_resampled = lttb_downsample(df_resampled, df_resampled["count"])
 
-        fig_requests = px.area(
-            df_resampled,
-            x="timestamp",
-            y="count",
-            title=f'{labels["request_count"]} (5-minute buckets)',
-            color_discrete_sequence=[COLORS["primary"]],
+        fig_requests = go.Figure(
+            go.Scattergl(
+                x=df_resampled["timestamp"],
+                y=df_resampled["count"],
+                fill="tozeroy",
+                line=dict(color=COLORS["primary"]),
+            )
         )
         fig_requests.update_layout(
+            title=f'{labels["request_count"]} (5-minute buckets)',
             xaxis_title="Time",
             yaxis_title="Requests",
             hovermode="x unified",
@@ -710,43 +1165,21 @@ def main():
             fig_latency = go.Figure()
 
             # P50, P95, P99 over time
-            df_latency = (
-                df_metrics.set_index("timestamp")
-                .resample("10T")["duration_seconds"]
-                .quantile([0.5, 0.95, 0.99])
-                .unstack()
-            )
-
-            if len(df_latency) > MAX_CHART_POINTS:
-                sample_rate = len(df_latency) // MAX_CHART_POINTS
-                df_latency = df_latency.iloc[::sample_rate]
-
+            df_latency = metric_buckets["intervals"][["p50", "p95", "p99"]]
             df_latency = df_latency.reset_index()
 
-            fig_latency.add_trace(
-                go.Scatter(
-                    x=df_latency["timestamp"],
-                    y=df_latency[0.5],
-                    name=labels["p50"],
-                    line=dict(color=COLORS["success"]),
-                )
-            )
-            fig_latency.add_trace(
-                go.Scatter(
-                    x=df_latency["timestamp"],
-                    y=df_latency[0.95],
-                    name=labels["p95"],
-                    line=dict(color=COLORS["warning"]),
-                )
-            )
-            fig_latency.add_trace(
-                go.Scatter(
-                    x=df_latency["timestamp"],
-                    y=df_latency[0.99],
-                    name=labels["p99"],
-                    line=dict(color=COLORS["danger"]),
+            # Downsample each percentile separately so every line keeps its spikes
+            percentile_colors = {"p50": "success", "p95": "warning", "p99": "danger"}
+            for key, color in percentile_colors.items():
+                df_trace = lttb_downsample(df_latency, df_latency[key])
+                fig_latency.add_trace(
+                    go.Scattergl(
+                        x=df_trace["timestamp"],
+                        y=df_trace[key],
+                        name=labels[key],
+                        line=dict(color=COLORS[color]),
+                    )
                 )
-            )
 
             fig_latency.update_layout(
                 xaxis_title="Time",
@@ -763,17 +1196,13 @@ def main():
 
         if "total_tokens" in df_metrics.columns:
             # Rolling total
-            df_tokens = (
-                df_metrics.set_index("timestamp")[
-                    ["prompt_tokens", "completion_tokens"]
-                ]
-                .resample("10T")
-                .sum()
-            )
+            df_tokens = metric_buckets["intervals"][
+                ["prompt_tokens", "completion_tokens"]
+            ]
 
-            if len(df_tokens) > MAX_CHART_POINTS:
-                sample_rate = len(df_tokens) // MAX_CHART_POINTS
-                df_tokens = df_tokens.iloc[::sample_rate]
+            df_tokens = lttb_downsample(
+                df_tokens, df_tokens["prompt_tokens"] + df_tokens["completion_tokens"]
+            )
 
             df_tokens = df_tokens.reset_index()
 
@@ -819,17 +1248,9 @@ def main():
     with col1:
         if "success" in df_metrics.columns:
             # Error rate over time
-            df_errors = (
-                df_metrics.set_index("timestamp")
-                .resample("10T")
-                .agg({"success": lambda x: (1 - x.mean()) * 100})
-                .reset_index()
-            )
-            df_errors.columns = ["timestamp", "error_rate"]
+            df_errors = metric_buckets["intervals"][["error_rate"]].reset_index()
 
-            if len(df_errors) > MAX_CHART_POINTS:
-                sample_rate = len(df_errors) // MAX_CHART_POINTS
-                df_errors = df_errors.iloc[::sample_rate]
+            df_errors = lttb_downsample(df_errors, df_errors["error_rate"])
 
             fig_errors = px.line(
                 df_errors,
@@ -870,13 +1291,7 @@ def main():
 
     with col1:
         if "user_message_length" in df_metrics.columns:
-            # Group by message length buckets
-            df_metrics["length_bucket"] = pd.cut(
-                df_metrics["user_message_length"],
-                bins=[0, 50, 100, 200, 500, 1000, 10000],
-                labels=["<50", "50-100", "100-200", "200-500", "500-1000", "1000+"],
-            )
-
+            # Group by message length buckets (precomputed by the loader)
             query_dist = df_metrics["length_bucket"].value_counts().sort_index()
 
             fig_queries = px.bar(
@@ -895,7 +1310,7 @@ def main():
         # User feedback
         st.subheader(f"👍 {labels['feedback']}")
 
-        df_feedback = load_feedback_data()
+        df_feedback = feedback_future.result()
         if not df_feedback.empty:
             feedback_counts = df_feedback["rating"].value_counts()
 
@@ -920,19 +1335,17 @@ def main():
     col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
 
     with col1:
-        level_filter = st.selectbox(
+        st.selectbox(
             labels["log_level"],
             ["All", "INFO", "WARNING", "ERROR", "DEBUG"],
             key="log_level_filter",
         )
 
     with col2:
-        module_filter = st.text_input(
-            labels["module"], placeholder="e.g. backend", key="module_filter"
-        )
+        st.text_input(labels["module"], placeholder="e.g. backend", key="module_filter")
 
     with col3:
-        session_filter = st.text_input(
+        st.text_input(
             labels["session"], placeholder="e.g. session_id", key="session_filter"
         )
 
@@ -940,15 +1353,10 @@ def main():
         st.write("")  # Spacer
         st.write("")
         if st.button("🔄", help="Refresh logs"):
-            st.rerun()
-
-    # Load and display logs
-    logs = load_logs(
-        level_filter if level_filter != "All" else None,
-        module_filter if module_filter else None,
-        session_filter if session_filter else None,
-        limit=LOG_PAGE_SIZE,
-    )
+            request_refresh()
+
+    # Display logs (loaded in the background with these same filter values)
+    logs = logs_future.result()
 
     if logs:
         # Create paginated log viewer
@@ -6,7 +6,8 @@ Run with: pytest tests/test_chat_integration.py -v
 """
 
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
+import asyncio
 import time
 import sys
 from pathlib import Path
@@ -14,6 +15,16 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 
+@pytest.fixture(autouse=True)
+def clear_completion_cache():
+    """Keep cached temperature-0 completions from leaking between tests"""
+    from backend import _completion_cache
+
+    _completion_cache.clear()
+    yield
+    _completion_cache.clear()
+
+
 class TestChatHappyPath:
     """Test happy-path chat completion scenarios with mocked LLM"""
 
@@ -182,6 +193,278 @@ class TestChatHappyPath:
         assert messages[1]["role"] == "user"
         assert messages[1]["content"] == "Start new conversation"
 
+    @patch("backend.completion")
+    @patch("backend.langfuse_client", None)
+    def test_generate_response_from_messages_passes_list_through(self, mock_completion):
+        """Test pre-built message list is sent to the model as-is"""
+        from backend import generate_response_from_messages
+
+        mock_completion.return_value = {
+            "choices": [{"message": {"content": "Second answer"}}],
+            "usage": {"prompt_tokens": 40, "completion_tokens": 5, "total_tokens": 45},
+        }
+
+        messages = [
+            {"role": "system", "content": "You are helpful."},
+            {"role": "user", "content": "First question"},
+            {"role": "assistant", "content": "First answer"},
+            {"role": "user", "content": "Second question"},
+        ]
+
+        response = generate_response_from_messages(messages, temperature=0.5)
+
+        assert response == "Second answer"
+        assert mock_completion.call_args.kwargs["messages"] == messages
+
+    @patch("backend.completion")
+    @patch("backend.langfuse_client", None)
+    def test_temperature_zero_responses_are_cached(self, mock_completion):
+        """Test identical temperature-0 requests reuse the first completion"""
+        from backend import generate_response
+
+        mock_completion.return_value = {
+            "choices": [{"message": {"content": "Deterministic answer"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+        }
+
+        first = generate_response("Cache me exactly", [], temperature=0.0)
+        second = generate_response("Cache me exactly", [], temperature=0.0)
+        generate_response("Cache me exactly", [], temperature=0.5)
+
+        assert first == second == "Deterministic answer"
+        assert mock_completion.call_count == 2
+
+    @patch("backend.COMPLETION_CACHE_MAX_ENTRIES", 2)
+    def test_completion_cache_is_bounded(self):
+        """Test the completion cache evicts expired and least recently used entries"""
+        import backend
+
+        backend._completion_cache["expired"] = (time.time() - 1, "stale")
+        backend._completion_cache_put("a", "A")
+        backend._completion_cache_put("b", "B")
+        assert backend._completion_cache_get("a") == "A"  # "b" is now the LRU entry
+        backend._completion_cache_put("c", "C")
+
+        assert list(backend._completion_cache) == ["a", "c"]
+
+    @patch("backend.completion")
+    @patch("backend.langfuse_client", None)
+    def test_generate_responses_identical_prompts_use_n(self, mock_completion):
+        """Test identical batched prompts are sent as one completion with n choices"""
+        from backend import generate_responses
+
+        mock_completion.return_value = {
+            "choices": [
+                {"message": {"content": "Variant A"}},
+                {"message": {"content": "Variant B"}},
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 6, "total_tokens": 16},
+        }
+
+        responses = generate_responses([("Same prompt", []), ("Same prompt", [])])
+
+        assert responses == ["Variant A", "Variant B"]
+        assert mock_completion.call_count == 1
+        assert mock_completion.call_args.kwargs["n"] == 2
+
+    @patch("backend.batch_completion")
+    @patch("backend.langfuse_client", None)
+    def test_generate_responses_distinct_prompts_use_batch_completion(self, mock_batch):
+        """Test distinct prompts fan out in one batch call and keep per-item errors"""
+        from backend import generate_responses
+
+        mock_batch.return_value = [
+            {"choices": [{"message": {"content": "Answer one"}}], "usage": {}},
+            ValueError("boom"),
+        ]
+
+        responses = generate_responses([("First", []), ("Second", [])])
+
+        assert mock_batch.call_count == 1
+        assert len(mock_batch.call_args.kwargs["messages"]) == 2
+        assert responses[0] == "Answer one"
+        assert responses[1].startswith("⚠️")
+
+    @patch("backend.batch_completion")
+    @patch("backend.langfuse_client", None)
+    def test_generate_responses_short_batch_result_raises(self, mock_batch):
+        """Test a batch result missing items raises instead of dropping prompts"""
+        from backend import generate_responses
+
+        mock_batch.return_value = [
+            {"choices": [{"message": {"content": "Answer one"}}], "usage": {}},
+        ]
+
+        with pytest.raises(ValueError):
+            generate_responses([("First", []), ("Second", [])])
+
+
+class TestChatStreaming:
+    """Test token-by-token streaming of chat responses"""
+
+    @patch("backend.completion")
+    @patch("backend.langfuse_client", None)
+    def test_stream_response_yields_deltas(self, mock_completion):
+        """Test stream_response yields content deltas in order"""
+        from backend import stream_response
+
+        mock_completion.return_value = iter(
+            [
+                {"choices": [{"delta": {"role": "assistant", "content": "Hello"}}]},
+                {"choices": [{"delta": {"content": ", world"}}]},
+                {
+                    "choices": [{"delta": {}}],
+                    "usage": {
+                        "prompt_tokens": 12,
+                        "completion_tokens": 4,
+                        "total_tokens": 16,
+                    },
+                },
+            ]
+        )
+
+        deltas = list(stream_response(user_message="Hi", history=[], temperature=0.3))
+
+        assert deltas == ["Hello", ", world"]
+        call_kwargs = mock_completion.call_args.kwargs
+        assert call_kwargs["stream"] is True
+        assert call_kwargs["stream_options"] == {"include_usage": True}
+
+    @patch("backend.completion")
+    @patch("backend.langfuse_client", None)
+    def test_stream_response_error_is_yielded(self, mock_completion):
+        """Test errors during streaming surface as a user-facing message"""
+        from backend import stream_response
+
+        def broken_stream():
+            yield {"choices": [{"delta": {"content": "Partial"}}]}
+            raise TimeoutError("stream stalled")
+
+        mock_completion.return_value = broken_stream()
+
+        deltas = list(stream_response(user_message="Hi", history=[], temperature=0.3))
+
+        assert deltas[0] == "Partial"
+        assert "timed out" in deltas[-1]
+
+
+class TestAsyncChat:
+    """Test async chat completion via litellm.acompletion"""
+
+    @patch("backend.acompletion", new_callable=AsyncMock)
+    @patch("backend.langfuse_client", None)
+    def test_agenerate_response_concurrent_turns(self, mock_acompletion):
+        """Test several async turns can be awaited concurrently"""
+        from backend import agenerate_response, run_async
+
+        mock_acompletion.return_value = {
+            "choices": [{"message": {"content": "PONG"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        }
+
+        async def run_turns():
+            return await asyncio.gather(
+                *[agenerate_response(f"Ping {i}", [], 0.0) for i in range(3)]
+            )
+
+        responses = run_async(run_turns())
+
+        assert responses == ["PONG", "PONG", "PONG"]
+        assert mock_acompletion.await_count == 3
+
+    def test_dynamic_batcher_coalesces_concurrent_calls(self):
+        """Test concurrent submissions are dispatched as one batch"""
+        from backend import DynamicBatcher, run_async
+
+        batches = []
+
+        async def handler(items):
+            batches.append(list(items))
+            return [item * 2 if item >= 0 else ValueError("negative") for item in items]
+
+        batcher = DynamicBatcher(handler, max_batch_size=8, timeout_ms=50)
+
+        async def submit_all():
+            return await asyncio.gather(
+                *[batcher.submit(i) for i in (1, 2, 3, -1)], return_exceptions=True
+            )
+
+        results = run_async(submit_all())
+
+        assert batches == [[1, 2, 3, -1]]
+        assert results[:3] == [2, 4, 6]
+        assert isinstance(results[3], ValueError)
+
+    def test_dynamic_batcher_short_result_fails_every_waiter(self):
+        """Test a handler returning too few results errors all submissions"""
+        from backend import DynamicBatcher, run_async
+
+        async def handler(items):
+            return [item * 2 for item in items[:-1]]
+
+        batcher = DynamicBatcher(handler, max_batch_size=8, timeout_ms=50)
+
+        async def submit_all():
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    *[batcher.submit(i) for i in (1, 2, 3)], return_exceptions=True
+                ),
+                timeout=5,
+            )
+
+        results = run_async(submit_all())
+
+        assert all(isinstance(result, ValueError) for result in results)
+
+
+class TestContextWindow:
+    """Test the sliding context window sent to the model"""
+
+    def _conversation(self, turns):
+        messages = [{"role": "system", "content": "You are helpful."}]
+        for i in range(turns):
+            messages.append({"role": "user", "content": f"Question {i}"})
+            messages.append({"role": "assistant", "content": f"Answer {i}"})
+        return messages
+
+    def test_trim_context_keeps_last_turns(self):
+        """Test only the last K turns are kept after the system prompt"""
+        from backend import trim_context
+
+        messages = self._conversation(10)
+        context, dropped = trim_context(messages, max_turns=3, max_tokens=100000)
+
+        assert context[0]["role"] == "system"
+        assert len(context) == 1 + 6
+        assert context[1]["content"] == "Question 7"
+        assert len(dropped) == 14
+        assert dropped[0]["content"] == "Question 0"
+
+    def test_trim_context_respects_token_cap(self):
+        """Test oldest turns are dropped until the token cap is met"""
+        from backend import trim_context
+
+        messages = self._conversation(4)
+        messages[-1]["content"] = "word " * 500
+        context, dropped = trim_context(messages, max_turns=8, max_tokens=100)
+
+        assert context == [messages[0], messages[-1]]
+        assert len(dropped) == 7
+
+    def test_trim_context_inserts_summary(self):
+        """Test summary of older turns is added as a system message"""
+        from backend import trim_context
+
+        messages = self._conversation(5)
+        context, _ = trim_context(
+            messages, max_turns=2, summary="User asked five questions."
+        )
+
+        assert context[0]["content"] == "You are helpful."
+        assert context[1]["role"] == "system"
+        assert "User asked five questions." in context[1]["content"]
+        assert context[2]["content"] == "Question 3"
+
 
 class TestChatTranscriptValidation:
     """Test complete chat transcript structure and flow"""
@@ -6,6 +6,8 @@ Run with: pytest tests/test_monitoring.py -v
 import json
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 from unittest.mock import Mock, patch, mock_open
@@ -17,6 +19,8 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from backend import (
     _calculate_cost,
     _log_metrics,
+    flush_metrics,
+    close_metrics_files,
     log_feedback,
     generate_response,
 )
@@ -85,17 +89,52 @@ class TestMetricsLogging:
 
         with patch("builtins.open", mock_open()) as mock_file:
             _log_metrics(metrics)
+            close_metrics_files()
 
             mock_file.assert_called_once()
             handle = mock_file()
 
             # Check that json.dump was called with our metrics
-            written_data = "".join(
+            written_data = b"".join(
                 [call.args[0] for call in handle.write.call_args_list]
-            )
+            ).decode()
             assert "test-123" in written_data
             assert "0.00015" in written_data
 
+    @patch("backend.METRICS_MAX_BYTES", 10)
+    def test_log_metrics_rotates_oversized_file(self, tmp_path):
+        """Test the resident metrics file is rotated past METRICS_MAX_BYTES."""
+        metrics_file = tmp_path / "requests.jsonl"
+
+        with patch("backend.METRICS_FILE", metrics_file):
+            _log_metrics({"request_id": "first"})
+            flush_metrics()
+            _log_metrics({"request_id": "second"})
+            close_metrics_files()
+
+        shard = tmp_path / f"requests-{datetime.utcnow():%Y-%m-%d}.jsonl"
+        assert "first" in shard.read_text()
+        assert "second" in metrics_file.read_text()
+
+    @patch("backend.METRICS_MAX_BYTES", 10)
+    def test_log_metrics_repeated_rotation_keeps_all_rows(self, tmp_path):
+        """Test rotating twice appends to the dated shard instead of replacing it."""
+        metrics_file = tmp_path / "requests.jsonl"
+
+        with patch("backend.METRICS_FILE", metrics_file):
+            for request_id in ("first", "second", "third"):
+                _log_metrics({"request_id": request_id})
+                flush_metrics()
+            close_metrics_files()
+
+        rows = [
+            json.loads(line)["request_id"]
+            for path in sorted(tmp_path.glob("requests*.jsonl"))
+            for line in path.read_text().splitlines()
+        ]
+        assert sorted(rows) == ["first", "second", "third"]
+        assert len(list(tmp_path.glob("requests-*.jsonl"))) == 1
+
     @patch("backend.METRICS_FILE", Path("test_metrics.jsonl"))
     @patch("backend.logger")
     def test_log_metrics_handles_errors(self, mock_logger):
@@ -104,6 +143,7 @@ class TestMetricsLogging:
 
         with patch("builtins.open", side_effect=IOError("Disk full")):
             _log_metrics(metrics)
+            close_metrics_files()
 
             # Should log error but not raise exception
             mock_logger.error.assert_called_once()
@@ -117,13 +157,14 @@ class TestFeedbackLogging:
         """Test logging positive feedback."""
         with patch("builtins.open", mock_open()) as mock_file:
             log_feedback("req-123", 5, "positive", "Great response!")
+            close_metrics_files()
 
             mock_file.assert_called_once()
             handle = mock_file()
 
-            written_data = "".join(
+            written_data = b"".join(
                 [call.args[0] for call in handle.write.call_args_list]
-            )
+            ).decode()
             assert "req-123" in written_data
             assert "positive" in written_data
             assert "Great response!" in written_data
@@ -133,22 +174,58 @@ class TestFeedbackLogging:
         """Test logging negative feedback."""
         with patch("builtins.open", mock_open()) as mock_file:
             log_feedback("req-456", 2, "negative", "")
+            close_metrics_files()
 
             mock_file.assert_called_once()
             handle = mock_file()
 
-            written_data = "".join(
+            written_data = b"".join(
                 [call.args[0] for call in handle.write.call_args_list]
-            )
+            ).decode()
             assert "req-456" in written_data
             assert "negative" in written_data
 
+    @patch("backend.FEEDBACK_FILE", Path("test_feedback.jsonl"))
+    def test_log_feedback_does_not_block_on_io(self):
+        """Test feedback is queued and written later by the background writer."""
+        busy, release = threading.Event(), threading.Event()
+
+        def slow_write(batch):
+            busy.set()
+            release.wait(5)
+
+        with patch("builtins.open", mock_open()):
+            with patch("backend._write_batch", side_effect=slow_write) as mock_write:
+                # Hold the writer thread in an earlier batch so the record stays queued
+                log_feedback("req-000", 0, "positive")
+                assert busy.wait(5)
+                log_feedback("req-789", 3, "positive")
+                assert mock_write.call_count == 1
+                release.set()
+                flush_metrics()
+
+            assert mock_write.call_count == 2
+            assert mock_write.call_args.args[0][0][1]["request_id"] == "req-789"
+
+    @patch("backend.METRICS_FILE", Path("test_metrics.jsonl"))
+    @patch("backend.logger")
+    def test_log_metrics_drops_when_queue_full(self, mock_logger):
+        """Test a full queue drops the record instead of blocking."""
+        import queue
+
+        with patch("backend._metrics_queue", queue.Queue(maxsize=1)) as q:
+            q.put_nowait(("x", {}, "metrics"))
+            _log_metrics({"test": "data"})
+
+        mock_logger.warning.assert_called_once()
+
     @patch("backend.FEEDBACK_FILE", Path("test_feedback.jsonl"))
     @patch("backend.logger")
     def test_log_feedback_handles_errors(self, mock_logger):
         """Test that feedback logging errors are handled."""
         with patch("builtins.open", side_effect=IOError("Permission denied")):
             log_feedback("req-789", 0, "positive")
+            flush_metrics()
 
             mock_logger.error.assert_called_once()
 
@@ -227,6 +304,90 @@ class TestRetryLogic:
         assert logged_metrics["success"] is False
         assert "Timeout" in logged_metrics["error_type"]
 
+    def test_token_bucket_admits_burst_then_refills(self):
+        """Test the rate limiter admits up to capacity, then refills over time."""
+        from backend import _TokenBucket
+
+        bucket = _TokenBucket(calls=2, period=1)
+        assert bucket.take() is True
+        assert bucket.take() is True
+        assert bucket.take() is False
+
+        bucket.ts -= 0.5  # half a period later: one slot refilled
+        assert bucket.take() is True
+        assert bucket.take() is False
+
+    @patch("backend._BUCKET")
+    @patch("backend.completion")
+    def test_local_rate_limit_does_not_trip_breaker(self, mock_completion, mock_bucket):
+        """Test exhausting the local rate limit raises without counting as a breaker failure."""
+        from backend import (
+            _call_llm_with_retry,
+            circuit_breaker,
+            RateLimitExceededError,
+        )
+
+        mock_bucket.take.return_value = False
+        failures = circuit_breaker.fail_counter
+
+        with pytest.raises(RateLimitExceededError):
+            _call_llm_with_retry.__wrapped__("m", "k", "b", [], 0.5, 30)
+
+        assert circuit_breaker.fail_counter == failures
+        mock_completion.assert_not_called()
+
+    @patch("backend._BUCKET")
+    def test_async_call_does_not_hold_breaker_lock(self, mock_bucket):
+        """Test a sync breaker call on another thread is not stalled by an awaited request."""
+        import asyncio
+        from tenacity import stop_after_attempt
+        from backend import _acall_llm_with_retry, circuit_breaker
+
+        mock_bucket.take.return_value = True
+
+        async def fake_acompletion(**kwargs):
+            sync_call = threading.Thread(
+                target=circuit_breaker.call, args=(lambda: None,)
+            )
+            sync_call.start()
+            sync_call.join(timeout=2)
+            return not sync_call.is_alive()
+
+        with patch("backend.acompletion", side_effect=fake_acompletion):
+            call = _acall_llm_with_retry.retry_with(stop=stop_after_attempt(1))
+            unblocked = asyncio.run(call("m", "k", "b", [], 0.5, 30))
+
+        assert unblocked is True
+
+    @patch("backend._BUCKET")
+    def test_async_failures_open_breaker(self, mock_bucket):
+        """Test awaited failures are counted and an open breaker fails fast."""
+        import asyncio
+        from pybreaker import CircuitBreakerError
+        from tenacity import stop_after_attempt
+        from backend import _acall_llm_with_retry, circuit_breaker
+
+        mock_bucket.take.return_value = True
+        call = _acall_llm_with_retry.retry_with(stop=stop_after_attempt(1))
+        circuit_breaker.close()
+
+        try:
+            with patch(
+                "backend.acompletion", side_effect=ConnectionError("down")
+            ) as mock_ac:
+                for _ in range(circuit_breaker.fail_max - 1):
+                    with pytest.raises(ConnectionError):
+                        asyncio.run(call("m", "k", "b", [], 0.5, 30))
+                with pytest.raises(CircuitBreakerError):
+                    asyncio.run(call("m", "k", "b", [], 0.5, 30))
+                assert circuit_breaker.current_state == "open"
+
+                with pytest.raises(CircuitBreakerError):
+                    asyncio.run(call("m", "k", "b", [], 0.5, 30))
+                assert mock_ac.call_count == circuit_breaker.fail_max
+        finally:
+            circuit_breaker.close()
+
 
 class TestConfigValidation:
     """Test configuration validation."""
@@ -265,6 +426,21 @@ class TestConfigValidation:
         problems = _validate_env()
         assert any("provider" in p.lower() for p in problems)
 
+    @patch("backend.API_KEY", "sk-valid-key")
+    @patch("backend.API_BASE", "https://api.example.com")
+    @patch("backend.MODEL_NAME", "openai/gpt-4")
+    def test_env_error_is_memoized(self):
+        """Test config validation result is cached per configuration."""
+        from backend import _env_error, _cached_env_error
+
+        assert _env_error() is None
+        hits_before = _cached_env_error.cache_info().hits
+        assert _env_error() is None
+        assert _cached_env_error.cache_info().hits == hits_before + 1
+
+        with patch("backend.API_KEY", None):
+            assert "Configuration error" in _env_error()
+
 
 class TestAlertingSystem:
     """Test alerting system functionality."""
@@ -310,6 +486,76 @@ class TestAlertingSystem:
         assert p95 is not None
         assert 9.0 <= p95 <= 10.0  # p95 should be around 9.5s
 
+    def test_metrics_analyzer_summary_matches_individual_calculations(self):
+        """Test the single-pass summary agrees with the per-metric methods."""
+        from monitoring.alerts import MetricsAnalyzer
+
+        test_metrics = [
+            {
+                "success": i % 4 != 0,
+                "duration_seconds": i * 0.1,
+                "cost_usd": 0.001,
+                "timestamp": f"2026-01-01T00:{i:02d}:00",
+            }
+            for i in range(1, 41)
+        ]
+
+        analyzer = MetricsAnalyzer()
+        analyzer.metrics = test_metrics
+        stats = analyzer.summary()
+
+        assert stats["total_requests"] == 40
+        assert stats["successful_requests"] == 30
+        assert stats["error_rate"] == analyzer.calculate_error_rate()
+        assert stats["p95_latency"] == analyzer.calculate_p95_latency()
+        assert abs(stats["hourly_cost"] - analyzer.calculate_hourly_cost()) < 1e-12
+        assert stats["recent_errors"] == analyzer.get_recent_errors()
+
+    def test_metrics_analyzer_loads_only_recent_window(self, tmp_path):
+        """Test recent metrics are read newest-first and stop past the cutoff."""
+        from datetime import timedelta
+        from monitoring import alerts
+
+        now = datetime.utcnow()
+        records = [
+            {
+                "request_id": "ancient",
+                "timestamp": (now - timedelta(days=2)).isoformat(),
+            },
+            {"request_id": "old", "timestamp": (now - timedelta(hours=3)).isoformat()},
+            {
+                "request_id": "recent-1",
+                "timestamp": (now - timedelta(minutes=30)).isoformat(),
+            },
+            {"request_id": "recent-2", "timestamp": now.isoformat()},
+        ]
+        metrics_file = tmp_path / "requests.jsonl"
+        metrics_file.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+        with patch.object(alerts, "METRICS_FILE", metrics_file):
+            analyzer = alerts.MetricsAnalyzer(lookback_hours=1)
+
+        assert [m["request_id"] for m in analyzer.metrics] == ["recent-1", "recent-2"]
+
+    def test_metrics_analyzer_skips_partial_trailing_line(self, tmp_path):
+        """Test a record still being written does not discard the rows before it."""
+        from monitoring import alerts
+
+        now = datetime.utcnow().isoformat()
+        rows = [{"request_id": f"req-{i}", "timestamp": now} for i in range(20)]
+        metrics_file = tmp_path / "requests.jsonl"
+        metrics_file.write_text(
+            "".join(json.dumps(r) + "\n" for r in rows)
+            + '{"request_id": "req-20", "timest'
+        )
+
+        with patch.object(alerts, "METRICS_FILE", metrics_file):
+            analyzer = alerts.MetricsAnalyzer(lookback_hours=1)
+
+        assert [m["request_id"] for m in analyzer.metrics] == [
+            r["request_id"] for r in rows
+        ]
+
     def test_alert_cooldown(self):
         """Test alert cooldown mechanism."""
         from monitoring.alerts import AlertSender
@@ -322,11 +568,96 @@ class TestAlertingSystem:
         # Mark alert as sent
         from monitoring.alerts import last_alert_times
 
-        last_alert_times["test_alert"] = datetime.utcnow()
+        last_alert_times["test_alert"] = time.monotonic()
 
         # Second immediate alert should be blocked
         assert sender.can_send_alert("test_alert") is False
 
+    @patch("monitoring.alerts.EMAIL_CONFIGURED", True)
+    @patch("monitoring.alerts.SLACK_CONFIGURED", True)
+    @patch("monitoring.alerts.AlertSender.send_slack", return_value=True)
+    @patch("monitoring.alerts.AlertSender.send_email", return_value=False)
+    @patch("monitoring.alerts.MetricsAnalyzer.summary")
+    def test_check_and_alert_fills_templates(
+        self, mock_summary, mock_email, mock_slack
+    ):
+        """Test breached thresholds produce filled alert messages."""
+        from monitoring import alerts
+
+        mock_summary.return_value = {
+            "total_requests": 20,
+            "successful_requests": 10,
+            "error_rate": 50.0,
+            "p95_latency": 9.0,
+            "hourly_cost": 5.0,
+            "recent_errors": [
+                {
+                    "timestamp": "2026-01-01T00:00:00",
+                    "error_type": "Timeout",
+                    "error_message": "slow",
+                }
+            ],
+        }
+
+        with patch.dict(alerts.last_alert_times, clear=True):
+            result = alerts.check_and_alert()
+
+        assert result["alerts_sent"] == ["high_error_rate", "high_latency", "high_cost"]
+        # All alerts due in one tick go out as a single email and a single Slack post
+        assert mock_email.call_count == 1
+        assert mock_slack.call_count == 1
+        slack_text = "\n".join(c.args[0] for c in mock_slack.call_args_list)
+        assert "High Error Rate: 50.0%" in slack_text
+        assert "Timeout - slow" in slack_text
+        assert "p95=9.00s" in slack_text
+        assert "Projected monthly: $3600.00" in slack_text
+
+    @patch("monitoring.alerts.EMAIL_CONFIGURED", False)
+    @patch("monitoring.alerts.SLACK_CONFIGURED", False)
+    @patch("monitoring.alerts.AlertSender.send_slack")
+    @patch("monitoring.alerts.AlertSender.send_email")
+    @patch("monitoring.alerts.MetricsAnalyzer.summary")
+    def test_check_and_alert_skips_unconfigured_channels(
+        self, mock_summary, mock_email, mock_slack
+    ):
+        """Test no delivery is attempted when no alert channel is configured."""
+        from monitoring import alerts
+
+        mock_summary.return_value = {
+            "total_requests": 20,
+            "successful_requests": 20,
+            "error_rate": 0.0,
+            "p95_latency": 9.0,
+            "hourly_cost": 0.0,
+            "recent_errors": [],
+        }
+
+        with patch.dict(alerts.last_alert_times, clear=True):
+            result = alerts.check_and_alert()
+
+        assert result["alerts_sent"] == []
+        mock_email.assert_not_called()
+        mock_slack.assert_not_called()
+
+    @patch("monitoring.alerts.EMAIL_CONFIGURED", True)
+    @patch("monitoring.alerts.ALERT_EMAIL_TO", "ops@example.com")
+    @patch("monitoring.alerts.SMTP_PASSWORD", "secret")
+    @patch("monitoring.alerts.SMTP_USER", "bot@example.com")
+    @patch("smtplib.SMTP")
+    def test_alert_sender_reuses_smtp_session(self, mock_smtp):
+        """Test several emails in one sender block share one SMTP login."""
+        from monitoring.alerts import AlertSender
+
+        with AlertSender() as sender:
+            assert sender.send_email("Error rate", "<p>high</p>") is True
+            assert sender.send_email("Latency", "<p>slow</p>") is True
+
+        server = mock_smtp.return_value
+        assert mock_smtp.call_count == 1
+        assert server.login.call_count == 1
+        assert server.send_message.call_count == 2
+        server.quit.assert_called_once()
+
 
 class TestDashboard:
     """Test dashboard functionality."""
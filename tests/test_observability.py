@@ -169,6 +169,90 @@ class TestSecretMasking:
             assert "sk-test-secret-key-12345" not in call_args
             assert "***REDACTED***" in call_args or "sk-" not in call_args
 
+    def test_litellm_failure_logger_masks_every_key(self):
+        """Test that all keys in an error message are masked"""
+        from backend import litellm_failure_logger
+        import logging
+
+        mock_error = Exception(
+            "Tried sk-first-secret-key-abcdef then sk-second_secret_key_123456"
+        )
+
+        with patch.object(logging.getLogger("backend"), "error") as mock_log:
+            litellm_failure_logger({"model": "test/model"}, mock_error, 0, 1)
+
+            call_args = str(mock_log.call_args)
+            assert "first-secret" not in call_args
+            assert "second_secret" not in call_args
+            assert call_args.count("sk-***REDACTED***") == 2
+
+    def test_litellm_success_logger_skips_work_when_info_disabled(self):
+        """Test the success logger does not build or redact a record above INFO"""
+        from backend import litellm_success_logger
+        import logging
+
+        backend_logger = logging.getLogger("backend")
+        with (
+            patch.object(backend_logger, "isEnabledFor", return_value=False),
+            patch("backend._redact") as mock_redact,
+            patch.object(backend_logger, "info") as mock_info,
+        ):
+            litellm_success_logger({"model": "test/model"}, Mock(), 0, 1)
+
+        mock_redact.assert_not_called()
+        mock_info.assert_not_called()
+
+
+class TestPIIRedaction:
+    """Test PII redaction applied to logged content"""
+
+    def test_redacts_email_phone_and_token(self):
+        """Test common PII patterns are replaced"""
+        from backend import redact_pii
+
+        text = (
+            "Mail jane.doe@example.com or call 555-123-4567, "
+            "key sk-abcdefghijklmnopqrstuvwx"
+        )
+        redacted = redact_pii(text)
+
+        assert "[EMAIL_REDACTED]" in redacted
+        assert "[PHONE_REDACTED]" in redacted
+        assert "[TOKEN_REDACTED]" in redacted
+        assert "example.com" not in redacted
+
+    def test_redacts_ssn_and_credit_card(self):
+        """Test each pattern keeps its own replacement label"""
+        from backend import redact_pii
+
+        redacted = redact_pii("SSN 123-45-6789, card 4111 1111 1111 1111")
+
+        assert redacted == "SSN [SSN_REDACTED], card [CC_REDACTED]"
+
+    def test_token_redaction_requires_length_and_boundaries(self):
+        """Test only word-bounded keys with 20+ characters are redacted"""
+        from backend import redact_pii
+
+        key = "pk-" + "a1" * 10
+        assert redact_pii(f"use {key}.") == "use [TOKEN_REDACTED]."
+        assert redact_pii("sk-short-key") == "sk-short-key"
+        assert redact_pii(f"x{key}") == f"x{key}"
+        assert redact_pii(f"{key}_suffix") == f"{key}_suffix"
+
+    def test_email_tld_does_not_match_pipe(self):
+        """Test a pipe in the TLD position is not treated as a letter"""
+        from backend import redact_pii
+
+        assert redact_pii("user@host.a|b done") == "user@host.a|b done"
+
+    def test_plain_text_unchanged(self):
+        """Test text without PII is returned as-is"""
+        from backend import redact_pii
+
+        text = "Python is a high-level programming language."
+        assert redact_pii(text) == text
+        assert redact_pii(text, redact_enabled=False) == text
+
 
 class TestMetricsLogging:
     """Test JSONL metrics logging"""
@@ -182,7 +266,7 @@ class TestMetricsLogging:
 
     def test_log_metrics_writes_jsonl(self):
         """Test that metrics are written as valid JSONL"""
-        from backend import _log_metrics, METRICS_FILE
+        from backend import _log_metrics, flush_metrics, METRICS_FILE
 
         # Create test metric
         test_metric = {
@@ -192,8 +276,9 @@ class TestMetricsLogging:
             "success": True,
         }
 
-        # Log it
+        # Log it and wait for the background writer
         _log_metrics(test_metric)
+        flush_metrics()
 
         # Verify it was written
         assert METRICS_FILE.exists()
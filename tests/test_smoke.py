@@ -97,6 +97,15 @@ class TestBackendFunctions:
         assert isinstance(prompt, str)
         assert len(prompt) > 0
 
+    def test_load_system_prompt_is_cached(self):
+        """Test system prompt file is read once and then served from cache"""
+        from backend import load_system_prompt
+
+        load_system_prompt()
+        hits_before = load_system_prompt.cache_info().hits
+        assert load_system_prompt() is load_system_prompt()
+        assert load_system_prompt.cache_info().hits >= hits_before + 2
+
     def test_get_secret_fallback(self):
         """Test secret retrieval with fallback"""
         from backend import _get_secret
@@ -149,19 +158,18 @@ class TestEnvironmentConfiguration:
         else:
             os.environ.pop("ENVIRONMENT", None)
 
-    def test_default_environment(self):
-        """Test default environment is 'development'"""
-        from backend import _get_trace_metadata
+    def test_default_environment(self, monkeypatch):
+        """Test trace metadata uses the ENVIRONMENT resolved at import"""
+        import backend
 
-        # Clear ENVIRONMENT if set
-        old_env = os.environ.pop("ENVIRONMENT", None)
+        # Read once at module load, so later changes to the variable are ignored
+        monkeypatch.delenv("ENVIRONMENT", raising=False)
 
-        metadata = _get_trace_metadata("test-id")
-        assert metadata["environment"] == "development"
+        metadata = backend._get_trace_metadata("test-id")
+        assert metadata["environment"] == backend.ENVIRONMENT
 
-        # Restore
-        if old_env:
-            os.environ["ENVIRONMENT"] = old_env
+        monkeypatch.setattr(backend, "ENVIRONMENT", "development")
+        assert backend._get_trace_metadata("test-id")["environment"] == "development"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+"""
+Static UI assets for the chat page (CSS and header HTML)
+Cached as process-wide singletons so reruns reuse the same strings
+"""
+
+import streamlit as st
+
+CUSTOM_CSS = """
+<style>
+/* Layout & typography */
+.main .block-container { padding-top: 1.6rem; padding-bottom: 2rem; max-width: 820px; }
+h1, h2, h3 { letter-spacing: .2px; }
+
+/* Header badge */
+.header-wrap { display:flex; justify-content:space-between; align-items:center; }
+.header-badge {
+  display:inline-block; padding:4px 10px; border-radius:999px; font-size:.78rem;
+  background:linear-gradient(135deg, rgba(59,130,246,.12), rgba(16,185,129,.12));
+  color: var(--text-color, #444); border:1px solid rgba(0,0,0,0.06);
+}
+
+/* Chat bubbles */
+.chat-bubble {
+  padding:.9rem 1rem; border-radius:14px; margin-bottom:.6rem; line-height:1.55;
+  border:1px solid rgba(0,0,0,0.06); word-wrap:break-word;
+}
+.chat-bubble p:last-child { margin-bottom:0; }
+.chat-user {
+  background: rgba(59,130,246,0.08);
+  border-color: rgba(59,130,246,0.14);
+}
+.chat-assistant {
+  background: rgba(16,185,129,0.08);
+  border-color: rgba(16,185,129,0.14);
+}
+
+/* Avatars */
+.avatar {
+  width:28px; height:28px; border-radius:50%; display:inline-block; margin-right:8px;
+  vertical-align:middle; background-size:cover; background-position:center;
+  box-shadow: 0 0 0 1px rgba(0,0,0,.06) inset;
+}
+.user-avatar { background-image:url('https://avatars.githubusercontent.com/u/9919?s=40&v=4'); }
+.bot-avatar { background-image:url('https://raw.githubusercontent.com/simple-icons/simple-icons/develop/icons/googlecloud.svg'); background-color:#ffffff; }
+
+/* Message row */
+.msg-row { display:flex; gap:10px; align-items:flex-start; margin: 8px 0 14px 0; }
+.msg-content { flex:1; }
+
+/* Footer */
+.footer {
+  margin-top: 28px; padding-top: 12px; font-size: .85rem; opacity: .75;
+  border-top: 1px dashed rgba(0,0,0,0.1); text-align: center;
+}
+
+/* Code blocks within bubbles */
+.chat-bubble pre { border-radius:10px !important; border:1px solid rgba(0,0,0,0.08) !important; }
+
+/* Divider subtle */
+hr { opacity: .5; }
+</style>
+"""
+
+HEADER_BADGE_HTML = '<div class="header-badge">Streamlit UI • LiteLLM • Gemini</div>'
+
+
+@st.cache_resource
+def get_css() -> str:
+    """Return the scoped CSS block for the chat page."""
+    return CUSTOM_CSS
+
+
+@st.cache_resource
+def get_header_badge() -> str:
+    """Return the header badge HTML."""
+    return HEADER_BADGE_HTML
@@ -58,11 +58,10 @@ def check_dependencies():
 
 
 def check_phase1_dependencies():
-    """Check Phase 1 enhancement packages (Prometheus, circuit breaker, rate limiting)"""
+    """Check Phase 1 enhancement packages (Prometheus, circuit breaker)"""
     phase1_packages = {
         "prometheus_client": "Prometheus metrics exporter",
         "pybreaker": "Circuit breaker pattern",
-        "ratelimit": "Rate limiting",
     }
 
     print("\n📦 Phase 1 Enhancement Packages (optional):")
@@ -78,7 +77,7 @@ def check_phase1_dependencies():
 
     if not all_installed:
         print("\nℹ️  Phase 1 packages are optional. Install with:")
-        print("   pip install prometheus-client pybreaker ratelimit")
+        print("   pip install prometheus-client pybreaker")
 
     return True  # Don't fail for optional packages
 